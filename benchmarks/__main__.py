@@ -0,0 +1,38 @@
+"""match engineのbenchmarkを実行し，結果をJSONで出力します．
+
+Examples:
+    $ python -m benchmarks --output bench.json
+    $ python -m benchmarks --filter lookfor --compare bench.json
+"""
+import argparse
+import json
+import sys
+
+from benchmarks.match_engine import cases
+from benchmarks.runner import compare, run
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="match engine benchmarks")
+    parser.add_argument("--output", "-o", default=None, help="write the JSON report to this file")
+    parser.add_argument("--filter", "-k", default=None, help="run only cases whose name contains this string")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--compare", default=None, help="previous JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    selected = [case for case in cases() if args.filter is None or args.filter in case.key]
+    report = run(selected, repeat=args.repeat, log=lambda line: print(line, file=sys.stderr))
+    if args.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        for key, before, after, ratio in compare(previous, report):
+            print(f"{key:<48} {before:>14,.0f} -> {after:>14,.0f} ops/s  x{ratio:.2f}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
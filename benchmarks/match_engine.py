@@ -0,0 +1,142 @@
+"""`millionaire.libs.match`のhot pathのbenchmark caseです．
+
+手札の枚数は，5枚(終盤)，14枚(4人戦の配布直後)，27枚(2人戦)，54枚(全て)を使用します．
+1つの手札は同じカードを2枚持てないため，複数デッキ分の計測は文字列からの変換(`Card.from_str`)で行います．
+"""
+from __future__ import annotations
+
+import random
+from uuid import uuid4
+
+from millionaire.libs.match.card import CARDS, Card
+from millionaire.libs.match.cards import Cards
+from benchmarks.runner import Case
+
+HAND_SIZES = (5, 14, 27, 54)
+DECKS = (1, 2, 4)
+PLAYERS = (2, 4, 6)
+SEED = 20230701
+
+
+def deal(size: int, seed: int = SEED) -> Cards:
+    """`size`枚の手札を再現可能な乱数で作成します．"""
+    return Cards(random.Random(seed).sample(CARDS, size))
+
+
+def deck_strings(decks: int) -> list[str]:
+    strings = [str(card) for card in CARDS] * decks
+    random.Random(SEED).shuffle(strings)
+    return strings
+
+
+def bench_from_str(decks: int):
+    strings = deck_strings(decks)
+    from_str = Card.from_str
+
+    def run():
+        for string in strings:
+            from_str(string)
+    return run
+
+
+def bench_setitem_delitem(size: int):
+    hand = deal(size)
+    # 手札にない1枚(54枚の場合は1枚抜いてから戻す)
+    outside = [card for card in CARDS if card not in hand]
+    if not outside:
+        card = hand[len(hand) // 2]
+        del hand[str(card)]
+    else:
+        card = outside[0]
+    key = str(card)
+
+    def run():
+        hand[key] = card
+        del hand[key]
+    return run
+
+
+def bench_add(size: int):
+    left = deal(size)
+    right = deal(min(size, 54 - size) or 1, SEED + 1)
+
+    def run():
+        return left + right
+    return run
+
+
+def bench_sub(size: int):
+    hand = deal(size)
+    played = hand[: max(1, size // 4)]
+
+    def run():
+        return hand - played
+    return run
+
+
+def bench_slice(size: int):
+    hand = deal(size)
+    stop = max(1, size // 2)
+
+    def run():
+        return hand[1:stop]
+    return run
+
+
+def bench_lookfor(method: str, size: int, with_field: bool):
+    hand = deal(size)
+    lookfor = getattr(hand, f"lookfor_{method}")
+    field = None
+    if with_field:
+        weakest = {
+            "one": lambda: hand[0],
+            "sequence": lambda: Cards.from_list_str(["sp3", "sp4", "sp5"]),
+            "equal": lambda: Cards.from_list_str(["sp3", "cl3"]),
+        }
+        field = weakest[method]()
+
+    def run():
+        return lookfor(field)
+    return run
+
+
+def bench_create_cards(players: int):
+    def run():
+        return Cards.create_cards(player_num=players)
+    return run
+
+
+def bench_distribute_cards(players: int):
+    from millionaire.libs.match.play import Play
+    from millionaire.libs.match.player import Player
+    from millionaire.libs.match.settings import Settings
+
+    uids = [uuid4() for _ in range(players)]
+    settings = Settings()
+
+    def run():
+        play = Play([Player(uid=uid, name=str(i)) for i, uid in enumerate(uids)], settings)
+        play.distribute_cards()
+    return run
+
+
+def cases() -> list[Case]:
+    result: list[Case] = []
+    result += [Case("Card.from_str", lambda d=d: bench_from_str(d), {"decks": d}) for d in DECKS]
+    for size in HAND_SIZES:
+        params = {"hand": size}
+        result += [
+            Case("Cards.__setitem__+__delitem__", lambda s=size: bench_setitem_delitem(s), params),
+            Case("Cards.__add__", lambda s=size: bench_add(s), params),
+            Case("Cards.__sub__", lambda s=size: bench_sub(s), params),
+            Case("Cards.__getitem__[slice]", lambda s=size: bench_slice(s), params),
+        ]
+        for method in ("one", "sequence", "equal"):
+            for with_field in (False, True):
+                result.append(Case(f"Cards.lookfor_{method}",
+                                   lambda m=method, s=size, f=with_field: bench_lookfor(m, s, f),
+                                   {"hand": size, "field": with_field}))
+    result += [Case("Cards.create_cards", lambda p=p: bench_create_cards(p), {"players": p}) for p in PLAYERS]
+    result += [Case("Play.distribute_cards", lambda p=p: bench_distribute_cards(p), {"players": p})
+               for p in PLAYERS]
+    return result
@@ -0,0 +1,102 @@
+"""benchmarkの計測と結果の比較を行います．
+
+1つのcaseは，引数なしの関数(計測対象)を返すsetup関数です．
+計測は`timeit.Timer.autorange`で回数を決め，`repeat`回のうち最速の結果を採用します．
+allocationは`tracemalloc`で1回あたりのpeak(一時的に確保したbyte数)と，
+`sys.getallocatedblocks`の増分(解放されずに残ったblock数)を計測します．
+"""
+from __future__ import annotations
+
+import gc
+import platform
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+Setup = Callable[[], Callable[[], Any]]
+
+
+@dataclass
+class Case:
+    name: str
+    setup: Setup
+    params: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def key(self) -> str:
+        if not self.params:
+            return self.name
+        return self.name + "[" + ",".join(f"{k}={v}" for k, v in self.params.items()) + "]"
+
+
+def measure(case: Case, repeat: int = 5, alloc_iterations: int = 100) -> dict[str, Any]:
+    func = case.setup()
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    func = case.setup()
+    gc.collect()
+    tracemalloc.start()
+    peak = 0
+    blocks = sys.getallocatedblocks()
+    for _ in range(alloc_iterations):
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+    blocks = sys.getallocatedblocks() - blocks
+    tracemalloc.stop()
+    return {
+        "name": case.name,
+        "key": case.key,
+        "params": case.params,
+        "iterations": number,
+        "ns_per_op": best * 1e9,
+        "ops_per_sec": 1 / best,
+        "peak_bytes_per_op": peak,
+        "net_blocks_per_op": blocks / alloc_iterations,
+    }
+
+
+def metadata() -> dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version,
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "commit": commit,
+    }
+
+
+def run(cases: list[Case], repeat: int = 5, log: Callable[[str], Any] | None = None) -> dict[str, Any]:
+    results = []
+    for case in cases:
+        result = measure(case, repeat=repeat)
+        if log is not None:
+            log(f"{result['key']:<48} {result['ops_per_sec']:>14,.0f} ops/s "
+                f"{result['peak_bytes_per_op']:>8} B peak")
+        results.append(result)
+    return {"meta": metadata(), "results": results}
+
+
+def compare(old: dict[str, Any], new: dict[str, Any]) -> list[tuple[str, float, float, float]]:
+    """同じkeyのcaseについて (key, 旧ops/sec, 新ops/sec, 新/旧) を返します．"""
+    before = {result["key"]: result for result in old["results"]}
+    rows = []
+    for result in new["results"]:
+        prev = before.get(result["key"])
+        if prev is None:
+            continue
+        rows.append((result["key"], prev["ops_per_sec"], result["ops_per_sec"],
+                     result["ops_per_sec"] / prev["ops_per_sec"]))
+    return rows
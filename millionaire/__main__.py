@@ -1,4 +1,4 @@
-﻿import asyncio
+﻿import os
 from uuid import UUID
 
 from fastapi import Cookie, Depends, FastAPI, Header, Query, Response, Request
@@ -9,6 +9,9 @@ from starlette.responses import HTMLResponse, FileResponse, RedirectResponse, JS
 from starlette.websockets import WebSocket
 import logging
 
+from millionaire.db.session import SessionLocal, init_db
+from millionaire.libs.match.bot import shutdown_executor
+from millionaire.libs.queue.batch_writer import BatchWriter
 from millionaire.libs.room.baseroom import Room
 from millionaire.libs.room.rooms_manager import RoomManager
 from millionaire.ws.message_broker import MessageBroker
@@ -63,7 +66,23 @@ async def get_cookie_or_token(
 room: dict[UUID, Room] = dict()
 user_to_room: dict[UUID, UUID] = dict()
 # room_cmd_que = asyncio.Queue()
-out_msg_que: asyncio.Queue = asyncio.Queue()
-room_manager = RoomManager(user_to_room=user_to_room, room=room, out_msg_que=out_msg_que)
-connections = MessageBroker(room_manager=room_manager, user_to_room=user_to_room, room=room, out_msg_que=out_msg_que)
+history_writer = BatchWriter(SessionLocal)
+room_manager = RoomManager(user_to_room=user_to_room, room=room, history_writer=history_writer,
+                           match_log_dir=os.getenv("MILLIONAIRE_MATCH_LOG_DIR"))
+connections = MessageBroker(room_manager=room_manager, user_to_room=user_to_room, room=room)
 app.add_api_websocket_route("/ws", connections)
+
+
+@app.on_event("startup")
+async def startup():
+    room_manager.start()
+    init_db()
+    history_writer.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await connections.close()
+    await room_manager.close()
+    await history_writer.close()
+    shutdown_executor()
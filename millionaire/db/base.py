@@ -0,0 +1,3 @@
+# create_allやAlembicの前に，全てのmodelを`Base.metadata`に登録するためimportします．
+from millionaire.db.base_class import Base  # noqa: F401
+from millionaire.models.history import History  # noqa: F401
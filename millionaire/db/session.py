@@ -0,0 +1,22 @@
+import os
+
+from sqlalchemy import Engine, create_engine
+from sqlalchemy.orm import sessionmaker
+
+SQLALCHEMY_DATABASE_URL = os.getenv("MILLIONAIRE_DATABASE_URL", "sqlite:///./millionaire.db")
+
+
+def create_db_engine(url: str = SQLALCHEMY_DATABASE_URL) -> Engine:
+    """connection poolを持つengineを作成します．SQLiteの場合は別threadから使えるようにします．"""
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    return create_engine(url, pool_pre_ping=True, connect_args=connect_args)
+
+
+engine = create_db_engine()
+SessionLocal = sessionmaker(autoflush=False, bind=engine)
+
+
+def init_db(bind: Engine = engine):
+    """全てのtableを作成します．"""
+    from millionaire.db.base import Base
+    Base.metadata.create_all(bind=bind)
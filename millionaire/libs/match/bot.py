@@ -0,0 +1,285 @@
+"""Information Set Monte Carlo Tree Search (SO-ISMCTS) によるbotです．
+
+botは自分の手札と公開情報(場，パス，各座席の枚数，出されたカード)だけを使用します．
+探索のたびに，見えていないカード(`InfoSet.unseen`)を各座席の枚数に合わせてランダムに配り直し(determinization)，
+木の選択はUCB1，末端はランダムなrolloutで評価します．
+末端の合計枚数が`endgame_cards`以下の場合は，rolloutの代わりに`endgame.solve`で読み切った値を使います．
+他の座席の手札が全て分かる終盤では，探索せずに`endgame.best_move`を返します．
+
+探索はCPUを占有するため，`MonteCarloBot.choose_async`はprocess poolで実行し，
+event loop(MatchRoomのcoroutine)を止めません．複数のprocessで独立に探索し，root直下の訪問回数を合計します．
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import random
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from logging import getLogger
+from typing import NamedTuple
+
+from millionaire.libs.match import card_bits, endgame
+from millionaire.libs.match.endgame import ENDGAME_CARDS, SearchLimitExceeded, payoff
+from millionaire.libs.match.moves import Move
+from millionaire.libs.match.rules import STANDARD, Rules
+from millionaire.libs.match.state import PlayState, apply_move, legal_moves
+
+logger = getLogger(__name__)
+
+PASS_KEY = 0
+UCB_C = 0.7
+ROLLOUT_PASS_RATE = 0.2
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """同じprocess内の全ての`MonteCarloBot`で共有するprocess poolを返します．"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor()
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+class InfoSet(NamedTuple):
+    """1つの座席から見える情報です．他の座席の手札は枚数と，全員分を合わせた`unseen`だけを持ちます．"""
+    seat: int
+    hand: int
+    counts: tuple[int, ...]
+    unseen: int
+    field: int
+    owner: int
+    passed: int
+    turn: int
+    ranking: tuple[int, ...]
+    revolution: bool = False
+    lock: int = 0
+
+    @classmethod
+    def observe(cls, state: PlayState, seat: int) -> InfoSet:
+        unseen = 0
+        for other, hand in enumerate(state.hands):
+            if other != seat:
+                unseen = card_bits.union(unseen, hand)
+        return cls(seat, state.hands[seat], tuple(hand.bit_count() for hand in state.hands), unseen,
+                   state.field, state.owner, state.passed, state.turn, state.ranking, state.revolution, state.lock)
+
+    def determinize(self, rng: random.Random) -> PlayState:
+        """見えていないカードを各座席の枚数に合わせて配り直した`PlayState`を返します．"""
+        ids = list(card_bits.iter_ids(self.unseen))
+        rng.shuffle(ids)
+        hands = []
+        pos = 0
+        for other, count in enumerate(self.counts):
+            if other == self.seat:
+                hands.append(self.hand)
+                continue
+            mask = 0
+            for cid in ids[pos:pos + count]:
+                mask = card_bits.add_id(mask, cid)
+            pos += count
+            hands.append(mask)
+        return PlayState(tuple(hands), self.field, self.owner, self.passed, self.turn, self.ranking,
+                         self.revolution, self.lock)
+
+
+def _key(move: Move | None) -> int:
+    return PASS_KEY if move is None else move.mask
+
+
+def rollout(state: PlayState, rng: random.Random, rules: Rules = STANDARD) -> tuple[int, ...]:
+    """試合終了までランダムに進め，順位を返します．"""
+    while not state.is_over:
+        field = state.field_move
+        candidates = list(rules.iter_moves(state.hands[state.turn], field, state.revolution, state.lock))
+        if not candidates or (field is not None and rng.random() < ROLLOUT_PASS_RATE):
+            move = None
+        else:
+            move = rng.choice(candidates)
+        state, _ = apply_move(state, move, rules)
+    return state.ranking
+
+
+class _Node:
+    __slots__ = ("move", "seat", "parent", "children", "visits", "reward", "avail")
+
+    def __init__(self, move: Move | None = None, seat: int = -1, parent: _Node | None = None):
+        self.move = move
+        self.seat = seat
+        self.parent = parent
+        self.children: dict[int, _Node] = {}
+        self.visits = 0
+        self.reward = 0.0
+        self.avail = 1
+
+    def ucb(self) -> float:
+        return self.reward / self.visits + UCB_C * math.sqrt(math.log(self.avail) / self.visits)
+
+
+def evaluate(state: PlayState, rng: random.Random, endgame_cards: int = ENDGAME_CARDS,
+             rules: Rules = STANDARD) -> tuple[float, ...]:
+    """末端の局面を座席ごとの報酬で評価します．"""
+    if state.is_over:
+        return payoff(state.ranking)
+    if endgame.is_endgame(state, endgame_cards):
+        try:
+            return endgame.solve(state, rules)
+        except SearchLimitExceeded:
+            pass
+    return payoff(rollout(state, rng, rules))
+
+
+def search(info: InfoSet, time_budget: float | None = None, rollouts: int | None = None,
+           seed: int | None = None, endgame_cards: int = ENDGAME_CARDS, rules: Rules = STANDARD) -> dict[int, int]:
+    """ISMCTSを実行し，root直下の手ごとの訪問回数を返します．
+
+    Args:
+        info: 手番の座席の`InfoSet`
+        time_budget: 探索時間の上限(秒)
+        rollouts: rollout回数の上限．`time_budget`と両方Noneの場合は100回
+        seed: 乱数のseed
+        endgame_cards: 末端を読み切る合計枚数
+        rules: 規則
+
+    Returns:
+        dict[int, int]: 手のbitmask(パスは`PASS_KEY`)ごとの訪問回数
+    """
+    if time_budget is None and rollouts is None:
+        rollouts = 100
+    rng = random.Random(seed)
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    root = _Node()
+    done = 0
+    while (rollouts is None or done < rollouts) and (deadline is None or time.perf_counter() < deadline):
+        state = info.determinize(rng)
+        node = root
+        while not state.is_over:
+            legal = list(legal_moves(state, rules))
+            untried = []
+            available = []
+            for move in legal:
+                child = node.children.get(_key(move))
+                if child is None:
+                    untried.append(move)
+                else:
+                    child.avail += 1
+                    available.append(child)
+            if untried:
+                move = rng.choice(untried)
+                node.children[_key(move)] = node = _Node(move, state.turn, node)
+                state, _ = apply_move(state, move, rules)
+                break
+            node = max(available, key=_Node.ucb)
+            state, _ = apply_move(state, node.move, rules)
+        values = evaluate(state, rng, endgame_cards, rules)
+        while node is not root:
+            node.visits += 1
+            node.reward += values[node.seat]
+            node = node.parent
+        done += 1
+    return {key: child.visits for key, child in root.children.items()}
+
+
+class MonteCarloBot:
+    """ISMCTSで手を選ぶbotです．
+
+    Args:
+        time_budget: 1手あたりの探索時間(秒)
+        rollouts: 1processあたりのrollout回数の上限．Noneの場合は`time_budget`のみで打ち切ります．
+        workers: 並列に探索するprocess数
+        executor: 探索を実行するexecutor．Noneの場合は`get_executor()`を使用します．
+        grace: `choose_async`で`time_budget`を超えて待つ時間(秒)．超えた場合は最も弱い手を返します．
+        endgame_cards: 終盤の読み切りを使う合計枚数
+        rules: 規則(`Play.rules`)
+        seed: 乱数のseed
+    """
+
+    def __init__(self, time_budget: float | None = 0.05, rollouts: int | None = None, workers: int = 1,
+                 executor: Executor | None = None, grace: float = 0.05, endgame_cards: int = ENDGAME_CARDS,
+                 rules: Rules = STANDARD, seed: int | None = None):
+        self.time_budget = time_budget
+        self.rollouts = rollouts
+        self.workers = workers
+        self.executor = executor
+        self.grace = grace
+        self.endgame_cards = endgame_cards
+        self.rules = rules
+        self.__rng = random.Random(seed)
+
+    @staticmethod
+    def __best(legal: list[Move | None], results: list[dict[int, int]]) -> Move | None:
+        visits: dict[int, int] = {}
+        for result in results:
+            for key, count in result.items():
+                visits[key] = visits.get(key, 0) + count
+        return max(legal, key=lambda move: visits.get(_key(move), 0))
+
+    @staticmethod
+    def fallback(legal: list[Move | None]) -> Move | None:
+        """探索が間に合わない場合の手．最も弱い手を出します．"""
+        return min(legal, key=lambda move: (move is None, move.rank if move else 0))
+
+    def __solvable(self, state: PlayState, seat: int) -> bool:
+        return endgame.is_determined(state, seat) and endgame.is_endgame(state, self.endgame_cards)
+
+    def choose(self, state: PlayState, seat: int) -> Move | None:
+        """このprocessで探索して手を返します．event loop上で呼ばないでください．"""
+        legal = list(legal_moves(state, self.rules))
+        if len(legal) == 1:
+            return legal[0]
+        if self.__solvable(state, seat):
+            try:
+                return endgame.best_move(state, self.rules)
+            except SearchLimitExceeded:
+                logger.debug("endgame search exceeded %d nodes", endgame.MAX_NODES)
+        info = InfoSet.observe(state, seat)
+        results = [search(info, self.time_budget, self.rollouts, self.__rng.getrandbits(32), self.endgame_cards,
+                          self.rules)
+                   for _ in range(self.workers)]
+        return self.__best(legal, results)
+
+    async def choose_async(self, state: PlayState, seat: int) -> Move | None:
+        """process poolで探索して手を返します．`time_budget + grace`を超えた場合は`fallback`を返します．"""
+        legal = list(legal_moves(state, self.rules))
+        if len(legal) == 1:
+            return legal[0]
+        loop = asyncio.get_running_loop()
+        executor = self.executor or get_executor()
+        timeout = None if self.time_budget is None else self.time_budget + self.grace
+        if self.__solvable(state, seat):
+            try:
+                return await asyncio.wait_for(loop.run_in_executor(executor, endgame.best_move, state, self.rules), timeout)
+            except SearchLimitExceeded:
+                logger.debug("endgame search exceeded %d nodes", endgame.MAX_NODES)
+            except asyncio.TimeoutError:
+                logger.warning("endgame search exceeded %ss, fallback to the weakest move", timeout)
+                return self.fallback(legal)
+        info = InfoSet.observe(state, seat)
+        futures = [loop.run_in_executor(executor, search, info, self.time_budget, self.rollouts,
+                                        self.__rng.getrandbits(32), self.endgame_cards, self.rules)
+                   for _ in range(self.workers)]
+        try:
+            results = await asyncio.wait_for(asyncio.gather(*futures), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("bot search exceeded %ss, fallback to the weakest move", timeout)
+            return self.fallback(legal)
+        return self.__best(legal, results)
+
+
+if __name__ == '__main__':
+    from millionaire.libs.match.cards import Cards
+
+    play_state = PlayState(hands=tuple(cards.mask for cards in Cards.create_cards(player_num=4)))
+    bot = MonteCarloBot(time_budget=0.2)
+    chosen = bot.choose(play_state, play_state.turn)
+    print(None if chosen is None else Cards.from_move(chosen))
+    print(asyncio.run(bot.choose_async(play_state, play_state.turn)))
+    shutdown_executor()
@@ -1,6 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from types import MappingProxyType
 import re
 
+from millionaire.libs.match import card_bits
 from millionaire.libs.match.card_types import CardSuite, CardNumber
 
 #  TODO: settings.pyに移動予定
@@ -43,6 +45,10 @@ class Card:
     suite: CardSuite
     number: CardNumber
     _strength: int
+    _hash: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "_hash", hash(self.__str__()))
 
     def __str__(self):
         return f"{self.suite.value}{self.number.value}"
@@ -78,11 +84,18 @@ class Card:
         return Card(suite=self.suite, number=self.number, _strength=self._strength + other)
 
     def __hash__(self):
-        return hash(self.__str__())
+        return self._hash
+
+    @property
+    def id(self) -> int:
+        """`card_bits`で定義されるcard idを返します．"""
+        return card_bits.card_id(self.suite, self.number)
 
     @classmethod
     def from_str(cls, string: str):
         """Validate `string` and returns a card class.
+
+        正規のカード(`CARD_BY_STR`)は共有インスタンスを返します．それ以外は従来通り正規表現で検証します．
         Args:
             string (str): The string must be one of "jo", "sp", "cl", "di" and "he", and a number from 0 to 13.
         Returns:
@@ -90,17 +103,73 @@ class Card:
         Raises:
             ValueError: If `string` doesn't match any patterns.
         """
-        if pattern.match(string) is None:
-            print(string)
-            raise ValueError("string doesn't match any patterns")
-        su, num = pattern.match(string).groups()
+        card = CARD_BY_STR.get(string)
+        if card is not None:
+            return card
+        matched = pattern.match(string)
+        if matched is None:
+            raise ValueError(f"string doesn't match any patterns: {string}")
+        su, num = matched.groups()
         return cls(suite=CardSuite(su),
                    number=CardNumber(int(num)),
                    _strength=set_strength(int(num))
                    )
 
+    @staticmethod
+    def from_id(cid: int):
+        """card idに対応する共有インスタンスを返します．"""
+        return CARDS[cid]
+
+
+# card idをindexとする54枚の共有インスタンス. jokerの2枚は同一インスタンスです．
+CARDS: tuple[Card, ...] = tuple(
+    Card(suite=card_bits.INDEX_SUITE[cid & 3],
+         number=card_bits.RANK_NUMBERS[cid >> 2],
+         _strength=set_strength(card_bits.RANK_NUMBERS[cid >> 2].value))
+    for cid in range(card_bits.JOKER_IDS[0])
+) + (Card(suite=CardSuite.JOKER, number=CardNumber.NONE, _strength=MAX_STRENGTH),) * card_bits.JOKER_NUM
+CARD_BY_STR: MappingProxyType[str, Card] = MappingProxyType({str(card): card for card in CARDS})
+CARD_BY_SUITE_NUMBER: MappingProxyType[tuple[CardSuite, CardNumber], Card] = MappingProxyType(
+    {(card.suite, card.number): card for card in CARDS})
+CARD_ID_BY_STR: MappingProxyType[str, int] = MappingProxyType(
+    {string: card_bits.card_id(card.suite, card.number) for string, card in CARD_BY_STR.items()})
+# card idから文字列への変換表
+CARD_STRS: tuple[str, ...] = tuple(str(card) for card in CARDS)
+# 文字列からbitへの変換表．jokerは`JOKER_MASK`です．
+CARD_BIT_BY_STR: MappingProxyType[str, int] = MappingProxyType(
+    {string: card_bits.JOKER_MASK if cid in card_bits.JOKER_IDS else 1 << cid
+     for string, cid in CARD_ID_BY_STR.items()})
+
+
+def decode_mask(strings: list[str]) -> int:
+    """`["sp1", "jo0"]`のような文字列のリストを，`Cards`を作らずにbitmaskへ変換します．
+
+    Raises:
+        ValueError: 正規のカードでない文字列，重複したカード，または`JOKER_NUM`枚を超えるjokerが含まれる場合
+    """
+    mask = 0
+    jokers = 0
+    for string in strings:
+        bit = CARD_BIT_BY_STR.get(string)
+        if bit is None:
+            raise ValueError(f"string doesn't match any cards: {string}")
+        if bit == card_bits.JOKER_MASK:
+            jokers += 1
+        elif mask & bit:
+            raise ValueError(f"duplicated card: {string}")
+        else:
+            mask |= bit
+    if jokers > card_bits.JOKER_NUM:
+        raise ValueError(f"too many jokers: {jokers}")
+    return mask | card_bits.JOKER_FILL[jokers]
+
+
+def encode_mask(mask: int) -> list[str]:
+    """`decode_mask`の逆です．弱い順の文字列のリストを返します．"""
+    return [CARD_STRS[cid] for cid in card_bits.iter_ids(mask)]
+
 
 if __name__ == "__main__":
     print(pattern.match("sp1").groups())
     card = Card.from_str("sp1")
-    print(card)
+    print(card, card.id, Card.from_id(card.id) is card)
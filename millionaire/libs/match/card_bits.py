@@ -0,0 +1,140 @@
+"""手札を54bitの整数(bitmask)として扱うための定数と関数群です．
+
+bitの割り当ては強さ順(rank major)です．
+
+    card_id = rank * 4 + suite_index    (rank: 3=0, 4=1, ..., K=10, A=11, 2=12)
+    joker   = 52, 53
+
+したがって，下位bitから順に走査するとカードが強さ順に得られます．
+jokerは同じ文字列`jo0`で表現されるため，bitは区別せず「枚数」として扱います．
+常に52番から埋めることで(normalize)，包含判定を1回のbit演算で行えます．
+"""
+from __future__ import annotations
+
+from typing import Iterator
+
+from millionaire.libs.match.card_types import CardSuite, CardNumber
+
+RANK_NUM = 13
+JOKER_RANK = RANK_NUM
+JOKER_NUM = 2
+JOKER_IDS = (RANK_NUM * 4, RANK_NUM * 4 + 1)
+CARD_ID_NUM = RANK_NUM * 4 + JOKER_NUM
+
+JOKER_MASK = (1 << JOKER_IDS[0]) | (1 << JOKER_IDS[1])
+NORMAL_MASK = (1 << JOKER_IDS[0]) - 1
+FULL_MASK = (1 << CARD_ID_NUM) - 1
+# joker n枚を表すbitmask
+JOKER_FILL = (0, 1 << JOKER_IDS[0], JOKER_MASK)
+
+SUITE_INDEX: dict[CardSuite, int] = {
+    CardSuite.SPADE: 0,
+    CardSuite.CLOVER: 1,
+    CardSuite.DIAMOND: 2,
+    CardSuite.HEART: 3,
+}
+INDEX_SUITE: tuple[CardSuite, ...] = tuple(SUITE_INDEX)
+
+# index が強さ(rank)
+RANK_NUMBERS: tuple[CardNumber, ...] = tuple(CardNumber(n) for n in (3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 1, 2))
+NUMBER_RANK: dict[CardNumber, int] = {number: rank for rank, number in enumerate(RANK_NUMBERS)}
+
+RANK_MASKS: tuple[int, ...] = tuple(0xF << (rank * 4) for rank in range(RANK_NUM)) + (JOKER_MASK,)
+SUITE_MASKS: dict[CardSuite, int] = {
+    suite: sum(1 << (rank * 4 + idx) for rank in range(RANK_NUM)) for suite, idx in SUITE_INDEX.items()
+}
+SUITE_MASKS[CardSuite.JOKER] = JOKER_MASK
+SUITE_INDEX_MASKS: tuple[int, ...] = tuple(SUITE_MASKS[suite] for suite in INDEX_SUITE)
+NUMBER_MASKS: dict[CardNumber, int] = {number: RANK_MASKS[rank] for number, rank in NUMBER_RANK.items()}
+NUMBER_MASKS[CardNumber.NONE] = JOKER_MASK
+
+
+def card_id(suite: CardSuite, number: CardNumber) -> int:
+    """suiteとnumberからcard idを返します．jokerは常に`JOKER_IDS[0]`です．
+
+    Raises:
+        ValueError: joker以外でnumberが`NONE`の場合
+    """
+    if suite == CardSuite.JOKER:
+        return JOKER_IDS[0]
+    if number == CardNumber.NONE:
+        raise ValueError(f"{suite}{number.value} is not a valid card")
+    return NUMBER_RANK[number] * 4 + SUITE_INDEX[suite]
+
+
+def id_rank(cid: int) -> int:
+    return cid >> 2
+
+
+def normalize(mask: int) -> int:
+    """jokerのbitを52番から詰め直します．"""
+    if mask & JOKER_MASK:
+        return (mask & NORMAL_MASK) | JOKER_FILL[(mask & JOKER_MASK).bit_count()]
+    return mask
+
+
+def add_id(mask: int, cid: int) -> int:
+    """maskにcard idを1枚追加します．jokerは空いているbitに入ります．
+
+    Raises:
+        ValueError: jokerが既に`JOKER_NUM`枚ある場合
+    """
+    if cid >= JOKER_IDS[0]:
+        jokers = (mask & JOKER_MASK).bit_count()
+        if jokers >= JOKER_NUM:
+            raise ValueError(f"cards can't hold more than {JOKER_NUM} jokers")
+        return mask | JOKER_FILL[jokers + 1]
+    return mask | (1 << cid)
+
+
+def remove_id(mask: int, cid: int) -> int:
+    """maskからcard idを1枚取り除きます．
+
+    Raises:
+        KeyError: maskにcard idが含まれない場合
+    """
+    if cid >= JOKER_IDS[0]:
+        jokers = (mask & JOKER_MASK).bit_count()
+        if not jokers:
+            raise KeyError(cid)
+        return (mask & NORMAL_MASK) | JOKER_FILL[jokers - 1]
+    if not mask >> cid & 1:
+        raise KeyError(cid)
+    return mask ^ (1 << cid)
+
+
+def union(a: int, b: int) -> int:
+    """和集合．jokerは枚数を足し合わせます．"""
+    if a & b & JOKER_MASK:
+        jokers = min(JOKER_NUM, (a & JOKER_MASK).bit_count() + (b & JOKER_MASK).bit_count())
+        return ((a | b) & NORMAL_MASK) | JOKER_FILL[jokers]
+    return a | b
+
+
+def difference(a: int, b: int) -> int:
+    """差集合．jokerは枚数を引きます．"""
+    return normalize(a & ~b)
+
+
+def intersection(a: int, b: int) -> int:
+    """積集合．jokerは少ない方の枚数になります．"""
+    return a & b
+
+
+def contains(a: int, b: int) -> bool:
+    """bがaの部分集合であればTrueを返します．a, bはnormalize済みである必要があります．"""
+    return not b & ~a
+
+
+def iter_ids(mask: int) -> Iterator[int]:
+    """maskに含まれるcard idを強さの昇順に返します．"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+if __name__ == '__main__':
+    hand = add_id(add_id(0, card_id(CardSuite.SPADE, CardNumber.TREY)), JOKER_IDS[0])
+    print(bin(hand), list(iter_ids(hand)))
+    print(contains(hand, 1), bin(difference(hand, JOKER_MASK)))
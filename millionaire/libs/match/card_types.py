@@ -35,6 +35,17 @@ class CardSuite(StrEnum):
     HEART = "he"
 
 
+class CardsRegularity(Enum):
+    """define the combination type of `Cards`
+
+    """
+    none = 0
+    one = 1
+    sequence = 2
+    equal = 3
+    empty = 4
+
+
 if __name__ == '__main__':
     suite = CardSuite.CLOVER
     print(suite)
@@ -1,105 +1,158 @@
 from __future__ import annotations
 
-from enum import Enum
+import weakref
 from logging import getLogger
-from random import shuffle
-from copy import copy
+from random import Random, shuffle
+from typing import Any, Callable, Iterator
 
-from millionaire.libs.match.card import Card
-from millionaire.libs.match.card_types import CardSuite, CardNumber
+from millionaire.libs.match import card_bits, moves
+from millionaire.libs.match.card import Card, CARDS, CARD_BY_SUITE_NUMBER, CARD_ID_BY_STR
+from millionaire.libs.match.card_types import CardSuite, CardNumber, CardsRegularity
+from millionaire.libs.match.moves import Move, MoveOrder
 
 logger = getLogger(__name__)
 
 
-class CardsRegularity(Enum):
-    none = 0
-    one = 1
-    sequence = 2
-    equal = 3
-    empty = 4
-
-
 class Cards:
     """このクラスの責任は，複数のCardクラスを保持し，CRUD管理することです．
 
     このクラスは，Cardクラスをvalueに持つ疑似Dictionaryとして動作します．
-    要素は，なるべく高速に要素の抽出を行うために，ソート後のindexとstrをキーとしたdictionaryの両方を保持しています．
-    したがって，探索がO(1)で動作します．が，挿入はindex指定の場合O(1), strをキーとする場合O(n)です．
+    要素は54bitの整数(`card_bits`参照)として保持するため，追加，削除，包含判定，suite/numberでの抽出は
+    いずれも1回のbit演算で行えます．indexによるアクセスのために，ソート済みのcard idの列を必要な時にだけ作成します．
+    bitmask(`_mask`)とcard idの列(`_ids`)はprotectedとし，`CardsView`がpropertyで置き換えます．
+    変更する前に，作成済みの`CardsView`を切り離します(`_views`)．
     Args:
         cards(list[Card] | None): a list of Card class, otherwise, initialize empty list.
     """
 
+    __slots__ = ("_mask", "_ids", "_regularity", "_views", "__weakref__")
+
     def __init__(self, cards: list[Card] = None, _regularity: CardsRegularity = CardsRegularity.none):
-        if cards is None:
-            cards = []
-        self.__cards = {str(card): card for card in cards}
-        self.__idx = [str(card) for card in sorted(cards)]
+        mask = 0
+        if cards is not None:
+            for card in cards:
+                mask = card_bits.add_id(mask, card.id)
+        self._mask = mask
+        self._ids: tuple[int, ...] | None = None
         self._regularity = _regularity
+        self._views: list[weakref.ref[CardsView]] | None = None
 
-    def __iter__(self):
-        self.__iter = self.__cards.values().__iter__()
-        return self.__iter
+    @classmethod
+    def from_mask(cls, mask: int, _regularity: CardsRegularity = CardsRegularity.none) -> Cards:
+        """bitmaskから`Cards`を作成します．"""
+        cards = cls.__new__(cls)
+        cards._mask = card_bits.normalize(mask)
+        cards._ids = None
+        cards._regularity = _regularity
+        cards._views = None
+        return cards
 
-    def __next__(self):
-        return next(self.__iter)
+    @classmethod
+    def from_list_str(cls, strings: list[str], _regularity: CardsRegularity = CardsRegularity.none) -> Cards:
+        """`["sp1", "he11"]`のような文字列のリストから`Cards`を作成します．
+
+        Raises:
+            ValueError: 正規のカードでない文字列が含まれる場合
+        """
+        mask = 0
+        for string in strings:
+            cid = CARD_ID_BY_STR.get(string)
+            if cid is None:
+                raise ValueError(f"string doesn't match any cards: {string}")
+            mask = card_bits.add_id(mask, cid)
+        return cls.from_mask(mask, _regularity)
+
+    @property
+    def mask(self) -> int:
+        return self._mask
+
+    def __set_mask(self, mask: int):
+        if self._views is not None:
+            self.__detach_views()
+        self._mask = mask
+        self._ids = None
+
+    def __view(self, selection: int) -> CardsView:
+        view = CardsView(self, selection)
+        if self._views is None:
+            self._views = []
+        elif len(self._views) >= 32:
+            self._views = [ref for ref in self._views if ref() is not None]
+        self._views.append(weakref.ref(view))
+        return view
+
+    def __detach_views(self):
+        """作成済みのviewに現在の内容をコピーし，以降の変更が伝わらないようにします．"""
+        for ref in self._views:
+            view = ref()
+            if view is not None:
+                view.detach()
+        self._views = None
+
+    def __index(self) -> tuple[int, ...]:
+        if self._ids is None:
+            self._ids = tuple(card_bits.iter_ids(self._mask))
+        return self._ids
+
+    @staticmethod
+    def __to_id(key: str | Card) -> int:
+        if isinstance(key, str):
+            cid = CARD_ID_BY_STR.get(key)
+            if cid is None:
+                raise KeyError(key)
+            return cid
+        return key.id
+
+    def __iter__(self):
+        return map(CARDS.__getitem__, self.__index())
 
     def __setitem__(self, key: str | int, card: Card):
+        """`card`を追加します．保持する順序は常に強さ順のため，`key`は位置に影響しません．"""
         if not isinstance(card, Card):
             raise ValueError('the value must be `Card`')
-        if isinstance(key, str):
-            self.__cards[key] = card
-            self.__idx.insert(self.__binary_search(card, 0, len(self.__idx)), str(card))
-        elif isinstance(key, int):
-            self.__idx.insert(key, str(card))
-            self.__cards[str(card)] = card
-        else:
+        if not isinstance(key, (str, int)):
             raise KeyError("the key must be `str` or `int`")
+        self.__set_mask(card_bits.add_id(self._mask, card.id))
 
     def __getitem__(self, key: int | str | CardSuite | CardNumber | slice) -> Card | Cards:
+        """`int`と`str`は`Card`を，`CardSuite`, `CardNumber`, `slice`は`CardsView`を返します．"""
         if isinstance(key, int):
-            return self.__cards[self.__idx[key]]
+            return CARDS[self.__index()[key]]
         elif isinstance(key, CardSuite):
-            return Cards([card for card in self if card.suite == key])
+            return self.__view(card_bits.SUITE_MASKS[key])
         elif isinstance(key, str):
-            return self.__cards[key]
+            cid = self.__to_id(key)
+            if not self._mask >> cid & 1:
+                raise KeyError(key)
+            return CARDS[cid]
         elif isinstance(key, CardNumber):
-            return Cards([card for card in self if card.number == key])
+            return self.__view(card_bits.NUMBER_MASKS[key])
         elif isinstance(key, slice):
-            start = key.start
-            stop = key.stop if key.stop is not None else len(self)
-            step = key.step if key.step is not None else 1
-            return Cards([self[i] for i in range(start, stop, step)])
+            # 選んだカードのbitだけを選択範囲とします
+            mask = 0
+            for cid in self.__index()[key]:
+                mask |= 1 << cid
+            return self.__view(mask)
         else:
             raise KeyError("the key must be `str`, `int`, `CardSuite`, `CardNumber` or `slice`")
 
     def __delitem__(self, key: int | str | Card):
         if isinstance(key, int):
-            del self.__cards[self.__idx.pop(key)]
-        elif isinstance(key, str):
-            del self.__cards[key]
-            self.__idx.remove(key)
-        elif isinstance(key, Card):
-            del self.__cards[str(key)]
-            self.__idx.remove(str(key))
+            cid = self.__index()[key]
+        elif isinstance(key, (str, Card)):
+            cid = self.__to_id(key)
         else:
             raise KeyError("the key must be `str`, `int` or `Card`")
-
-    def __binary_search(self, card: Card, st: int, ed: int) -> int:
-        if ed <= st:
-            return st
-        if card < self.__cards[self.__idx[(st + ed) // 2]]:
-            return self.__binary_search(card, st, (st + ed) // 2)
-        else:
-            return self.__binary_search(card, (st + ed) // 2 + 1, ed)
+        self.__set_mask(card_bits.remove_id(self._mask, cid))
 
     def __str__(self):
-        return str([self[key] for key in self.__idx])
+        return str(list(self))
 
     def __repr__(self):
         return self.__str__()
 
     def to_list_str(self) -> list[str]:
-        return [str(self[key]) for key in self.__idx]
+        return [str(card) for card in self]
 
     def __eq__(self, other: Card | Cards):
         if isinstance(other, Card):
@@ -115,7 +168,7 @@ class Cards:
                     case CardsRegularity.equal:
                         return self[0] == other[0]
                     case CardsRegularity.sequence:
-                        return min(self) == min(other)
+                        return self.to_move().rank == other.to_move().rank
             else:
                 raise ValueError(f"don't match type between {type(other)}")
         raise ValueError(f"{type(other)} is invalid. must be `Card` or `Cards` class")
@@ -134,7 +187,7 @@ class Cards:
                     case CardsRegularity.equal:
                         return self[0] < other[0]
                     case CardsRegularity.sequence:
-                        return min(self) < min(other)
+                        return self.to_move().rank < other.to_move().rank
             else:
                 raise ValueError(f"don't match type between {type(other)}")
         raise ValueError(f"{type(other)} is invalid. must be `Card` or `Cards` class")
@@ -152,88 +205,129 @@ class Cards:
         return not self.__lt__(other)
 
     def __len__(self):
-        return len(self.__cards)
+        return self._mask.bit_count()
 
     def __bool__(self):
-        return bool(self.__cards)
+        return bool(self._mask)
 
     def __contains__(self, item: Card | CardNumber | CardSuite | Cards) -> bool:
         if isinstance(item, str):
-            return item in self.__cards
+            cid = CARD_ID_BY_STR.get(item)
+            return cid is not None and bool(self._mask >> cid & 1)
         elif isinstance(item, Card):
-            return str(item) in self.__cards
+            return bool(self._mask >> item.id & 1)
         elif isinstance(item, CardNumber):
-            for card in self:
-                if card.number == item:
-                    return True
+            return bool(self._mask & card_bits.NUMBER_MASKS[item])
         elif isinstance(item, CardSuite):
-            for card in self:
-                if card.suite == item:
-                    return True
+            return bool(self._mask & card_bits.SUITE_MASKS[item])
         elif isinstance(item, Cards):
-            for each in item:
-                if each not in self:
-                    return False
-            return True
+            return card_bits.contains(self._mask, item.mask)
         else:
             raise TypeError(f"'item' type in 'for item in ...' must be a instance of 'Card' class")
 
-    def __add__(self, other: Card | Cards):
-        cp_cards = copy(self)
+    @staticmethod
+    def __other_mask(other: Card | Cards) -> int:
         if isinstance(other, Card):
-            cp_cards[str(other)] = other
-            return cp_cards
+            return card_bits.add_id(0, other.id)
         elif isinstance(other, Cards):
-            for card in other:
-                cp_cards[str(card)] = card
-        else:
-            raise ValueError(f"type {type(other)} is invalid")
-        return cp_cards
+            return other.mask
+        raise ValueError(f"type {type(other)} is invalid")
+
+    def __add__(self, other: Card | Cards):
+        return Cards.from_mask(card_bits.union(self._mask, self.__other_mask(other)))
 
     def __iadd__(self, other: Card | Cards):
-        if isinstance(other, Card):
-            self[str(other)] = other
-        elif isinstance(other, Cards):
-            for card in other:
-                self[str(card)] = card
-        else:
-            raise ValueError(f"type {type(other)} is invalid")
+        self.__set_mask(card_bits.union(self._mask, self.__other_mask(other)))
         return self
 
     def __sub__(self, other):
-        cp_cards = copy(self)
-        if isinstance(other, Card):
-            del self[other]
-        elif isinstance(other, Cards):
-            for card in other:
-                del cp_cards[card]
-        else:
-            raise ValueError(f"type {type(other)} is invalid")
-        return cp_cards
+        """`other`を取り除いた新しい`Cards`を返します．`difference`と異なり，含まれないカードは許しません．
+
+        Raises:
+            KeyError: `other`に含まれないカードがある場合
+        """
+        other_mask = self.__other_mask(other)
+        if not card_bits.contains(self._mask, other_mask):
+            raise KeyError(f"{other} is not in {self}")
+        return Cards.from_mask(card_bits.difference(self._mask, other_mask))
 
     def __isub__(self, other):
-        if isinstance(other, Card):
-            del self[other]
-        elif isinstance(other, Cards):
-            for card in other:
-                del self[card]
-        else:
-            raise ValueError(f"type {type(other)} is invalid")
+        """`other`を取り除きます．1枚でも含まれない場合は何も取り除きません．
+
+        Raises:
+            KeyError: `other`に含まれないカードがある場合
+        """
+        other_mask = self.__other_mask(other)
+        if not card_bits.contains(self._mask, other_mask):
+            raise KeyError(f"{other} is not in {self}")
+        self.__set_mask(card_bits.difference(self._mask, other_mask))
         return self
 
+    def __and__(self, other: Card | Cards):
+        return Cards.from_mask(card_bits.intersection(self._mask, self.__other_mask(other)))
+
+    def __or__(self, other: Card | Cards):
+        return Cards.from_mask(card_bits.union(self._mask, self.__other_mask(other)))
+
+    def union(self, *others: Card | Cards) -> Cards:
+        """和集合を新しい`Cards`として返します．jokerは枚数を足し合わせます．"""
+        mask = self._mask
+        for other in others:
+            mask = card_bits.union(mask, self.__other_mask(other))
+        return Cards.from_mask(mask)
+
+    def difference(self, *others: Card | Cards) -> Cards:
+        """差集合を新しい`Cards`として返します．`-`と異なり，含まれないカードは無視します(集合演算)．
+
+        `-`と`remove_played`は出したカードを取り除く操作のため，手札にないカードをKeyErrorで検出します．
+        """
+        mask = self._mask
+        for other in others:
+            mask = card_bits.difference(mask, self.__other_mask(other))
+        return Cards.from_mask(mask)
+
+    def intersection(self, *others: Card | Cards) -> Cards:
+        """積集合を新しい`Cards`として返します．"""
+        mask = self._mask
+        for other in others:
+            mask = card_bits.intersection(mask, self.__other_mask(other))
+        return Cards.from_mask(mask)
+
+    def remove_played(self, played: Card | Cards):
+        """出したカードをまとめて取り除きます．1枚でも含まれない場合は何も取り除きません．
+
+        Raises:
+            KeyError: `played`に含まれないカードがある場合
+        """
+        self.__isub__(played)
+
+    def to_move(self) -> Move | None:
+        """組み合わせとして解釈した`Move`を返します．どの組み合わせにもならない場合はNoneを返します．"""
+        return moves.classify(self._mask)
+
+    @staticmethod
+    def from_move(move: Move) -> Cards:
+        return Cards.from_mask(move.mask, move.regularity)
+
+    @staticmethod
+    def __field(played_cards: Cards | None, regularity: CardsRegularity) -> Move | None:
+        if played_cards is None:
+            return None
+        field = played_cards.to_move()
+        if field is None or field.regularity != regularity:
+            raise ValueError(f"played_cards is {played_cards}. must be `{regularity.name}`")
+        return field
+
     def lookfor_one(self, played_card: Card = None) -> list[Cards]:
-        return_list = []
-        for card in self:
-            if played_card is None or card > played_card:
-                return_list.append(Cards([card], CardsRegularity.one))
-        return return_list
+        field = None if played_card is None else moves.classify(card_bits.add_id(0, played_card.id))
+        return [Cards.from_move(move) for move in moves.iter_ones(self._mask, field)]
 
     @staticmethod
     def is_sequence(cards: Cards) -> bool:
         """Cardsがsequenceかどうか判定します．
 
         既に_regularity属性にsequenceがある場合は即座にTrueを返します．
-        noneの場合は，sequenceかどうか判定し結果を返します．
+        noneの場合は，sequenceかどうか判定し結果を返します．jokerは任意のカードとして扱います．
         それ以外の場合はFalseを返します．
 
         Args:
@@ -246,12 +340,8 @@ class Cards:
             staticmethodのため，インスタンスでも引数に`self`が必要です．
         """
         if cards._regularity == CardsRegularity.none:
-            if len(cards) < 3:
-                return False
-            for i in range(1, len(cards)):
-                if not cards[i - 1] + 1 == cards[i]:
-                    return False
-            return True
+            move = cards.to_move()
+            return move is not None and move.regularity == CardsRegularity.sequence
         return cards._regularity == CardsRegularity.sequence
 
     @staticmethod
@@ -259,7 +349,7 @@ class Cards:
         """`Cards`が`equal`かどうか判定します．
 
         既に`_regularity`属性に`equal`がある場合は即座に`True`を返します．
-        `none`の場合は，`equal`かどうか判定し結果を返します．
+        `none`の場合は，`equal`かどうか判定し結果を返します．jokerは任意のカードとして扱います．
         それ以外の場合は`False`を返します．
 
         Args:
@@ -272,13 +362,8 @@ class Cards:
             staticmethodのため，インスタンスでも引数に`self`が必要です．
         """
         if cards._regularity == CardsRegularity.none:
-            if len(cards) < 2:
-                return False
-            f_card = cards[0]
-            for card in cards:
-                if not f_card == card:
-                    return False
-            return True
+            move = cards.to_move()
+            return move is not None and move.regularity == CardsRegularity.equal
         return cards._regularity == CardsRegularity.equal
 
     @staticmethod
@@ -306,151 +391,180 @@ class Cards:
         return cards._regularity == CardsRegularity.one
 
     def lookfor_sequence(self, played_cards: Cards = None) -> list[Cards]:
-        """
+        """同じsuiteで連続する3枚以上の組み合わせを全て返します．
 
         Args:
-            played_cards:
+            played_cards: 場のカード．ある場合は同じ枚数でより強いものだけを返します．
 
         Returns:
+            list[Cards]
 
-        Warnings:
-            TODO:Jokerを含んだカードの処理は未定義です．
-
+        Raises:
+            ValueError: played_cardsがsequenceでない場合
         """
-        li = []
-        if isinstance(played_cards, Cards):
-            if not Cards.is_sequence(played_cards):
-                ValueError(f"played_cards._regularity is {played_cards._regularity}. must be `sequence`")
-            num = len(played_cards)
-            min_card = played_cards[0]
-        else:
-            num = 0
-            min_card = Card(suite=CardSuite.JOKER, number=CardNumber.NONE, _strength=-1)  # 3の強さが0
-        for suite in CardSuite:
-            cnt = 1
-            same_suite_cards = self[suite]
-            for i in range(1, len(same_suite_cards) + 1):
-                if same_suite_cards[i - 1] > min_card and i != len(same_suite_cards) and same_suite_cards[i - 1] + 1 == \
-                        same_suite_cards[i]:
-                    cnt += 1
-                else:
-                    if cnt < 3:
-                        cnt = 1
-                        continue
-                    if cnt >= 3 and (num == 0 or num == cnt):
-                        li.append(Cards([card for card in same_suite_cards[i - 3:i]], CardsRegularity.sequence))
-                    if cnt >= 4 and (num == 0 or num == cnt):
-                        li.append(Cards([card for card in same_suite_cards[i - 4:i - 1]], CardsRegularity.sequence))
-                        li.append(Cards([card for card in same_suite_cards[i - 4:i]], CardsRegularity.sequence))
-                    if cnt >= 5 and (num == 0 or num == cnt):
-                        li.append(Cards([card for card in same_suite_cards[i - 5:i - 2]], CardsRegularity.sequence))
-                        li.append(Cards([card for card in same_suite_cards[i - 5:i - 1]], CardsRegularity.sequence))
-                        li.append(Cards([card for card in same_suite_cards[i - 5:i]], CardsRegularity.sequence))
-                    if cnt >= 6 and (num == 0 or num == cnt):
-                        li.append(Cards([card for card in same_suite_cards[i - 6:i - 3]], CardsRegularity.sequence))
-                        li.append(Cards([card for card in same_suite_cards[i - 6:i - 2]], CardsRegularity.sequence))
-                        li.append(Cards([card for card in same_suite_cards[i - 6:i - 1]], CardsRegularity.sequence))
-                        li.append(Cards([card for card in same_suite_cards[i - 6:i]], CardsRegularity.sequence))
-                    cnt = 1
-        return li
+        field = self.__field(played_cards, CardsRegularity.sequence)
+        return [Cards.from_move(move) for move in moves.iter_sequences(self._mask, field)]
 
     def lookfor_equal(self, played_cards: Cards = None) -> list[Cards]:
-        # TODO: Upgrade
-        """
+        """同じ強さの2枚以上の組み合わせを全て返します．
 
         Args:
-            played_cards:
+            played_cards: 場のカード．ある場合は同じ枚数でより強いものだけを返します．
 
         Returns:
-        Warnings:
-            TODO:Jokerを含んだカードの処理は未定義です．
+            list[Cards]
 
+        Raises:
+            ValueError: played_cardsがequalでない場合
         """
-        li = []
-        idx = 0
-        while idx < len(self) - 1:
-            # 2枚同じランクのカードがある場合
-            if self[idx] == self[idx + 1]:
-                li.append(Cards([self[idx], self[idx + 1]], CardsRegularity.equal))
-                # 3枚同じランクのカードがある場合
-                if idx < len(self) - 2 and self[idx + 1] == self[idx + 2]:
-                    li.append(Cards([self[idx + 1], self[idx + 2]], CardsRegularity.equal))
-                    li.append(Cards([self[idx], self[idx + 2]], CardsRegularity.equal))
-                    li.append(Cards([self[idx], self[idx + 1], self[idx + 2]], CardsRegularity.equal))
-                    # 4枚同じランクのカードがある場合
-                    if idx < len(self) - 3 and self[idx + 2] == self[idx + 3]:
-                        li.append(Cards([self[idx], self[idx + 3]], CardsRegularity.equal))
-                        li.append(Cards([self[idx + 1], self[idx + 3]], CardsRegularity.equal))
-                        li.append(Cards([self[idx + 2], self[idx + 3]], CardsRegularity.equal))
-                        li.append(Cards([self[idx], self[idx + 1], self[idx + 3]], CardsRegularity.equal))
-                        li.append(Cards([self[idx + 1], self[idx + 2], self[idx + 3]], CardsRegularity.equal))
-                        li.append(Cards([self[idx], self[idx + 2], self[idx + 3]], CardsRegularity.equal))
-                        li.append(
-                            Cards([self[idx], self[idx + 1], self[idx + 2], self[idx + 3]], CardsRegularity.equal))
-                        idx += 4
-                    else:
-                        idx += 3
-                else:
-                    idx += 2
-            else:
-                idx += 1
-        if played_cards is not None:
-            li = [cards for cards in li if len(cards) == len(played_cards) and cards > played_cards]
-        return li
+        field = self.__field(played_cards, CardsRegularity.equal)
+        return [Cards.from_move(move) for move in moves.iter_equals(self._mask, field)]
 
     @classmethod
-    def create_cards(cls, is_shuffle: bool = True, player_num: int = 4, joker_num: int = 2) -> tuple:
+    def create_cards(cls, is_shuffle: bool = True, player_num: int = 4, joker_num: int = 2,
+                     deck: int | None = None, rng: Random | None = None) -> tuple:
         """
 
         Args:
             player_num:
             is_shuffle:
             joker_num:
+            deck: 使用するカードのbitmask(`Rules.deck`)．指定した場合は`joker_num`を無視します．
+            rng: shuffleに使う乱数．Noneの場合は`random`moduleの乱数
 
         Returns:
 
         """
-        cards: list[Card] = []
-        cards.extend([Card.from_str('jo0') for _ in range(joker_num)])
-        for suite in CardSuite:
-            if suite == CardSuite.JOKER:
-                continue
-            cards.extend([Card.from_str(f"{suite}{num}") for num in range(1, 14)])
+        if deck is not None:
+            cards: list[Card] = [CARDS[cid] for cid in card_bits.iter_ids(deck)]
+        else:
+            cards = [CARDS[card_bits.JOKER_IDS[0]]] * joker_num
+            for suite in CardSuite:
+                if suite == CardSuite.JOKER:
+                    continue
+                cards.extend([CARD_BY_SUITE_NUMBER[suite, CardNumber(num)] for num in range(1, 14)])
         if is_shuffle:
-            shuffle(cards)
+            if rng is None:
+                shuffle(cards)
+            else:
+                rng.shuffle(cards)
         if player_num < 1:
             return tuple(cards)
         return tuple(Cards(cards[len(cards) * i // player_num: len(cards) * (i + 1) // player_num]) for i in
                      range(player_num))
 
-    def lookfor_candidate_cards_set(self, played_cards: Cards = None) -> list[Cards]:
-        """
+    @staticmethod
+    def __played_field(played_cards: Cards | None) -> Move | None:
+        if played_cards is None:
+            return None
+        field = played_cards.to_move()
+        if field is None:
+            raise ValueError(f"cards don't match any pattern. played_cards: {played_cards}")
+        return field
+
+    def iter_candidate_cards_set(self, played_cards: Cards = None,
+                                 order: MoveOrder | Callable[[Move], Any] | None = None) -> Iterator[Cards]:
+        """played_cardsに対して出せる組み合わせを1つずつ返します．
+
+        必要な分だけ生成するため，最初の1つだけが必要な場合や，出せるかどうかだけを知りたい場合に使用します．
 
         Args:
-            played_cards:
+            played_cards: 場のカード，ない場合は None
+            order: `MoveOrder`またはMoveを受け取るkey関数．Noneの場合はsequence, equal, oneの順
 
         Returns:
-        Warnings:
-            TODO:Jokerを含んだカードの処理は未定義です．
+            Iterator[Cards]
 
+        Raises:
+            ValueError: played_cardsがどの組み合わせにもならない場合
         """
-
-        if played_cards is None:
-            candidate_cards_set = self.lookfor_sequence(played_cards)
-            candidate_cards_set.extend(self.lookfor_equal(played_cards))
-            candidate_cards_set.extend(self.lookfor_one())
-            logger.info(f"played: {played_cards} candidate_set:{candidate_cards_set}")
-        elif self.is_one(played_cards):
-            candidate_cards_set = self.lookfor_one(played_cards[0])
-        elif self.is_sequence(played_cards):
-            candidate_cards_set = self.lookfor_sequence(played_cards)
-        elif self.is_equal(played_cards):
-            candidate_cards_set = self.lookfor_equal(played_cards)
+        field = self.__played_field(played_cards)
+        if order is None:
+            candidate_moves = moves.iter_moves(self._mask, field)
         else:
-            raise ValueError(f"cards don't match any pattern. played_cards: {played_cards}")
+            candidate_moves = moves.iter_ordered_moves(self._mask, field, order)
+        return map(Cards.from_move, candidate_moves)
+
+    def lookfor_candidate_cards_set(self, played_cards: Cards = None) -> list[Cards]:
+        """played_cardsに対して出せる組み合わせを全て返します．
+
+        Args:
+            played_cards: 場のカード，ない場合は None
+
+        Returns:
+            list[Cards]: sequence, equal, oneの順
+
+        Raises:
+            ValueError: played_cardsがどの組み合わせにもならない場合
+        """
+        candidate_cards_set = list(self.iter_candidate_cards_set(played_cards))
+        logger.debug("played: %s candidate_set:%s", played_cards, candidate_cards_set)
         return candidate_cards_set
 
 
+class CardsView(Cards):
+    """`Cards`の一部を参照する読み取り用のviewです．
+
+    `Cards`の`CardSuite`, `CardNumber`, `slice`による抽出結果として作成され，
+    元の`Cards`のbitmaskと選択範囲のbitmaskの積を参照するため，作成時にカードをコピーしません．
+    `slice`の選択範囲は作成時点のindexで選んだカードです．
+
+    viewの内容は作成時点の抽出結果で，元の`Cards`や自身が変更されることはありません．
+    viewに対してカードの追加や削除を行った場合，または元の`Cards`が変更される場合は，
+    その時点の内容をコピーして元の`Cards`から切り離します(copy on write)．
+    Args:
+        source(Cards): 参照する`Cards`
+        selection(int): 選択範囲のbitmask
+    """
+
+    __slots__ = ("_source", "_selection", "_own", "_ids_cache", "_ids_mask")
+
+    def __init__(self, source: Cards, selection: int, _regularity: CardsRegularity = CardsRegularity.none):
+        self._source: Cards | None = source
+        self._selection = selection
+        self._own = 0
+        self._ids_cache: tuple[int, ...] | None = None
+        self._ids_mask = -1
+        self._regularity = _regularity
+        self._views = None
+
+    @property
+    def is_detached(self) -> bool:
+        """copy on writeにより元の`Cards`から切り離されていればTrueを返します．"""
+        return self._source is None
+
+    def __get_mask(self) -> int:
+        if self._source is None:
+            return self._own
+        return card_bits.normalize(self._source.mask & self._selection)
+
+    def __detach(self, mask: int):
+        self._own = mask
+        self._source = None
+
+    def detach(self):
+        """現在の内容をコピーし，元の`Cards`から切り離します．"""
+        if self._source is not None:
+            self.__detach(self.__get_mask())
+
+    def __get_ids(self) -> tuple[int, ...] | None:
+        if self._ids_mask != self.__get_mask():
+            return None
+        return self._ids_cache
+
+    def __set_ids(self, ids: tuple[int, ...] | None):
+        self._ids_cache = ids
+        self._ids_mask = -1 if ids is None else self.__get_mask()
+
+    # Cardsの`_mask`と`_ids`をviewの内容で置き換えます
+    _mask = property(__get_mask, __detach)
+    _ids = property(__get_ids, __set_ids)
+
+    def copy(self) -> Cards:
+        """現在の内容をコピーした`Cards`を返します．"""
+        return Cards.from_mask(self.mask, self._regularity)
+
+
 if __name__ == "__main__":
     li = Cards([Card.from_str('sp2'), Card.from_str('sp1'), Card.from_str('he11')])
     print(li)
@@ -0,0 +1,185 @@
+"""終盤の完全読みです．
+
+全員の手札の合計が`ENDGAME_CARDS`枚以下になったら，`PlayState`上で全ての手を読み切ります．
+多人数戦なので，各座席が自分の報酬(`payoff`)を最大にする手を選ぶmax^nで評価します．
+
+読む局面の数は探索ごとに`MAX_NODES`で打ち切り，超えた場合は`SearchLimitExceeded`を送出します．
+残りの局面数は探索ごとの`_Search`が持つため，複数のthreadで同時に探索できます．
+評価済みの局面は(局面, 規則)をkeyとしてmodule単位のLRUのtransposition tableに保持するため，
+同じprocess(process poolのworkerを含む)の試合の間で共有され，古い局面から追い出されます．
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from logging import getLogger
+from typing import NamedTuple
+
+from millionaire.libs.match.moves import Move
+from millionaire.libs.match.rules import STANDARD, Rules
+from millionaire.libs.match.state import NO_SEAT, PlayState, apply_move, legal_moves
+
+logger = getLogger(__name__)
+
+ENDGAME_CARDS = 8
+MAX_NODES = 2000
+TABLE_SIZE = 1 << 18
+
+
+class SearchLimitExceeded(Exception):
+    """読む局面の数が上限を超えた場合に送出します．それまでに読み切った局面はtableに残ります．"""
+
+
+def payoff(ranking: tuple[int, ...]) -> tuple[float, ...]:
+    """順位を座席ごとの報酬に変換します．1位が1，最下位が0です．"""
+    num = len(ranking)
+    values = [0.0] * num
+    for place, seat in enumerate(ranking):
+        values[seat] = (num - 1 - place) / (num - 1) if num > 1 else 0.5
+    return tuple(values)
+
+
+def _canonical(state: PlayState) -> PlayState:
+    # 場が流れた後は，場のカードを出した座席と縛りは以降の進行に影響しない
+    if not state.field and (state.owner != NO_SEAT or state.lock):
+        return state._replace(owner=NO_SEAT, lock=0)
+    return state
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class TranspositionTable:
+    """評価済みの局面のLRU cacheです．複数のthreadから使えます．
+
+    Args:
+        maxsize: 保持する局面数の上限
+    """
+
+    def __init__(self, maxsize: int = TABLE_SIZE):
+        self.maxsize = maxsize
+        self.__data: OrderedDict[tuple[PlayState, Rules], tuple[tuple[float, ...], Move | None]] = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+    def get(self, key: tuple[PlayState, Rules]) -> tuple[tuple[float, ...], Move | None] | None:
+        with self.__lock:
+            value = self.__data.get(key)
+            if value is None:
+                self.__misses += 1
+            else:
+                self.__data.move_to_end(key)
+                self.__hits += 1
+            return value
+
+    def put(self, key: tuple[PlayState, Rules], value: tuple[tuple[float, ...], Move | None]):
+        with self.__lock:
+            self.__data[key] = value
+            if len(self.__data) > self.maxsize:
+                self.__data.popitem(last=False)
+
+    def info(self) -> CacheInfo:
+        with self.__lock:
+            return CacheInfo(self.__hits, self.__misses, self.maxsize, len(self.__data))
+
+    def clear(self):
+        with self.__lock:
+            self.__data.clear()
+            self.__hits = self.__misses = 0
+
+
+_table = TranspositionTable()
+
+
+class _Search:
+    """1回の探索です．新しく読める局面の残り(`remaining`)を持ちます．Noneの場合は無制限です．"""
+    __slots__ = ("rules", "remaining")
+
+    def __init__(self, rules: Rules, max_nodes: int | None):
+        self.rules = rules
+        self.remaining = max_nodes
+
+    def solve(self, state: PlayState) -> tuple[tuple[float, ...], Move | None]:
+        rules = self.rules
+        result = _table.get((state, rules))
+        if result is not None:
+            return result
+        if self.remaining is not None:
+            if self.remaining <= 0:
+                raise SearchLimitExceeded
+            self.remaining -= 1
+        if state.is_over:
+            result = payoff(state.ranking), None
+        else:
+            seat = state.turn
+            best_values: tuple[float, ...] | None = None
+            best_move = None
+            for move in legal_moves(state, rules):
+                values, _ = self.solve(_canonical(apply_move(state, move, rules)[0]))
+                if best_values is None or values[seat] > best_values[seat]:
+                    best_values, best_move = values, move
+                    if values[seat] == 1.0:
+                        break
+            result = best_values, best_move
+        _table.put((state, rules), result)
+        return result
+
+
+def is_endgame(state: PlayState, threshold: int = ENDGAME_CARDS) -> bool:
+    return not state.is_over and state.card_count() <= threshold
+
+
+def is_determined(state: PlayState, seat: int) -> bool:
+    """`seat`から他の座席の手札が全て分かる(カードを持つ他の座席が1つ以下の)場合にTrueを返します．"""
+    return sum(1 for other, hand in enumerate(state.hands) if other != seat and hand) <= 1
+
+
+def _bounded(state: PlayState, rules: Rules, max_nodes: int | None) -> tuple[tuple[float, ...], Move | None]:
+    return _Search(rules, max_nodes).solve(_canonical(state))
+
+
+def solve(state: PlayState, rules: Rules = STANDARD, max_nodes: int | None = MAX_NODES) -> tuple[float, ...]:
+    """最善を尽くした場合の座席ごとの報酬を返します．全員の手札が分かっている必要があります．
+
+    Raises:
+        SearchLimitExceeded: 新しく読む局面が`max_nodes`を超えた場合
+    """
+    return _bounded(state, rules, max_nodes)[0]
+
+
+def best_move(state: PlayState, rules: Rules = STANDARD, max_nodes: int | None = MAX_NODES) -> Move | None:
+    """手番の座席の最善手を返します．Noneはパスです．
+
+    Raises:
+        ValueError: 試合が終わっている場合
+        SearchLimitExceeded: 新しく読む局面が`max_nodes`を超えた場合
+    """
+    if state.is_over:
+        raise ValueError("the match is over")
+    return _bounded(state, rules, max_nodes)[1]
+
+
+cache_info = _table.info
+cache_clear = _table.clear
+
+
+if __name__ == '__main__':
+    import random
+    import time
+
+    from millionaire.libs.match.cards import Cards
+
+    rng = random.Random(0)
+    current = PlayState(hands=tuple(cards.mask for cards in Cards.create_cards(player_num=4)))
+    while current.card_count() > ENDGAME_CARDS:
+        current, _ = apply_move(current, rng.choice(list(legal_moves(current))))
+    start = time.perf_counter()
+    print(best_move(current, max_nodes=None), solve(current), f"{(time.perf_counter() - start) * 1e3:.2f} ms")
+    start = time.perf_counter()
+    best_move(current)
+    print(cache_info(), f"{(time.perf_counter() - start) * 1e6:.2f} us")
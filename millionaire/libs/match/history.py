@@ -1,11 +1,349 @@
-from datetime import datetime
+"""試合の追記専用(append-only)のbinary logと，高速なreplayです．
+
+試合の進行はeventの列として記録します(event sourcing)．1試合のlogは次のrecordの並びです．整数は全てlittle endianです．
+
+    header:   magic(4) version(1) player_num(1) settings(4) seed(8) created_at(8, µs) play_id(16) uid(16) * player_num
+    deal:     `DEAL`(1) 手札のbitmask(8) * player_num
+    move:     枚数n(1) card id(1) * n      (n=0はパス．jokerのidは52)
+    reset:    `RESET`(1)                   (場が流れた)
+    snapshot: `SNAPSHOT`(1) `PlayState`(`encode_state`)
+    end:      `END`(1)
+
+1手はパスなら1byte，カードを出す場合は1+枚数byteです．手番は規則から決まるため記録しません．
+snapshotは`snapshot_interval`eventごとに追記し，`load`は最後のsnapshotの後の手だけを適用して状態を復元します．
+`END`のない進行中の試合も読み出せます．
+ファイルには複数の試合を続けて追記でき，`iter_matches`で先頭から順に読み出せます．
+"""
+from __future__ import annotations
+
+import struct
+from datetime import datetime, timezone
+from logging import getLogger
+from typing import BinaryIO, Iterable, Iterator, NamedTuple
 from uuid import UUID
 
-from millionaire.libs.match.player import Player
+from millionaire.libs.match import card_bits
+from millionaire.libs.match.moves import MAX_MOVE_SIZE, Move, classify
+from millionaire.libs.match.rules import Rules, compile_rules
+from millionaire.libs.match.settings import Settings
+from millionaire.libs.match.state import PlayState, apply_move
+
+logger = getLogger(__name__)
+
+MAGIC = b"MLOG"
+VERSION = 2
+VERSIONS = (1, 2)
+DEAL = 0xD0
+SNAPSHOT = 0xE0
+RESET = 0xE1
+END = 0xFF
+SNAPSHOT_INTERVAL = 32
+
+HEADER = struct.Struct("<4sBB4sQq16s")
+UID = struct.Struct("<16s")
+HAND = struct.Struct("<Q")
+STATE = struct.Struct("<QbBBBBB")  # field owner passed turn revolution lock ranking_len
+
+_SETTING_FLAGS = ("use_spade", "use_clover", "use_diamond", "use_heart", "use_sequence", "use_equal",
+                  "eight_cut", "suit_lock")
+
+
+def encode_settings(settings: Settings) -> bytes:
+    flags = 0
+    for bit, name in enumerate(_SETTING_FLAGS):
+        if getattr(settings, name):
+            flags |= 1 << bit
+    return bytes((settings.number_of_joker, flags, int(settings.joker_over_joker), settings.revolution))
+
+
+def decode_settings(data: bytes) -> Settings:
+    settings = Settings()
+    settings.number_of_joker = data[0]
+    for bit, name in enumerate(_SETTING_FLAGS):
+        setattr(settings, name, bool(data[1] >> bit & 1))
+    settings.joker_over_joker = bool(data[2])
+    settings.revolution = data[3]
+    return settings
+
+
+def encode_move(move: Move | None) -> bytes:
+    if move is None:
+        return b"\x00"
+    return bytes((move.size, *card_bits.iter_ids(move.mask)))
+
+
+def encode_state(state: PlayState) -> bytes:
+    return b"".join(HAND.pack(hand) for hand in state.hands) + \
+        STATE.pack(state.field, state.owner, state.passed, state.turn, state.revolution, state.lock,
+                   len(state.ranking)) + bytes(state.ranking)
+
+
+def decode_state(data: bytes | memoryview, player_num: int, pos: int = 0) -> tuple[PlayState, int]:
+    """`encode_state`の逆です．状態と，読み終えた位置を返します．"""
+    hands = tuple(HAND.unpack_from(data, pos + i * HAND.size)[0] for i in range(player_num))
+    pos += HAND.size * player_num
+    field, owner, passed, turn, revolution, lock, ranking_len = STATE.unpack_from(data, pos)
+    pos += STATE.size
+    ranking = tuple(data[pos:pos + ranking_len])
+    return PlayState(hands, field, owner, passed, turn, ranking, bool(revolution), lock), pos + ranking_len
+
+
+class MatchLogHeader(NamedTuple):
+    play_id: UUID
+    created_at: datetime
+    seed: int
+    settings: Settings
+    order: tuple[UUID, ...]
+
+    @property
+    def rules(self) -> Rules:
+        return compile_rules(self.settings)
+
+
+class MatchLogWriter:
+    """1試合分のlogを`stream`に追記します．flushは呼び出し側で行います．
+
+    Args:
+        stream: 書き込み先．ファイルの場合は追記(`"ab"`)で開いてください．
+        snapshot_interval: snapshotを追記するevent数の目安．0の場合はsnapshotを取りません．
+
+    Attributes:
+        events(int): 最後のsnapshot(またはdeal)の後に追記したevent数
+    """
+
+    def __init__(self, stream: BinaryIO, snapshot_interval: int = SNAPSHOT_INTERVAL):
+        self.__stream = stream
+        self.snapshot_interval = snapshot_interval
+        self.events = 0
+
+    @property
+    def snapshot_due(self) -> bool:
+        """`snapshot`を追記する頃合いか"""
+        return 0 < self.snapshot_interval <= self.events
+
+    def begin(self, play_id: UUID, created_at: datetime, seed: int, settings: Settings, order: Iterable[UUID]):
+        order = tuple(order)
+        micros = int(created_at.timestamp() * 1_000_000)
+        self.__stream.write(HEADER.pack(MAGIC, VERSION, len(order), encode_settings(settings), seed, micros,
+                                        play_id.bytes) + b"".join(uid.bytes for uid in order))
+
+    def deal(self, hands: Iterable[int]):
+        self.__stream.write(bytes((DEAL,)) + b"".join(HAND.pack(hand) for hand in hands))
+        self.events = 0
+
+    def move(self, move: Move | None):
+        self.__stream.write(encode_move(move))
+        self.events += 1
+
+    def reset(self):
+        self.__stream.write(bytes((RESET,)))
+        self.events += 1
+
+    def snapshot(self, state: PlayState):
+        self.__stream.write(bytes((SNAPSHOT,)) + encode_state(state))
+        self.events = 0
+
+    def end(self):
+        self.__stream.write(bytes((END,)))
+
+
+class MatchLogReader:
+    """bytes(またはmmapなどのbuffer)から試合のlogを読み出します．
+
+    Raises:
+        ValueError: logが壊れている場合
+    """
+
+    def __init__(self, data: bytes | bytearray | memoryview, offset: int = 0):
+        self.__data = memoryview(data)
+        self.__pos = offset
+
+    @property
+    def pos(self) -> int:
+        return self.__pos
+
+    @property
+    def at_end(self) -> bool:
+        return self.__pos >= len(self.__data)
+
+    def header(self) -> MatchLogHeader:
+        data, pos = self.__data, self.__pos
+        if len(data) - pos < HEADER.size:
+            raise ValueError(f"truncated header at {pos}")
+        magic, version, player_num, settings, seed, micros, play_id = HEADER.unpack_from(data, pos)
+        if magic != MAGIC or version not in VERSIONS:
+            raise ValueError(f"not a match log (magic={magic!r}, version={version}) at {pos}")
+        pos += HEADER.size
+        if len(data) - pos < player_num * UID.size:
+            raise ValueError(f"truncated header at {pos}")
+        order = tuple(UUID(bytes=UID.unpack_from(data, pos + i * UID.size)[0]) for i in range(player_num))
+        self.__pos = pos + player_num * UID.size
+        return MatchLogHeader(UUID(bytes=play_id), datetime.fromtimestamp(micros / 1_000_000, timezone.utc),
+                              seed, decode_settings(settings), order)
+
+    def records(self, player_num: int) -> Iterator[tuple[int, ...] | int | PlayState | None]:
+        """headerの後のrecordを順に返します．
+
+        Returns:
+            Iterator: dealは手札のtuple，moveはbitmask(パスは0)，resetはNone，snapshotは`PlayState`．
+                `END`またはデータの最後(進行中の試合)で終了します．
+
+        Raises:
+            ValueError: recordの途中でデータが終わっている場合，または不明なrecordの場合
+        """
+        data = self.__data
+        size = len(data)
+        pos = self.__pos
+        while pos < size:
+            tag = data[pos]
+            pos += 1
+            if tag == END:
+                self.__pos = pos
+                return
+            if tag == DEAL:
+                end = pos + HAND.size * player_num
+                if end > size:
+                    raise ValueError(f"truncated log at {pos}")
+                yield tuple(HAND.unpack_from(data, pos + i * HAND.size)[0] for i in range(player_num))
+                pos = end
+            elif tag == RESET:
+                yield None
+            elif tag == SNAPSHOT:
+                try:
+                    state, pos = decode_state(data, player_num, pos)
+                except (struct.error, ValueError):
+                    raise ValueError(f"truncated log at {pos}") from None
+                if pos > size:
+                    raise ValueError(f"truncated log at {pos}")
+                yield state
+            elif tag <= MAX_MOVE_SIZE:
+                end = pos + tag
+                if end > size:
+                    raise ValueError(f"truncated log at {pos}")
+                mask = 0
+                for cid in data[pos:end]:
+                    mask = card_bits.add_id(mask, cid)
+                yield mask
+                pos = end
+            else:
+                self.__pos = pos
+                raise ValueError(f"unknown record {tag:#x} at {pos - 1}")
+            self.__pos = pos
+
+
+def replay(reader: MatchLogReader, header: MatchLogHeader | None = None,
+           validate: bool = False) -> Iterator[PlayState]:
+    """1試合を先頭から再生し，配った直後と各手の後の`PlayState`を返します．
+
+    Args:
+        reader: headerの位置(`header`を渡す場合はその直後)の`MatchLogReader`
+        header: 読み出し済みのheader
+        validate: 各手が規則上出せるかを検証するか
+
+    Raises:
+        ValueError: logが壊れている場合，または`validate`で不正な手が見つかった場合
+    """
+    if header is None:
+        header = reader.header()
+    rules = header.rules
+    state: PlayState | None = None
+    for record in reader.records(len(header.order)):
+        if isinstance(record, PlayState):
+            # snapshotはNamedTupleのため，dealのtupleより先に判定する
+            if validate and state is not None and record != state:
+                raise ValueError("snapshot doesn't match the replayed state")
+            if state is None:
+                state = record
+                yield state
+            continue
+        if isinstance(record, tuple):
+            state = PlayState(hands=record)
+            yield state
+            continue
+        if state is None:
+            raise ValueError("move before deal")
+        if record is None:
+            if validate and state.field:
+                raise ValueError("reset while the field isn't empty")
+            continue
+        move = classify(record) if record else None
+        if validate:
+            if state.is_over:
+                raise ValueError("move after the match is over")
+            hand = state.hands[state.turn]
+            if move is None:
+                legal = bool(state.field)
+            else:
+                legal = card_bits.contains(hand, move.mask) and \
+                    rules.is_legal(move, state.field_move, state.revolution, state.lock)
+            if not legal:
+                raise ValueError(f"illegal move {record:#x} by seat {state.turn}")
+        state, _ = apply_move(state, move, rules)
+        yield state
+
+
+def load(reader: MatchLogReader) -> tuple[MatchLogHeader, PlayState | None]:
+    """1試合を最後まで読み，headerと最後の状態を返します．配る前に終わったlogの場合はNoneです．
+
+    最後のsnapshot(またはdeal)の後の手だけを適用するため，復元の手間は`snapshot_interval`手分で済みます．
+
+    Raises:
+        ValueError: logが壊れている場合
+    """
+    header = reader.header()
+    rules = header.rules
+    state: PlayState | None = None
+    tail: list[int] = []
+    for record in reader.records(len(header.order)):
+        if isinstance(record, PlayState):
+            state, tail = record, []
+        elif isinstance(record, tuple):
+            state, tail = PlayState(hands=record), []
+        elif record is not None:
+            tail.append(record)
+    if tail and state is None:
+        raise ValueError("move before deal")
+    for record in tail:
+        state, _ = apply_move(state, classify(record) if record else None, rules)
+    return header, state
+
+
+def iter_matches(data: bytes | bytearray | memoryview) -> Iterator[tuple[MatchLogHeader, PlayState | None]]:
+    """複数の試合を続けて追記したlogから，試合ごとのheaderと最後の状態を返します．"""
+    reader = MatchLogReader(data)
+    while not reader.at_end:
+        yield load(reader)
+
+
+if __name__ == '__main__':
+    import io
+    import time
+    from uuid import uuid4
 
+    from millionaire.libs.match.cards import Cards
+    from millionaire.libs.match.state import legal_moves
 
-class History:
-    def __init__(self, *args, **kwargs):
-        play_id: UUID = kwargs["play_id"]
-        created_at: datetime = kwargs["created_at"]
-        users: list[Player] = kwargs["users"]
+    buffer = io.BytesIO()
+    finals = []
+    for _ in range(1000):
+        writer = MatchLogWriter(buffer, snapshot_interval=8)
+        writer.begin(uuid4(), datetime.now(timezone.utc), 0, Settings(), [uuid4() for _ in range(4)])
+        current = PlayState(hands=tuple(cards.mask for cards in Cards.create_cards(player_num=4)))
+        writer.deal(current.hands)
+        while not current.is_over:
+            chosen = next(legal_moves(current))
+            writer.move(chosen)
+            current, _ = apply_move(current, chosen)
+            if not current.field:
+                writer.reset()
+            if writer.snapshot_due:
+                writer.snapshot(current)
+        writer.end()
+        finals.append(current)
+    raw = buffer.getvalue()
+    start = time.perf_counter()
+    replayed = [state for _, state in iter_matches(raw)]
+    elapsed = time.perf_counter() - start
+    print(f"{len(raw) / len(finals):.0f} bytes/match, {len(finals) / elapsed:.0f} matches/sec", replayed == finals)
+    reader = MatchLogReader(raw)
+    print(all(True for _ in replay(reader, validate=True)))
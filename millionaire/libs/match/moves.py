@@ -0,0 +1,404 @@
+"""手札のbitmaskから出せる組み合わせ(Move)を列挙します．
+
+手札をrankごとのnibble(4bit)と，suiteごとの13bitの並び(run bitmask)に分解し，
+jokerはどのカードの代わりにもなるものとして扱います．
+
+同じbitmaskが複数の解釈を持つ場合(例: `sp4, sp5, jo0`は3-4-5とも4-5-6とも読める)，
+`classify`の解釈を正とし，列挙もその解釈のみを返します．
+    * rankが1つのカードとjokerのみ -> equal
+    * sequenceのjokerは，間を埋めた後に可能な限り上(強い側)に伸ばす
+
+場に対して出せるrankは`allowed`(rankごとのbitmask)で指定します．
+省略した場合は場より大きいrankです．革命などの規則は`millionaire.libs.match.rules`が`allowed`に変換します．
+"""
+from __future__ import annotations
+
+import heapq
+from enum import StrEnum, auto
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import combinations
+from operator import attrgetter
+from typing import Any, Callable, Iterator, NamedTuple
+
+from millionaire.libs.match.card_bits import (JOKER_FILL, JOKER_MASK, JOKER_RANK, NORMAL_MASK, RANK_MASKS,
+                                              RANK_NUM, SUITE_INDEX_MASKS, contains, difference)
+from millionaire.libs.match.card_types import CardsRegularity
+
+MIN_SEQUENCE = 3
+MIN_EQUAL = 2
+# 1回に出せる最大の枚数(1suiteの全てのrankのsequence)
+MAX_MOVE_SIZE = RANK_NUM
+
+# rank(jokerを含む)ごとのbitmask
+ALL_RANKS = (1 << (JOKER_RANK + 1)) - 1
+# ABOVE[rank]: rankより大きいrank
+ABOVE: tuple[int, ...] = tuple(ALL_RANKS & ~((1 << (rank + 1)) - 1) for rank in range(JOKER_RANK + 1))
+# CardsRegularity.valueごとのbitmask
+ALL_SHAPES = (1 << CardsRegularity.one.value) | (1 << CardsRegularity.sequence.value) | \
+             (1 << CardsRegularity.equal.value)
+
+# nibble(1rankの4bit)に含まれるsuite index
+NIBBLE_SUITES: tuple[tuple[int, ...], ...] = tuple(
+    tuple(s for s in range(4) if nib >> s & 1) for nib in range(16))
+# NIBBLE_SUBMASKS[nib][n]: nibの部分集合のうちn枚のもの
+NIBBLE_SUBMASKS: tuple[tuple[tuple[int, ...], ...], ...] = tuple(
+    tuple(tuple(sub for sub in range(1, 16) if sub & ~nib == 0 and sub.bit_count() == n) for n in range(5))
+    for nib in range(16))
+
+
+class MoveOrder(StrEnum):
+    """`iter_ordered_moves`の並び順"""
+    weakest = auto()
+    strongest = auto()
+
+
+class Move(NamedTuple):
+    """1回に出すカードの組み合わせです．
+
+    Attributes:
+        mask(int): 出すカードのbitmask
+        regularity(CardsRegularity): one, equal, sequenceのいずれか
+        rank(int): 組み合わせの強さ．sequenceの場合は最も弱い位置のrank，jokerのみの場合は`JOKER_RANK`
+        size(int): 枚数
+    """
+    mask: int
+    regularity: CardsRegularity
+    rank: int
+    size: int
+
+    def beats(self, field: Move | None) -> bool:
+        """場(`field`)に対してこのMoveを出せるかを返します．"""
+        if field is None:
+            return True
+        return self.regularity == field.regularity and self.size == field.size and self.rank > field.rank
+
+
+def classify(mask: int) -> Move | None:
+    """bitmaskを組み合わせとして解釈します．どの組み合わせにもならない場合はNoneを返します．"""
+    size = mask.bit_count()
+    if not size:
+        return None
+    normal = mask & NORMAL_MASK
+    jokers = size - normal.bit_count()
+    if not normal:
+        return Move(mask, CardsRegularity.one if size == 1 else CardsRegularity.equal, JOKER_RANK, size)
+    lo = (normal & -normal).bit_length() - 1
+    lo_rank = lo >> 2
+    hi_rank = (normal.bit_length() - 1) >> 2
+    if size == 1:
+        return Move(mask, CardsRegularity.one, lo_rank, 1)
+    if lo_rank == hi_rank:
+        return Move(mask, CardsRegularity.equal, lo_rank, size)
+    if size >= MIN_SEQUENCE and not normal & ~SUITE_INDEX_MASKS[lo & 3]:
+        gaps = hi_rank - lo_rank + 1 - (size - jokers)
+        if gaps <= jokers:
+            extra = jokers - gaps
+            rank = lo_rank - (extra - min(extra, RANK_NUM - 1 - hi_rank))
+            if rank >= 0:
+                return Move(mask, CardsRegularity.sequence, rank, size)
+    return None
+
+
+def default_allowed(field: Move | None) -> int:
+    return ALL_RANKS if field is None else ABOVE[field.rank]
+
+
+@lru_cache(maxsize=None)
+def rank_cards(allowed: int) -> int:
+    """rankのbitmaskを，そのrankのカードのbitmaskに変換します．"""
+    mask = 0
+    for rank in range(JOKER_RANK + 1):
+        if allowed >> rank & 1:
+            mask |= RANK_MASKS[rank]
+    return mask
+
+
+def profile(mask: int) -> tuple[list[int], list[int], int]:
+    """手札をrankごとのnibble，suiteごとのrun bitmask，jokerの枚数に分解します．"""
+    nibbles = [mask >> (rank * 4) & 0xF for rank in range(RANK_NUM)]
+    runs = [0, 0, 0, 0]
+    for rank, nib in enumerate(nibbles):
+        for s in NIBBLE_SUITES[nib]:
+            runs[s] |= 1 << rank
+    return nibbles, runs, (mask & JOKER_MASK).bit_count()
+
+
+def iter_ones(mask: int, field: Move | None = None, reverse: bool = False,
+              allowed: int | None = None) -> Iterator[Move]:
+    """1枚出しを弱い順(`reverse`の場合は強い順)に返します．jokerは枚数によらず1つです．"""
+    if allowed is None:
+        allowed = default_allowed(field)
+    normal = mask & NORMAL_MASK & rank_cards(allowed)
+    joker = bool(mask & JOKER_MASK) and bool(allowed >> JOKER_RANK & 1)
+    if reverse:
+        if joker:
+            yield Move(JOKER_FILL[1], CardsRegularity.one, JOKER_RANK, 1)
+        while normal:
+            cid = normal.bit_length() - 1
+            yield Move(1 << cid, CardsRegularity.one, cid >> 2, 1)
+            normal ^= 1 << cid
+        return
+    while normal:
+        low = normal & -normal
+        yield Move(low, CardsRegularity.one, (low.bit_length() - 1) >> 2, 1)
+        normal ^= low
+    if joker:
+        yield Move(JOKER_FILL[1], CardsRegularity.one, JOKER_RANK, 1)
+
+
+def iter_equals(mask: int, field: Move | None = None, nibbles: list[int] | None = None,
+                reverse: bool = False, allowed: int | None = None) -> Iterator[Move]:
+    """同じrankの組み合わせ(2枚以上)を弱い順(`reverse`の場合は強い順)に返します．"""
+    if nibbles is None:
+        nibbles = [mask >> (rank * 4) & 0xF for rank in range(RANK_NUM)]
+    if allowed is None:
+        allowed = default_allowed(field)
+    jokers = (mask & JOKER_MASK).bit_count()
+    joker_only = jokers >= MIN_EQUAL and allowed >> JOKER_RANK & 1 and (field is None or field.size == jokers)
+    if reverse and joker_only:
+        yield Move(JOKER_MASK, CardsRegularity.equal, JOKER_RANK, jokers)
+    for rank in (range(RANK_NUM - 1, -1, -1) if reverse else range(RANK_NUM)):
+        nib = nibbles[rank]
+        if not nib or not allowed >> rank & 1:
+            continue
+        shift = rank * 4
+        for used in range(jokers + 1):
+            if field is None:
+                counts = range(max(1, MIN_EQUAL - used), 5)
+            elif 1 <= field.size - used <= 4:
+                counts = (field.size - used,)
+            else:
+                continue
+            for n in counts:
+                for sub in NIBBLE_SUBMASKS[nib][n]:
+                    yield Move(sub << shift | JOKER_FILL[used], CardsRegularity.equal, rank, n + used)
+    if not reverse and joker_only:
+        yield Move(JOKER_MASK, CardsRegularity.equal, JOKER_RANK, jokers)
+
+
+def iter_sequences(mask: int, field: Move | None = None, runs: list[int] | None = None,
+                   reverse: bool = False, allowed: int | None = None) -> Iterator[Move]:
+    """同じsuiteの連続した3枚以上の組み合わせを，弱い順(開始rank, suite, 枚数の順)に返します．
+    `reverse`の場合は開始rankの強い順に返します．
+
+    jokerは欠けている位置だけでなく，手札にあるカードの代わりにも使います．
+    """
+    if runs is None:
+        runs = profile(mask)[1]
+    if allowed is None:
+        allowed = default_allowed(field)
+    jokers = (mask & JOKER_MASK).bit_count()
+    starts = range(RANK_NUM - MIN_SEQUENCE + 1)
+    for start in (reversed(starts) if reverse else starts):
+        if not allowed >> start & 1:
+            continue
+        for s, run in enumerate(runs):
+            if run >> start == 0:
+                continue
+            bottom = run >> start & 1
+            present: list[int] = []
+            missing = 0
+            for end in range(start, RANK_NUM):
+                if run >> end & 1:
+                    present.append(1 << (end * 4 + s))
+                else:
+                    missing += 1
+                    if missing > jokers:
+                        break
+                length = end - start + 1
+                if length < MIN_SEQUENCE or len(present) < 2:
+                    continue
+                if field is not None and length != field.size:
+                    if length > field.size:
+                        break
+                    continue
+                # 一番下がjokerの解釈は，上に伸ばせない場合のみ
+                if end == RANK_NUM - 1:
+                    removable = present
+                elif bottom:
+                    removable = present[1:]
+                else:
+                    continue
+                cards = sum(present)
+                for replaced in range(min(jokers - missing, len(present) - 2) + 1):
+                    for drop in combinations(removable, replaced):
+                        yield Move(cards - sum(drop) | JOKER_FILL[missing + replaced],
+                                   CardsRegularity.sequence, start, length)
+
+
+def iter_moves(mask: int, field: Move | None = None, allowed: int | None = None,
+               shapes: int = ALL_SHAPES) -> Iterator[Move]:
+    """`field`に対して出せる組み合わせを全て返します．順序はsequence, equal, oneです．
+
+    Args:
+        mask: 手札のbitmask
+        field: 場の組み合わせ，ない場合は None
+        allowed: 出せるrankのbitmask．Noneの場合は場より大きいrank
+        shapes: 出せる組み合わせ(`CardsRegularity.value`)のbitmask
+    """
+    if field is None:
+        nibbles, runs, _ = profile(mask)
+        if shapes >> CardsRegularity.sequence.value & 1:
+            yield from iter_sequences(mask, None, runs, allowed=allowed)
+        if shapes >> CardsRegularity.equal.value & 1:
+            yield from iter_equals(mask, None, nibbles, allowed=allowed)
+        if shapes >> CardsRegularity.one.value & 1:
+            yield from iter_ones(mask, allowed=allowed)
+    elif field.regularity == CardsRegularity.one:
+        yield from iter_ones(mask, field, allowed=allowed)
+    elif field.regularity == CardsRegularity.equal:
+        yield from iter_equals(mask, field, allowed=allowed)
+    elif field.regularity == CardsRegularity.sequence:
+        yield from iter_sequences(mask, field, allowed=allowed)
+    else:
+        raise ValueError(f"field doesn't match any pattern: {field}")
+
+
+def iter_ordered_moves(mask: int, field: Move | None = None,
+                       order: MoveOrder | Callable[[Move], Any] = MoveOrder.weakest,
+                       allowed: int | None = None, shapes: int = ALL_SHAPES) -> Iterator[Move]:
+    """`field`に対して出せる組み合わせを，`order`の順に必要な分だけ返します．
+
+    `weakest`/`strongest`の場合は，組み合わせの種類ごとに強さ順に生成したものをmergeするため，
+    最初の1つを取り出すのに全ての候補を作成しません．
+    `order`にkey関数を渡した場合は，全ての候補を生成した上でheapから小さい順に取り出します．
+
+    Args:
+        mask: 手札のbitmask
+        field: 場の組み合わせ，ない場合は None
+        order: `MoveOrder`またはMoveを受け取るkey関数
+        allowed: 出せるrankのbitmask．Noneの場合は場より大きいrank
+        shapes: 出せる組み合わせ(`CardsRegularity.value`)のbitmask
+
+    Returns:
+        Iterator[Move]
+    """
+    if not isinstance(order, MoveOrder):
+        heap = [(order(move), i, move) for i, move in enumerate(iter_moves(mask, field, allowed, shapes))]
+        heapq.heapify(heap)
+        while heap:
+            yield heapq.heappop(heap)[2]
+        return
+    reverse = order == MoveOrder.strongest
+    if field is None:
+        nibbles, runs, _ = profile(mask)
+        generators = []
+        if shapes >> CardsRegularity.sequence.value & 1:
+            generators.append(iter_sequences(mask, None, runs, reverse, allowed))
+        if shapes >> CardsRegularity.equal.value & 1:
+            generators.append(iter_equals(mask, None, nibbles, reverse, allowed))
+        if shapes >> CardsRegularity.one.value & 1:
+            generators.append(iter_ones(mask, None, reverse, allowed))
+        yield from heapq.merge(*generators, key=attrgetter("rank"), reverse=reverse)
+    elif field.regularity == CardsRegularity.one:
+        yield from iter_ones(mask, field, reverse, allowed)
+    elif field.regularity == CardsRegularity.equal:
+        yield from iter_equals(mask, field, None, reverse, allowed)
+    elif field.regularity == CardsRegularity.sequence:
+        yield from iter_sequences(mask, field, None, reverse, allowed)
+    else:
+        raise ValueError(f"field doesn't match any pattern: {field}")
+
+
+def has_move(mask: int, field: Move | None = None, allowed: int | None = None, shapes: int = ALL_SHAPES) -> bool:
+    """`field`に対して出せる組み合わせが1つでもあるかを返します．"""
+    return next(iter_moves(mask, field, allowed, shapes), None) is not None
+
+
+def generate_moves(mask: int, field: Move | None = None, allowed: int | None = None,
+                   shapes: int = ALL_SHAPES) -> list[Move]:
+    return list(iter_moves(mask, field, allowed, shapes))
+
+
+class MoveIndex:
+    """手札から作れる全ての組み合わせを，(regularity, size)ごとにrank順で保持します．
+
+    手札は減る一方なので，配られた時に1度だけ列挙し，その後はカードが出されるたびに
+    手札のbitmaskを更新するだけです．出せなくなった組み合わせは，参照した時に取り除きます(lazy deletion)．
+    場に対して出せる組み合わせは，該当するbucketを二分探索して求めます．
+
+    Args:
+        mask(int): 手札のbitmask
+    """
+
+    def __init__(self, mask: int):
+        self.__mask = mask
+        self.__buckets: dict[tuple[CardsRegularity, int], list[Move]] = {}
+        self.__ranks: dict[tuple[CardsRegularity, int], list[int]] = {}
+        self.__dirty: set[tuple[CardsRegularity, int]] = set()
+        for move in iter_moves(mask):
+            self.__buckets.setdefault((move.regularity, move.size), []).append(move)
+        for key, bucket in self.__buckets.items():
+            self.__ranks[key] = [move.rank for move in bucket]
+
+    @property
+    def mask(self) -> int:
+        return self.__mask
+
+    def remove(self, mask: int):
+        """手札から`mask`のカードを取り除きます．"""
+        self.__mask = difference(self.__mask, mask)
+        self.__dirty.update(self.__buckets)
+
+    def __bucket(self, key: tuple[CardsRegularity, int]) -> list[Move]:
+        bucket = self.__buckets.get(key)
+        if bucket is None:
+            return []
+        if key in self.__dirty:
+            hand = self.__mask
+            bucket = [move for move in bucket if contains(hand, move.mask)]
+            self.__buckets[key] = bucket
+            self.__ranks[key] = [move.rank for move in bucket]
+            self.__dirty.discard(key)
+        return bucket
+
+    def __beating(self, key: tuple[CardsRegularity, int], field: Move | None, allowed: int | None) -> list[Move]:
+        bucket = self.__bucket(key)
+        if not bucket:
+            return bucket
+        if allowed is not None:
+            if allowed == ALL_RANKS:
+                return bucket
+            return [move for move in bucket if allowed >> move.rank & 1]
+        if field is None:
+            return bucket
+        return bucket[bisect_right(self.__ranks[key], field.rank):]
+
+    def iter_moves(self, field: Move | None = None,
+                   order: MoveOrder | Callable[[Move], Any] | None = None,
+                   allowed: int | None = None, shapes: int = ALL_SHAPES) -> Iterator[Move]:
+        """`field`に対して出せる組み合わせを返します．`order`の意味は`iter_ordered_moves`と同じです．
+
+        Noneの場合は，(regularity, size)ごとにrank順で返します．
+        `allowed`を指定した場合は，二分探索の代わりにrankのbitmaskで絞り込みます．
+        """
+        if field is None:
+            buckets = [self.__beating(key, None, allowed) for key in list(self.__buckets)
+                       if shapes >> key[0].value & 1]
+        else:
+            buckets = [self.__beating((field.regularity, field.size), field, allowed)]
+        if order is None:
+            for bucket in buckets:
+                yield from bucket
+        elif not isinstance(order, MoveOrder):
+            heap = [(order(move), i, move) for i, move in enumerate(m for bucket in buckets for m in bucket)]
+            heapq.heapify(heap)
+            while heap:
+                yield heapq.heappop(heap)[2]
+        elif order == MoveOrder.strongest:
+            yield from heapq.merge(*(reversed(bucket) for bucket in buckets), key=attrgetter("rank"), reverse=True)
+        else:
+            yield from heapq.merge(*buckets, key=attrgetter("rank"))
+
+    def has_move(self, field: Move | None = None, allowed: int | None = None, shapes: int = ALL_SHAPES) -> bool:
+        return next(self.iter_moves(field, None, allowed, shapes), None) is not None
+
+
+if __name__ == '__main__':
+    from millionaire.libs.match.cards import Cards
+
+    hand = Cards.from_list_str(["sp3", "sp4", "sp6", "di6", "he6", "jo0"])
+    for move in generate_moves(hand.mask):
+        print(move.regularity.name, move.rank, Cards.from_mask(move.mask))
+    print(classify(Cards.from_list_str(["sp4", "sp5", "jo0"]).mask))
@@ -1,10 +1,19 @@
+import io
+import random
+from typing import Any, BinaryIO, Callable
 from uuid import UUID
-from datetime import datetime
+from datetime import datetime, timezone
 from ulid import ULID
 
+from millionaire.libs.match import card_bits, endgame
+from millionaire.libs.match.card import decode_mask
 from millionaire.libs.match.cards import Cards
+from millionaire.libs.match.history import SNAPSHOT_INTERVAL, MatchLogReader, MatchLogWriter, load
+from millionaire.libs.match.moves import MAX_MOVE_SIZE, Move, MoveOrder, classify
 from millionaire.libs.match.player import Player
+from millionaire.libs.match.rules import Rules, compile_rules
 from millionaire.libs.match.settings import Settings
+from millionaire.libs.match.state import NO_SEAT, PlayState
 from millionaire.libs.room.user import UserManager
 from millionaire.models.history import History
 from millionaire.schemas.message import OutPlayMessage
@@ -14,19 +23,50 @@ from millionaire.schemas.msg_types import PlayMsgTypes
 class Play:
     """このクラスは，ゲーム進行のメインプログラムです．
     このクラスでは，ゲーム進行に必要なメソッドを全て持ちますが，実行タイミングは，MatchRoomに一任されています．
+
+    手番は`players`の順に回ります．手番のplayerは`put`でカードを出すかパスします．
+    場のカードを出したplayer以外が全員パスすると場が流れ，最後にカードを出したplayerから再開します．
+    規則は`settings`から作成時に1度だけ`Rules`へ変換します．
+    Attributes:
+        field(Cards | None): 場のカード，流れた後は None
+        field_owner(UUID | None): 場のカードを出したplayer
+        ranking(list[UUID]): 上がった順のplayer
+        rules(Rules): `settings`を変換した規則
+        revolution(bool): 革命中か
+        lock(int): 縛られているsuite indexのbitmask
+        seed(int): カードを配る乱数のseed
+        created_at(datetime): 試合を作った時刻(UTC)
+        ended_at(datetime | None): 試合が終わった時刻(UTC)
+        log(MatchLogWriter | None): `record`で設定したlog
     """
-    def __init__(self, players: list[Player], settings: Settings):
+    def __init__(self, players: list[Player], settings: Settings, seed: int | None = None):
         self.cards = Cards()
         self.play_id: UUID = ULID().to_uuid()
-        self.created_at: datetime = datetime.now()
+        self.created_at: datetime = datetime.now(timezone.utc)
         self.players: dict[UUID, Player] = {player.uid: player for player in players}
         self.settings = settings
+        self.rules: Rules = compile_rules(settings)
+        self.__order: list[UUID] = [player.uid for player in players]
+        self.__turn: int = 0
+        self.field: Cards | None = None
+        self.__field_move: Move | None = None
+        self.field_owner: UUID | None = None
+        self.ranking: list[UUID] = []
+        self.revolution = False
+        self.lock = 0
+        self.seed: int = random.getrandbits(63) if seed is None else seed
+        self.ended_at: datetime | None = None
+        self.log: MatchLogWriter | None = None
 
-    def to_models(self):
+    def to_models(self) -> History:
+        """終了した試合の`History`を返します．"""
         return History(
             id=self.play_id,
             created_at=self.created_at,
-            users=[player.uid for player in self.players.values()]
+            ended_at=self.ended_at or datetime.now(timezone.utc),
+            users=[str(uid) for uid in self.__order],
+            ranking=[str(uid) for uid in self.ranking],
+            seed=self.seed,
         )
 
     @classmethod
@@ -35,20 +75,255 @@ class Play:
         settings = Settings()
         return cls(players, settings)
 
+    def record(self, stream: BinaryIO, snapshot_interval: int = SNAPSHOT_INTERVAL) -> MatchLogWriter:
+        """以降の配布，手，場が流れたことを`stream`にbinary logとして追記します．
+
+        `snapshot_interval`手ごとに状態のsnapshotも追記します．配る前でなくても，途中の状態から記録を始められます．
+        """
+        self.log = MatchLogWriter(stream, snapshot_interval)
+        self.log.begin(self.play_id, self.created_at, self.seed, self.settings, self.__order)
+        if any(player.cards for player in self.players.values()):
+            self.log.snapshot(self.to_state())
+        return self.log
+
+    def snapshot(self) -> bytes:
+        """現在の状態だけを持つbinary logを返します．`from_log`で別のprocessに試合を移せます．"""
+        stream = io.BytesIO()
+        writer = MatchLogWriter(stream)
+        writer.begin(self.play_id, self.created_at, self.seed, self.settings, self.__order)
+        writer.snapshot(self.to_state())
+        if self.is_over:
+            writer.end()
+        return stream.getvalue()
+
+    @classmethod
+    def from_log(cls, data: bytes | bytearray | memoryview | MatchLogReader) -> "Play":
+        """binary logの1試合を読み，最後の状態の`Play`を返します．playerの名前はuidです．
+
+        最後のsnapshotの後の手だけを適用します．`END`のない進行中の試合からも復元できます．
+        """
+        reader = data if isinstance(data, MatchLogReader) else MatchLogReader(data)
+        header, state = load(reader)
+        play = cls([Player(uid=uid, name=str(uid)) for uid in header.order], header.settings, header.seed)
+        play.play_id = header.play_id
+        play.created_at = header.created_at
+        if state is not None:
+            play.load_state(state)
+        return play
+
     def distribute_cards(self):
-        cards_set: tuple = Cards.create_cards(player_num=len(self.players))
+        cards_set: tuple = Cards.create_cards(player_num=len(self.players), deck=self.rules.deck,
+                                              rng=random.Random(self.seed))
         uids = list(self.players.keys())
         for i, cards in enumerate(cards_set):
-            for card in cards:
-                self.players[uids[i]].cards += card
+            self.players[uids[i]].cards += cards
+        if self.log is not None:
+            self.log.deal(self.players[uid].cards.mask for uid in self.__order)
+
+    @property
+    def order(self) -> list[UUID]:
+        """手番の順のuid．`PlayState`の座席はこのindexです．"""
+        return list(self.__order)
+
+    def to_state(self) -> PlayState:
+        """現在の状態を`PlayState`として返します．"""
+        seats = {uid: seat for seat, uid in enumerate(self.__order)}
+        passed = 0
+        for seat, uid in enumerate(self.__order):
+            if self.players[uid].passed:
+                passed |= 1 << seat
+        return PlayState(
+            hands=tuple(self.players[uid].cards.mask for uid in self.__order),
+            field=0 if self.field is None else self.field.mask,
+            owner=seats.get(self.field_owner, NO_SEAT),
+            passed=passed,
+            turn=self.__turn,
+            ranking=tuple(seats[uid] for uid in self.ranking),
+            revolution=self.revolution,
+            lock=self.lock,
+        )
+
+    def load_state(self, state: PlayState):
+        """`PlayState`の状態に戻します．"""
+        for seat, uid in enumerate(self.__order):
+            player = self.players[uid]
+            player.cards = Cards.from_mask(state.hands[seat])
+            player.passed = bool(state.passed >> seat & 1)
+        self.__field_move = state.field_move
+        self.field = None if self.__field_move is None else Cards.from_move(self.__field_move)
+        self.field_owner = None if state.owner == NO_SEAT else self.__order[state.owner]
+        self.__turn = state.turn
+        self.ranking = [self.__order[seat] for seat in state.ranking]
+        self.revolution = state.revolution
+        self.lock = state.lock
+
+    @property
+    def turn(self) -> UUID:
+        """手番のplayerのuid"""
+        return self.__order[self.__turn]
+
+    @property
+    def field_move(self) -> Move | None:
+        return self.__field_move
+
+    @property
+    def is_over(self) -> bool:
+        return len(self.ranking) >= len(self.__order) - 1
+
+    def __check(self, uid: UUID, mask: int) -> Move | None:
+        if self.is_over:
+            raise ValueError("the match is over")
+        if uid != self.turn:
+            raise ValueError(f"it's not {uid}'s turn")
+        if not mask:
+            if self.field is None:
+                raise ValueError("can't pass when the field is empty")
+            return None
+        if not card_bits.contains(self.players[uid].cards.mask, mask):
+            raise KeyError(f"{uid} doesn't have all of the cards")
+        move = classify(mask)
+        if move is None or not self.rules.is_legal(move, self.__field_move, self.revolution, self.lock):
+            raise ValueError(f"{Cards.from_mask(mask)} can't be put on {self.field}")
+        return move
+
+    def validate(self, uid: UUID, cards: list[str]) -> Move | None:
+        """`InPlayMessage.cards`を`Cards`を作らずに検証し，出す組み合わせを返します．空の場合はパス(None)です．
+
+        文字列をbitmaskに変換し，手札に含まれるかを1回のbit演算で，組み合わせと場との比較を`Rules`のtableで判定します．
+
+        Raises:
+            ValueError: 手番でない場合，正規のカードでない場合，または規則上出せない組み合わせの場合
+            KeyError: 手札にないカードが含まれる場合
+        """
+        if len(cards) > MAX_MOVE_SIZE:
+            raise ValueError(f"too many cards: {len(cards)}")
+        return self.__check(uid, decode_mask(cards))
+
+    def put(self, uid: UUID, cards: Cards | None):
+        """手番のplayerがカードを出します．`cards`がNoneまたは空の場合はパスです．
+
+        Args:
+            uid: 手番のplayerのuid
+            cards: 出すカード
+
+        Raises:
+            ValueError: 手番でない場合，場が流れた後にパスした場合，または規則上出せない組み合わせの場合
+            KeyError: 手札にないカードが含まれる場合
+        """
+        self.put_move(uid, self.__check(uid, cards.mask if cards else 0))
+
+    def put_move(self, uid: UUID, move: Move | None):
+        """`validate`で検証済みの組み合わせを出します．Noneの場合はパスです．"""
+        if self.log is not None:
+            self.log.move(move)
+        player = self.players[uid]
+        cut = False
+        if move is None:
+            player.passed = True
+        else:
+            played = Cards.from_move(move)
+            player.discard(played)
+            self.revolution, self.lock, cut = self.rules.after(move, self.__field_move, self.revolution, self.lock)
+            self.field = played
+            self.__field_move = move
+            self.field_owner = uid
+            if not player.cards:
+                self.ranking.append(uid)
+        self.__next_turn(cut)
+        if self.log is not None and self.log.snapshot_due and not self.is_over:
+            self.log.snapshot(self.to_state())
+
+    def candidate(self, uid: UUID, order: MoveOrder | Callable[[Move], Any] | None = None) -> Cards | None:
+        """playerが規則上出せる組み合わせを`order`の順に1つ返します．出せない場合はNone(パス)です．"""
+        player = self.players[uid]
+        if player.passed:
+            return None
+        move = next(self.rules.iter_moves(player.move_index, self.__field_move, self.revolution, self.lock, order),
+                    None)
+        return None if move is None else Cards.from_move(move)
+
+    def hint(self, uid: UUID, endgame_cards: int = endgame.ENDGAME_CARDS) -> Cards | None:
+        """playerに勧める手を返します．Noneはパスです．
+
+        手番のplayerから他のplayerの手札が全て分かり，合計が`endgame_cards`枚以下の場合は読み切った最善手を，
+        それ以外は`candidate`の手を返します．
+        """
+        if uid == self.turn and not self.is_over:
+            state = self.to_state()
+            seat = self.__turn
+            if endgame.is_determined(state, seat) and endgame.is_endgame(state, endgame_cards):
+                try:
+                    move = endgame.best_move(state, self.rules)
+                    return None if move is None else Cards.from_move(move)
+                except endgame.SearchLimitExceeded:
+                    pass
+        return self.candidate(uid)
+
+    def __is_active(self, uid: UUID) -> bool:
+        return uid not in self.ranking
+
+    def __reset_field(self):
+        self.field = None
+        self.__field_move = None
+        self.lock = 0
+        for player in self.players.values():
+            player.passed = False
+        if self.log is not None:
+            self.log.reset()
+
+    def __next_turn(self, cut: bool = False):
+        if self.is_over:
+            self.ranking.extend(uid for uid in self.__order if self.__is_active(uid))
+            self.ended_at = datetime.now(timezone.utc)
+            if self.log is not None:
+                self.log.end()
+            return
+        num = len(self.__order)
+        if cut:
+            # 8切りなどで場が流れた場合は，出したplayer(上がった場合は次のplayer)から再開する
+            self.__reset_field()
+            for i in range(num):
+                idx = (self.__turn + i) % num
+                if self.__is_active(self.__order[idx]):
+                    self.__turn = idx
+                    return
+        for i in range(1, num + 1):
+            idx = (self.__turn + i) % num
+            uid = self.__order[idx]
+            if not self.__is_active(uid) or self.players[uid].passed:
+                continue
+            if uid == self.field_owner:
+                # 他のplayerが全員パスしたので場が流れる
+                self.__reset_field()
+            self.__turn = idx
+            return
+        # 場のカードを出したplayerが上がっていて，残りが全員パスした場合
+        self.__reset_field()
+        owner = self.__order.index(self.field_owner)
+        for i in range(1, num + 1):
+            idx = (owner + i) % num
+            if self.__is_active(self.__order[idx]):
+                self.__turn = idx
+                return
 
     def snapshot_my_cards(self, uid: UUID) -> OutPlayMessage:
-        return OutPlayMessage(
+        # サーバーが作るmsgのため検証しない
+        return OutPlayMessage.model_construct(
             msg_type='out_play',
             play_type=PlayMsgTypes.my_cards,
             cards=self.players[uid].cards.to_list_str()
         )
 
+    def snapshot_move(self, move: Move | None) -> OutPlayMessage:
+        """出された組み合わせを全員に送るmsgです．Noneはパスです．"""
+        if move is None:
+            return OutPlayMessage.model_construct(msg_type='out_play', play_type=PlayMsgTypes.is_skipped, cards=[])
+        return OutPlayMessage.model_construct(
+            msg_type='out_play',
+            play_type=PlayMsgTypes.played_cards,
+            cards=Cards.from_move(move).to_list_str()
+        )
+
 
 if __name__ == '__main__':
     uids = [ULID().to_uuid() for _ in range(4)]
@@ -58,3 +333,7 @@ if __name__ == '__main__':
     )
     play.distribute_cards()
     print(play.snapshot_my_cards(uid=uids[1]).json())
+    while not play.is_over:
+        player = play.players[play.turn]
+        play.put(player.uid, play.hint(player.uid))
+    print([play.players[uid].name for uid in play.ranking])
@@ -1,5 +1,9 @@
+from typing import Any, Callable
 from uuid import UUID
+from millionaire.libs.match import card_bits
 from millionaire.libs.match.cards import Cards
+from millionaire.libs.match.moves import Move, MoveIndex, MoveOrder
+from millionaire.libs.match.rules import STANDARD, Rules
 
 
 class Player:
@@ -7,6 +11,7 @@ class Player:
     Notes:
         self.passedはプライベート属性に変更予定です．
         各ターンのカードの選択はこのクラスが単独で行います．
+        出せる組み合わせは`MoveIndex`に保持し，手札が減った分だけ更新します．
     """
 
     def __init__(self, uid: UUID, name: str):
@@ -15,29 +20,67 @@ class Player:
         # self.connection_status = ???
         self.cards = Cards()
         self.passed = False
+        self.__move_index: MoveIndex | None = None
 
     def __len__(self):
         return self.cards.__len__()
 
-    def play_cards(self, played_cards: Cards = None) -> Cards | None:
-        """ played_cardsに基づいて，出せる候補の中から１つを返します．
+    @property
+    def move_index(self) -> MoveIndex:
+        """現在の手札に対する`MoveIndex`を返します．
+
+        手札が減っただけの場合は差分を取り除き，増えた場合(配られた場合など)は作り直します．
+        """
+        mask = self.cards.mask
+        index = self.__move_index
+        if index is None or not card_bits.contains(index.mask, mask):
+            index = self.__move_index = MoveIndex(mask)
+        elif index.mask != mask:
+            index.remove(card_bits.difference(index.mask, mask))
+        return index
+
+    def discard(self, cards: Cards):
+        """出したカードを手札から取り除きます．`MoveIndex`は次に参照した時に更新されます．
+
+        Raises:
+            KeyError: 手札にないカードが含まれる場合
+        """
+        self.cards.remove_played(cards)
+
+    def play_cards(self, played_cards: Cards = None,
+                   order: MoveOrder | Callable[[Move], Any] | None = None,
+                   rules: Rules = STANDARD, revolution: bool = False, lock: int = 0) -> Cards | None:
+        """ played_cardsに基づいて，規則上出せる候補の中から１つを返します．
 
         カードを出せる場合に，Cardsクラスのインスタンスを返します．
-        返せない場合はNoneを返します．
+        返せない場合はNoneを返します．候補は最初の1つだけを生成します．
+        `Play.candidate`と同じく，候補は`rules.iter_moves`で絞り込みます．
 
         Args:
             played_cards(Cards):
                 最新の場のカードのリスト，ない場合は None
+            order(MoveOrder | Callable | None):
+                候補の順序．Noneの場合はsequence, equal, oneの順
+            rules(Rules): 規則(`Play.rules`)
+            revolution(bool): 革命中か
+            lock(int): 縛られているsuite indexのbitmask
         Returns:
             Cards: one of candidate cards sets
             None: means that the player selected pass operation
+        Raises:
+            ValueError: played_cardsがどの組み合わせにもならない場合
         """
         if self.passed:
             return None
-        candidate_cards_set = self.cards.lookfor_candidate_cards_set(played_cards)
-        if candidate_cards_set:
-            return candidate_cards_set[0]
-        return None
+        field = None
+        if played_cards is not None:
+            field = played_cards.to_move()
+            if field is None:
+                raise ValueError(f"cards don't match any pattern. played_cards: {played_cards}")
+        move = next(rules.iter_moves(self.move_index, field, revolution, lock, order), None)
+        if move is None:
+            return None
+        return Cards.from_move(move)
 
 
 if __name__ == '__main__':
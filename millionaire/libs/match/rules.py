@@ -0,0 +1,175 @@
+"""`Settings`を試合ごとに1度だけlookup tableへ変換(compile)した規則です．
+
+手の生成と検証は規則のflagを見て分岐せず，`Rules`のtableを引くだけです．
+    * beats[revolution][場のrank]: 出せるrankのbitmask(革命，joker返し)
+    * strength[revolution][rank]: 強さの順序
+    * shapes: 出せる組み合わせ(`CardsRegularity.value`)のbitmask
+    * revolution: 革命になる(regularity, 枚数)
+    * cut: 含むと場が流れるカードのbitmask(8切り)
+    * suit_lock: 縛り．同じsuiteの組み合わせが続くと，場が流れるまでそのsuiteしか出せない
+
+`Rules`は不変でhash可能なため，`endgame`のtransposition tableのkeyやprocess poolへの引数にできます．
+同じ設定のcompile結果は共有されます．
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+from logging import getLogger
+from typing import Any, Callable, Iterator, NamedTuple
+
+from millionaire.libs.match import card_bits, moves
+from millionaire.libs.match.card_bits import JOKER_FILL, JOKER_RANK, RANK_NUM, SUITE_INDEX_MASKS
+from millionaire.libs.match.card_types import CardNumber, CardsRegularity, CardSuite
+from millionaire.libs.match.moves import ALL_RANKS, ALL_SHAPES, Move, MoveIndex, MoveOrder
+from millionaire.libs.match.settings import Settings
+
+logger = getLogger(__name__)
+
+EQUAL_MAX = 4 + card_bits.JOKER_NUM
+
+
+def suits(mask: int) -> int:
+    """jokerを除いたカードのsuite indexのbitmask(4bit)"""
+    result = 0
+    for index, suite_mask in enumerate(SUITE_INDEX_MASKS):
+        if mask & suite_mask:
+            result |= 1 << index
+    return result
+
+
+class Rules(NamedTuple):
+    """compile済みの規則です．各tableはmoduleのdocstringを参照してください．deckは使用するカードのbitmaskです．"""
+    deck: int
+    shapes: int
+    beats: tuple[tuple[int, ...], tuple[int, ...]]
+    strength: tuple[tuple[int, ...], tuple[int, ...]]
+    revolution: frozenset[tuple[CardsRegularity, int]]
+    cut: int
+    suit_lock: bool
+
+    def allowed(self, field: Move | None, revolution: bool = False) -> int:
+        """場に対して出せるrankのbitmask"""
+        return ALL_RANKS if field is None else self.beats[revolution][field.rank]
+
+    def is_legal(self, move: Move, field: Move | None, revolution: bool = False, lock: int = 0) -> bool:
+        """`move`を場に出せるかを返します．"""
+        if not self.shapes >> move.regularity.value & 1:
+            return False
+        if lock and suits(move.mask) & ~lock:
+            return False
+        if field is None:
+            return True
+        return move.regularity == field.regularity and move.size == field.size and \
+            bool(self.beats[revolution][field.rank] >> move.rank & 1)
+
+    def iter_moves(self, hand: int | MoveIndex, field: Move | None = None, revolution: bool = False,
+                   lock: int = 0, order: MoveOrder | Callable[[Move], Any] | None = None) -> Iterator[Move]:
+        """手札(bitmaskまたは`MoveIndex`)から場に出せる組み合わせを返します．
+
+        革命中の`MoveOrder`は，`strength`をkeyとした順序に置き換えます．
+        """
+        if field is not None and not self.shapes >> field.regularity.value & 1:
+            return iter(())
+        allowed = self.allowed(field, revolution)
+        if revolution and isinstance(order, MoveOrder):
+            strength = self.strength[True]
+            sign = 1 if order == MoveOrder.weakest else -1
+            order = lambda move: sign * strength[move.rank]  # noqa: E731
+        if isinstance(hand, MoveIndex):
+            candidates = hand.iter_moves(field, order, allowed, self.shapes)
+        elif order is None:
+            candidates = moves.iter_moves(hand, field, allowed, self.shapes)
+        else:
+            candidates = moves.iter_ordered_moves(hand, field, order, allowed, self.shapes)
+        if not lock:
+            return candidates
+        return (move for move in candidates if not suits(move.mask) & ~lock)
+
+    def after(self, move: Move, field: Move | None, revolution: bool = False,
+              lock: int = 0) -> tuple[bool, int, bool]:
+        """`move`を出した後の(革命中か, 縛りのsuite, 場が流れるか)を返します．"""
+        if (move.regularity, move.size) in self.revolution:
+            revolution = not revolution
+        if self.suit_lock and field is not None and not lock:
+            played = suits(move.mask)
+            if played and played == suits(field.mask):
+                lock = played
+        return revolution, lock, bool(move.mask & self.cut)
+
+
+def _beats(revolution: bool, joker_over_joker: bool) -> tuple[int, ...]:
+    table = []
+    for rank in range(RANK_NUM):
+        if revolution:
+            table.append(((1 << rank) - 1) | 1 << JOKER_RANK)
+        else:
+            table.append(moves.ABOVE[rank])
+    table.append(1 << JOKER_RANK if joker_over_joker else 0)
+    return tuple(table)
+
+
+def _strength(revolution: bool) -> tuple[int, ...]:
+    if revolution:
+        return tuple(RANK_NUM - 1 - rank for rank in range(RANK_NUM)) + (JOKER_RANK,)
+    return tuple(range(JOKER_RANK + 1))
+
+
+@lru_cache(maxsize=None)
+def _compile(number_of_joker: int, suites: tuple[CardSuite, ...], use_sequence: bool, use_equal: bool,
+             revolution: int, eight_cut: bool, suit_lock: bool, joker_over_joker: bool) -> Rules:
+    deck = JOKER_FILL[number_of_joker]
+    for suite in suites:
+        deck |= card_bits.SUITE_MASKS[suite]
+    shapes = ALL_SHAPES
+    if not use_sequence:
+        shapes &= ~(1 << CardsRegularity.sequence.value)
+    if not use_equal:
+        shapes &= ~(1 << CardsRegularity.equal.value)
+    triggers = frozenset()
+    if revolution and use_equal:
+        triggers = frozenset((CardsRegularity.equal, size) for size in range(revolution, EQUAL_MAX + 1))
+    return Rules(
+        deck=deck,
+        shapes=shapes,
+        beats=(_beats(False, joker_over_joker), _beats(True, joker_over_joker)),
+        strength=(_strength(False), _strength(True)),
+        revolution=triggers,
+        cut=card_bits.NUMBER_MASKS[CardNumber.EIGHT] if eight_cut else 0,
+        suit_lock=suit_lock,
+    )
+
+
+def compile_rules(settings: Settings) -> Rules:
+    """`settings`を`Rules`に変換します．同じ設定の場合は同じインスタンスを返します．
+
+    Raises:
+        ValueError: jokerの枚数が範囲外の場合，または使用するsuiteがない場合
+    """
+    if not 0 <= settings.number_of_joker <= card_bits.JOKER_NUM:
+        raise ValueError(f"number_of_joker must be between 0 and {card_bits.JOKER_NUM}")
+    suites = tuple(suite for suite, used in ((CardSuite.SPADE, settings.use_spade),
+                                             (CardSuite.CLOVER, settings.use_clover),
+                                             (CardSuite.DIAMOND, settings.use_diamond),
+                                             (CardSuite.HEART, settings.use_heart)) if used)
+    if not suites:
+        raise ValueError("at least one suite must be used")
+    return _compile(settings.number_of_joker, suites, settings.use_sequence, settings.use_equal,
+                    settings.revolution, settings.eight_cut, settings.suit_lock, settings.joker_over_joker)
+
+
+STANDARD = compile_rules(Settings())
+
+
+if __name__ == '__main__':
+    from millionaire.libs.match.cards import Cards
+
+    settings = Settings()
+    settings.revolution = 4
+    settings.eight_cut = True
+    rules = compile_rules(settings)
+    hand = Cards.from_list_str(["sp3", "cl3", "di3", "he3", "sp8", "sp9", "jo0"])
+    field = Cards.from_list_str(["sp5"]).to_move()
+    for revolution in (False, True):
+        print(revolution, [str(Cards.from_move(move)) for move in rules.iter_moves(hand.mask, field, revolution)])
+    print(rules.after(Cards.from_list_str(["sp3", "cl3", "di3", "he3"]).to_move(), None))
+    print(rules.after(Cards.from_list_str(["sp8"]).to_move(), field))
@@ -1,7 +1,15 @@
 class Settings:
-    """
-    Notes:
-        TODO: 属性はまだプログラム上で無効です．
+    """試合の規則です．`millionaire.libs.match.rules.compile_rules`で試合ごとに1度だけlookup tableに変換されます．
+
+    Attributes:
+        number_of_joker(int): jokerの枚数(0〜2)
+        use_spade, use_clover, use_heart, use_diamond(bool): 使用するsuite
+        use_sequence(bool): 階段を出せるか
+        use_equal(bool): 同じ数字の組み合わせを出せるか
+        revolution(int): 革命になる枚数．0の場合は革命なし
+        eight_cut(bool): 8切り
+        suit_lock(bool): 縛り
+        joker_over_joker(bool): 1枚のjokerに，もう1枚のjokerを出せるか
     """
     def __init__(self):
         self.number_of_joker = 2
@@ -9,3 +17,9 @@ class Settings:
         self.use_clover = True
         self.use_heart = True
         self.use_diamond = True
+        self.use_sequence = True
+        self.use_equal = True
+        self.revolution = 0
+        self.eight_cut = False
+        self.suit_lock = False
+        self.joker_over_joker = False
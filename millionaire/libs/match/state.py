@@ -0,0 +1,163 @@
+"""試合の状態を整数とbitmaskだけで表す，不変(immutable)でhash可能な型です．
+
+`Play`と同じ規則で手番を進めますが，`Player`や`Cards`を持たないため，
+探索やrollbackのために何千回とコピー・比較・cacheすることができます．
+座席(seat)は`Play.order`のindexです．規則は`Rules`で渡し，省略した場合は`STANDARD`です．
+"""
+from __future__ import annotations
+
+from typing import Iterator, NamedTuple
+
+from millionaire.libs.match import card_bits, moves
+from millionaire.libs.match.moves import Move
+from millionaire.libs.match.rules import STANDARD, Rules
+
+NO_SEAT = -1
+
+
+class PlayState(NamedTuple):
+    """
+    Attributes:
+        hands(tuple[int, ...]): 座席ごとの手札のbitmask
+        field(int): 場のカードのbitmask．流れた後は0
+        owner(int): 場のカードを出した座席．いない場合は`NO_SEAT`
+        passed(int): パスした座席のbitmask
+        turn(int): 手番の座席
+        ranking(tuple[int, ...]): 上がった順の座席
+        revolution(bool): 革命中か
+        lock(int): 縛られているsuite indexのbitmask．縛りがない場合は0
+    """
+    hands: tuple[int, ...]
+    field: int = 0
+    owner: int = NO_SEAT
+    passed: int = 0
+    turn: int = 0
+    ranking: tuple[int, ...] = ()
+    revolution: bool = False
+    lock: int = 0
+
+    @property
+    def is_over(self) -> bool:
+        return len(self.ranking) >= len(self.hands) - 1
+
+    @property
+    def field_move(self) -> Move | None:
+        return moves.classify(self.field)
+
+    def card_count(self) -> int:
+        """全員の手札の合計枚数"""
+        return sum(hand.bit_count() for hand in self.hands)
+
+
+class Undo(NamedTuple):
+    """`undo_move`で元に戻すための差分です．"""
+    seat: int
+    mask: int
+    field: int
+    owner: int
+    passed: int
+    ranking_len: int
+    revolution: bool = False
+    lock: int = 0
+
+
+def legal_moves(state: PlayState, rules: Rules = STANDARD) -> Iterator[Move | None]:
+    """手番の座席が選べる手を返します．場にカードがある場合は最後にパス(None)を返します．"""
+    yield from rules.iter_moves(state.hands[state.turn], state.field_move, state.revolution, state.lock)
+    if state.field:
+        yield None
+
+
+def _out_mask(ranking: tuple[int, ...]) -> int:
+    out = 0
+    for seat in ranking:
+        out |= 1 << seat
+    return out
+
+
+def _next_active(out: int, seat: int, num: int) -> int:
+    for i in range(1, num + 1):
+        nxt = (seat + i) % num
+        if not out >> nxt & 1:
+            return nxt
+    raise ValueError("no active seat")
+
+
+def apply_move(state: PlayState, move: Move | None, rules: Rules = STANDARD) -> tuple[PlayState, Undo]:
+    """手番の座席が`move`を出した(Noneの場合はパスした)後の状態を返します．
+
+    `move`は`legal_moves`の結果であることを前提とし，検証は行いません．
+    手札のtupleを1つ作り直す以外にコピーは行いません．
+
+    Returns:
+        tuple[PlayState, Undo]: 新しい状態と，元に戻すための差分
+    """
+    seat = state.turn
+    hands = state.hands
+    field = state.field
+    owner = state.owner
+    passed = state.passed
+    ranking = state.ranking
+    revolution = state.revolution
+    lock = state.lock
+    cut = False
+    mask = 0
+    if move is None:
+        passed |= 1 << seat
+    else:
+        mask = move.mask
+        revolution, lock, cut = rules.after(move, state.field_move, revolution, lock)
+        hand = card_bits.difference(hands[seat], mask)
+        hands = hands[:seat] + (hand,) + hands[seat + 1:]
+        field = mask
+        owner = seat
+        if not hand:
+            ranking = ranking + (seat,)
+    undo = Undo(seat, mask, state.field, state.owner, state.passed, len(state.ranking), state.revolution, state.lock)
+
+    num = len(hands)
+    out = _out_mask(ranking)
+    if len(ranking) >= num - 1:
+        ranking = ranking + tuple(s for s in range(num) if not out >> s & 1)
+        return PlayState(hands, field, owner, passed, seat, ranking, revolution, lock), undo
+    if cut:
+        # 8切りなどで場が流れた場合は，出した座席(上がった場合は次の座席)から再開する
+        nxt = seat if not out >> seat & 1 else _next_active(out, seat, num)
+        return PlayState(hands, 0, owner, 0, nxt, ranking, revolution, 0), undo
+    for i in range(1, num + 1):
+        nxt = (seat + i) % num
+        if (out | passed) >> nxt & 1:
+            continue
+        if nxt == owner:
+            # 他の座席が全員パスしたので場が流れる
+            field = 0
+            passed = 0
+            lock = 0
+        return PlayState(hands, field, owner, passed, nxt, ranking, revolution, lock), undo
+    # 場のカードを出した座席が上がっていて，残りが全員パスした場合
+    return PlayState(hands, 0, owner, 0, _next_active(out, owner, num), ranking, revolution, 0), undo
+
+
+def undo_move(state: PlayState, undo: Undo) -> PlayState:
+    """`apply_move`の前の状態に戻します．"""
+    hands = state.hands
+    if undo.mask:
+        seat = undo.seat
+        hands = hands[:seat] + (card_bits.union(hands[seat], undo.mask),) + hands[seat + 1:]
+    return PlayState(hands, undo.field, undo.owner, undo.passed, undo.seat, state.ranking[:undo.ranking_len],
+                     undo.revolution, undo.lock)
+
+
+if __name__ == '__main__':
+    from millionaire.libs.match.cards import Cards
+
+    start = PlayState(hands=tuple(cards.mask for cards in Cards.create_cards(player_num=4)))
+    current, history = start, []
+    while not current.is_over:
+        move = next(legal_moves(current))
+        current, undo = apply_move(current, move)
+        history.append(undo)
+    print(current.ranking, len(history))
+    while history:
+        current = undo_move(current, history.pop())
+    print(current == start, hash(current) == hash(start))
@@ -0,0 +1,147 @@
+"""modelをqueueで受け取り，まとめてDBへbulk insertします．
+
+room coroutineは`BatchWriter.submit`でqueueに入れるだけで，DBを待ちません．
+書き込みは`asyncio.to_thread`で別threadから行い，sessionはengineのconnection poolを再利用します．
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import defaultdict
+from logging import getLogger
+from typing import Any
+
+from sqlalchemy import insert
+from sqlalchemy.orm import sessionmaker
+
+from millionaire.db.base_class import Base
+
+logger = getLogger(__name__)
+
+_STOP = object()
+
+
+def to_row(model: Base) -> dict[str, Any]:
+    return {column.key: getattr(model, column.key) for column in model.__table__.columns}
+
+
+class BatchWriter:
+    """`batch_size`件たまるか，最初の1件から`flush_interval`秒経つとまとめて書き込みます．
+
+    書き込みのtaskは最初の`submit`(または`start`)で作成します．
+
+    Args:
+        session_factory: `millionaire.db.session.SessionLocal`など
+        batch_size: 1回のINSERTにまとめる最大件数
+        flush_interval: 最初の1件から書き込むまでの最大秒数
+
+    Attributes:
+        written(int): 書き込んだ件数
+        failed(int): 書き込みに失敗して破棄した件数
+    """
+
+    def __init__(self, session_factory: sessionmaker, batch_size: int = 100, flush_interval: float = 1.0):
+        self.__session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.__queue: asyncio.Queue | None = None
+        self.__task: asyncio.Task | None = None
+        self.written = 0
+        self.failed = 0
+
+    @property
+    def pending(self) -> int:
+        return 0 if self.__queue is None else self.__queue.qsize()
+
+    def start(self):
+        if self.__task is None:
+            self.__queue = asyncio.Queue()
+            self.__task = asyncio.create_task(self.__run(), name="BatchWriter.__run()")
+
+    def submit(self, model: Base):
+        """`model`を書き込み待ちのqueueに入れます．blockしません．"""
+        self.start()
+        self.__queue.put_nowait(model)
+
+    async def close(self):
+        """queueに残っている分を書き込んでから終了します．"""
+        if self.__task is None:
+            return
+        self.__queue.put_nowait(_STOP)
+        await self.__task
+        self.__task = None
+        self.__queue = None
+
+    async def __run(self):
+        loop = asyncio.get_running_loop()
+        queue = self.__queue
+        stopped = False
+        while not stopped:
+            first = await queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    model = await asyncio.wait_for(queue.get(), timeout)
+                except TimeoutError:
+                    break
+                if model is _STOP:
+                    stopped = True
+                    break
+                batch.append(model)
+            await self.__flush(batch)
+
+    async def __flush(self, batch: list[Base]):
+        try:
+            await asyncio.to_thread(self.write, batch)
+        except Exception:
+            logger.exception("failed to write %d rows", len(batch))
+            self.failed += len(batch)
+        else:
+            self.written += len(batch)
+            logger.debug("wrote %d rows", len(batch))
+
+    def write(self, models: list[Base]):
+        """modelの型ごとに1回のbulk insertで書き込みます．1つのtransactionで実行します．"""
+        rows: dict[type[Base], list[dict[str, Any]]] = defaultdict(list)
+        for model in models:
+            rows[type(model)].append(to_row(model))
+        with self.__session_factory() as session, session.begin():
+            for model_type, values in rows.items():
+                session.execute(insert(model_type), values)
+
+
+if __name__ == '__main__':
+    import tempfile
+    import time
+    from datetime import datetime, timezone
+    from uuid import uuid4
+
+    from sqlalchemy import func, select
+
+    from millionaire.db.session import create_db_engine, init_db
+    from millionaire.models.history import History
+
+    async def main():
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_db_engine(f"sqlite:///{directory}/history.db")
+            init_db(engine)
+            writer = BatchWriter(sessionmaker(bind=engine), batch_size=500, flush_interval=0.1)
+            start = time.perf_counter()
+            for _ in range(5000):
+                uids = [str(uuid4()) for _ in range(4)]
+                writer.submit(History(id=uuid4(), created_at=datetime.now(timezone.utc), ended_at=datetime.now(timezone.utc),
+                                      users=uids, ranking=uids, seed=0))
+            submitted = time.perf_counter()
+            await writer.close()
+            with sessionmaker(bind=engine)() as session:
+                count = session.scalar(select(func.count()).select_from(History))
+            print(f"submit: {(submitted - start) * 1e6 / 5000:.2f}us/row, total: {time.perf_counter() - start:.2f}s,"
+                  f" rows: {count}, written: {writer.written}")
+            engine.dispose()
+
+    asyncio.run(main())
@@ -0,0 +1,190 @@
+"""全roomの手番の期限(deadline)を1つで管理する階層型timing wheelです．
+
+roomやplayerごとに`asyncio.sleep`のtaskを作ると，試合数に比例してtaskとtimer heapが増えます．
+`TimingWheel`は`tick`秒単位のslotの輪を`levels`段重ねたもので，
+    * arm: 期限までのtick数から段とslotを計算し，slotのdictに入れる
+    * cancel: 入っているslotのdictから取り除く
+    * expire: 1tickごとに先頭の段の1slotを取り出す．上の段は1周ごとに1slotだけ下の段へ振り分け直す(cascade)
+のいずれも期限の数によらずO(1)です．期限切れはtickごとにまとめて返します．
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+from itertools import count
+from logging import getLogger
+from typing import Any, Callable, Hashable
+
+logger = getLogger(__name__)
+
+
+class Timer:
+    """`TimingWheel.arm`が返す期限です．`cancel`に渡すと取り消せます．
+
+    Attributes:
+        key: 期限切れを振り分けるkey(room_idなど)
+        value: 期限切れの時に一緒に返す値(uidなど)
+        expires(int): 期限のtick
+    """
+    __slots__ = ("key", "value", "expires", "_id", "_slot")
+
+    def __init__(self, key: Hashable, value: Any, expires: int, timer_id: int):
+        self.key = key
+        self.value = value
+        self.expires = expires
+        self._id = timer_id
+        self._slot: dict[int, Timer] | None = None
+
+    @property
+    def active(self) -> bool:
+        return self._slot is not None
+
+    def __repr__(self):
+        return f"Timer(key={self.key!r}, value={self.value!r}, expires={self.expires})"
+
+
+class TimingWheel:
+    """階層型timing wheelです．1段目は`tick`秒，k段目は`tick * slots ** k`秒単位のslotを持ちます．
+
+    `slots ** levels`tickより先の期限は最上段の最後のslotに入れ，cascadeの度に入れ直します．
+
+    Args:
+        tick: 期限の精度(秒)
+        slots: 1段のslot数(2の累乗)
+        levels: 段数
+        clock: 現在時刻(秒)を返す関数．省略時は`time.monotonic`
+
+    Attributes:
+        tick(float): 期限の精度(秒)
+    """
+
+    def __init__(self, tick: float = 0.1, slots: int = 64, levels: int = 4, clock: Callable[[], float] | None = None):
+        if slots < 2 or slots & (slots - 1):
+            raise ValueError("slots must be a power of 2")
+        if clock is None:
+            import time
+            clock = time.monotonic
+        self.tick = tick
+        self.__clock = clock
+        self.__origin = clock()
+        self.__bits = slots.bit_length() - 1
+        self.__mask = slots - 1
+        self.__levels = levels
+        self.__wheels: list[list[dict[int, Timer]]] = [[{} for _ in range(slots)] for _ in range(levels)]
+        self.__current = 0  # 次に処理するtick
+        self.__len = 0
+        self.__ids = count()
+
+    def __len__(self) -> int:
+        return self.__len
+
+    @property
+    def now(self) -> int:
+        """`clock`の現在時刻のtick"""
+        return int((self.__clock() - self.__origin) / self.tick)
+
+    def arm(self, key: Hashable, value: Any, delay: float) -> Timer:
+        """`delay`秒後の期限を登録します．期限は`tick`単位に切り上げます．"""
+        ticks = max(math.ceil((self.__clock() - self.__origin + delay) / self.tick), self.__current)
+        timer = Timer(key, value, ticks, next(self.__ids))
+        self.__insert(timer)
+        self.__len += 1
+        return timer
+
+    def cancel(self, timer: Timer | None) -> bool:
+        """期限を取り消します．既に期限切れまたは取り消し済みの場合はFalseを返します．"""
+        if timer is None or timer._slot is None:
+            return False
+        del timer._slot[timer._id]
+        timer._slot = None
+        self.__len -= 1
+        return True
+
+    def advance(self, until: int | None = None) -> list[Timer]:
+        """`until`(省略時は現在)のtickまで進め，期限切れの`Timer`を期限順に返します．"""
+        if until is None:
+            until = self.now
+        expired: list[Timer] = []
+        while self.__current <= until:
+            if not self.__len:
+                # 期限が1つもなければslotを1つずつ見る必要はない
+                self.__current = until + 1
+                break
+            index = self.__current & self.__mask
+            if not index:
+                self.__cascade(1)
+            slot = self.__wheels[0][index]
+            if slot:
+                timers = list(slot.values())
+                slot.clear()
+                for timer in timers:
+                    timer._slot = None
+                self.__len -= len(timers)
+                expired.extend(timers)
+            self.__current += 1
+        return expired
+
+    def __insert(self, timer: Timer):
+        delta = timer.expires - self.__current
+        bits, mask = self.__bits, self.__mask
+        for level in range(self.__levels):
+            if delta < 1 << bits * (level + 1):
+                slot = self.__wheels[level][timer.expires >> bits * level & mask]
+                break
+        else:
+            # 最上段の範囲を超える期限は，最上段の1周先(現在の直前のslot)に置き，cascadeで入れ直す
+            level = self.__levels - 1
+            slot = self.__wheels[level][(self.__current >> bits * level) - 1 & mask]
+        timer._slot = slot
+        slot[timer._id] = timer
+
+    def __cascade(self, level: int):
+        if level >= self.__levels:
+            return
+        index = self.__current >> self.__bits * level & self.__mask
+        if not index:
+            self.__cascade(level + 1)
+        slot = self.__wheels[level][index]
+        if slot:
+            timers = list(slot.values())
+            slot.clear()
+            for timer in timers:
+                self.__insert(timer)
+
+    async def run(self, callback: Callable[[list[Timer]], Any]):
+        """`tick`秒ごとに`advance`し，期限切れがあれば`callback`にまとめて渡します．cancelされるまで続けます．"""
+        while True:
+            await asyncio.sleep(self.tick)
+            expired = self.advance()
+            if expired:
+                try:
+                    callback(expired)
+                except Exception:
+                    logger.exception(f"failed to deliver {len(expired)} expired timers")
+
+
+if __name__ == '__main__':
+    import random
+    import time
+
+    clock = [0.0]
+    wheel = TimingWheel(tick=0.1, slots=8, levels=2, clock=lambda: clock[0])
+    rng = random.Random(0)
+    armed = [wheel.arm(i % 100, i, rng.uniform(0, 20)) for i in range(10000)]
+    cancelled = {timer._id for timer in armed[::3] if wheel.cancel(timer)}
+    fired = []
+    for step in range(1, 250):
+        clock[0] = step * 0.1
+        for timer in wheel.advance():
+            assert timer.expires <= wheel.now, (timer, wheel.now)
+            fired.append(timer)
+    print(len(fired) + len(cancelled) == len(armed), not {timer._id for timer in fired} & cancelled,
+          all(a.expires <= b.expires for a, b in zip(fired, fired[1:])), len(wheel))
+
+    wheel = TimingWheel()
+    start = time.perf_counter()
+    timers = [wheel.arm(i, None, 30.0) for i in range(100000)]
+    armed = time.perf_counter()
+    for timer in timers:
+        wheel.cancel(timer)
+    print(f"arm: {(armed - start) * 1e6 / len(timers):.2f}us, cancel: {(time.perf_counter() - armed) * 1e6 / len(timers):.2f}us")
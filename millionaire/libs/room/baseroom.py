@@ -1,14 +1,21 @@
 import asyncio
+import inspect
 from datetime import datetime
 from enum import Enum
-from typing import TypeVar
+from typing import TYPE_CHECKING, TypeVar
 from uuid import UUID
 
 from ulid import ULID
 
-from millionaire.libs.room.rooms_manager import RoomManager
 from millionaire.libs.room.user import UserManager
 from millionaire.schemas.message import Message
+import logging
+
+if TYPE_CHECKING:
+    # rooms_managerはroomの各classをimportするため，実行時にimportすると循環する
+    from millionaire.libs.room.rooms_manager import RoomManager
+
+logger = logging.getLogger(__name__)
 
 
 class RoomType(Enum):
@@ -20,21 +27,35 @@ class RoomType(Enum):
 class BaseRoom:
     """このクラスはRoomクラスの親クラスであり, Messageインスタンスの適切な受け渡し(Broker)を担います，
 
+    msgを処理するtaskは`start`で作成します．event loopの外でも作成できるよう，`__init__`では作成しません．
+    `msg_analyser`はcoroutine関数でもよく，その場合は送信を待ってから次のmsgを処理します．
     """
 
-    def __init__(self, room_type: RoomType, room_manager: RoomManager):
+    def __init__(self, room_type: RoomType, room_manager: "RoomManager"):
         self.__manager = room_manager
         self.__room_id: UUID = ULID().to_uuid()
         self.__created_at: datetime = datetime.now()
         self.room_type = room_type  # enumで定義
         self.__roommates: dict[UUID, UserManager] = dict()
         self.msg_in_que = asyncio.Queue()
-        self._msg_in_task = asyncio.create_task(self.msg_parser())
+        self._msg_in_task: asyncio.Task | None = None
 
     @property
     def room_id(self):
         return self.__room_id
 
+    @property
+    def manager(self) -> "RoomManager":
+        return self.__manager
+
+    @property
+    def roommates(self) -> dict[UUID, UserManager]:
+        return self.__roommates
+
+    def start(self):
+        if self._msg_in_task is None:
+            self._msg_in_task = asyncio.create_task(self.msg_parser(), name=f"{type(self).__name__}.msg_parser()")
+
     def add(self, user: UserManager):
         self.__roommates[user.uid] = user
 
@@ -47,7 +68,9 @@ class BaseRoom:
     async def msg_parser(self):
         while True:
             msg = await self.msg_in_que.get()  # from message_broker
-            self.msg_analyser(msg)
+            result = self.msg_analyser(msg)
+            if inspect.isawaitable(result):
+                await result
 
     def msg_analyser(self, msg: Message):
         raise NotImplementedError
@@ -55,4 +78,23 @@ class BaseRoom:
     async def send(self, msg: Message):
         await self.__manager.send(msg)
 
+    async def broadcast(self, payload, uids=None):
+        """`payload`を1度だけencodeして送ります．`uids`を省略した場合はroomの全員です．"""
+        await self.__manager.broadcast(payload, self.__roommates.keys() if uids is None else uids)
+
+    def arm_deadline(self, uid: UUID, timeout: float):
+        """`timeout`秒後に`uid`の手番の期限を切らします．期限切れは`on_deadlines`にまとめて届きます．"""
+        return self.__manager.arm_deadline(self.__room_id, uid, timeout)
+
+    def cancel_deadline(self, timer) -> bool:
+        return self.__manager.cancel_deadline(timer)
+
+    def on_deadlines(self, timers: list):
+        """期限切れになった`Timer`のlist．`Timer.value`はuidです．"""
+        logger.warning("%s ignored %d expired deadlines", type(self).__name__, len(timers))
+
+    def save(self, model):
+        """`model`をDBへの書き込み待ちに入れます．書き込みは待ちません．"""
+        self.__manager.save(model)
+
 Room = TypeVar("Room", bound=BaseRoom)
@@ -1,30 +1,138 @@
 import asyncio
+from typing import BinaryIO
 from uuid import UUID
 
+from millionaire.libs.match.bot import MonteCarloBot
+from millionaire.libs.match.cards import Cards
+from millionaire.libs.match.history import MatchLogWriter
+from millionaire.libs.match.moves import Move, MoveOrder, classify
 from millionaire.libs.match.play import Play
+from millionaire.libs.queue.timing_wheel import Timer
 from millionaire.libs.room.baseroom import BaseRoom, RoomType
-from millionaire.schemas.message import Message
+from millionaire.schemas.message import InPlayMessage, Message, RoomMessage
+from millionaire.schemas.msg_types import PlayMsgTypes, StatusTypes
 import logging
 
 logger = logging.getLogger(__name__)
+TURN_TIMEOUT = 30.0
 
 
 class MatchRoom(BaseRoom):
-    def __init__(self, room_manager, uids: list[UUID]):
+    """1試合を進行するroomです．
+
+    手番の期限が切れたplayerの手は`MonteCarloBot`がprocess poolで探索して出します．
+
+    出された手は`broadcast`で全員に，出したplayerには残りの手札を送ります．
+    試合が終わると全員に`StatusTypes.waiting`の`RoomMessage`を送ります．
+
+    `RoomManager.match_log_dir`が設定されている場合，試合の進行を`<play_id>.mlog`にbinary logとして追記し，
+    1手ごとにflushします．serverが落ちても`RoomManager.recover`で途中から再開できます．
+    終了した試合のlogは`RoomManager.archive_match_log`で移します．
+
+    Args:
+        room_manager: roomを管理する`RoomManager`
+        uids: 試合に参加するuser
+        play: logから復元した試合．省略時は`uids`で新しい試合を作り，カードを配ります
+    """
+    def __init__(self, room_manager, uids: list[UUID], play: Play | None = None):
         logger.info(f"match initialize...")
         super().__init__(RoomType.match, room_manager)
+        self.manager.register(self)
         for uid in uids:
-            self.__manager.move_user(uid, self.room_id)
-        self.__play = Play.from_user_manager(users=list(self.__roommates.values()))
-        self.play_task = asyncio.create_task(self.init_play())
+            self.manager.move_user(uid, self.room_id)
+        recovered = play is not None
+        self.__play = play if recovered else Play.from_user_manager(users=list(self.roommates.values()))
+        self.__log_stream: BinaryIO | None = self.manager.open_match_log(self.__play.play_id)
+        if self.__log_stream is not None:
+            if recovered:
+                # headerと配布は記録済みのため，続きだけを追記する
+                self.__play.log = MatchLogWriter(self.__log_stream)
+            else:
+                self.__play.record(self.__log_stream)
+        self.__deadline: Timer | None = None
+        self.__bot = MonteCarloBot(rules=self.__play.rules)
+        self.__auto_task: asyncio.Task | None = None
+        self.play_task = asyncio.create_task(self.init_play(deal=not recovered))
         # TODO: 試合終了後のコールバックを書く
 
-    def msg_analyser(self, msg: Message):
-        if not msg.msg_type != msg.msg_type.in_play:
-            logger.critical(f"msg_analyser got invalid type message {msg.msg_type}")
+    async def msg_analyser(self, msg: Message):
+        if not isinstance(msg.msg, InPlayMessage):
+            logger.critical(f"msg_analyser got invalid type message {type(msg.msg)}")
+            return
+        cards = [] if msg.msg.play_type == PlayMsgTypes.is_skipped else msg.msg.cards
+        try:
+            move = self.__play.validate(msg.uid, cards)
+        except (ValueError, KeyError) as exc:
+            # 不正な手が連続して送られても負荷にならないよう，文字列の組み立ては出力時まで遅延する
+            logger.info("uid: %s sent invalid play: %s", msg.uid, exc)
             return
+        self.__play.put_move(msg.uid, move)
+        logger.debug("uid: %s played: %s", msg.uid, move)
+        await self.__after_move(msg.uid, move)
+
+    def on_deadlines(self, timers: list[Timer]):
+        """手番の期限が切れたplayerの代わりに，botが選んだ手を出します．"""
+        for timer in timers:
+            if timer is not self.__deadline or self.__play.is_over or timer.value != self.__play.turn:
+                # 期限切れと同じtickに手が届いていた場合など
+                continue
+            if self.__auto_task is None or self.__auto_task.done():
+                self.__auto_task = asyncio.create_task(self.__auto_play(timer.value),
+                                                       name=f"MatchRoom.auto_play({timer.value})")
+
+    async def __auto_play(self, uid: UUID):
+        state = self.__play.to_state()
+        try:
+            move = await self.__bot.choose_async(state, state.turn)
+        except Exception:
+            logger.exception("bot failed to choose a move for uid: %s", uid)
+            cards = None if self.__play.field is not None else self.__play.candidate(uid, MoveOrder.weakest)
+            move = None if cards is None else classify(cards.mask)
+        cards = None if move is None else Cards.from_move(move)
+        if self.__play.is_over or self.__play.turn != uid or self.__play.to_state() != state:
+            # 探索中にplayerの手が届いた場合
+            logger.debug("uid: %s played while the bot was searching", uid)
+            return
+        logger.info("uid: %s timed out, auto played: %s", uid, cards)
+        self.__play.put(uid, cards)
+        await self.__after_move(uid, move)
+
+    async def __after_move(self, uid: UUID, move: Move | None):
+        """期限とlogを更新してから，手を送ります．送信を待つ間に次の手が届いても状態は更新済みです．"""
+        self.cancel_deadline(self.__deadline)
+        over = self.__play.is_over
+        if over:
+            self.__deadline = None
+            self.__close_log()
+            self.save(self.__play.to_models())
+        else:
+            self.__flush_log()
+            self.__deadline = self.arm_deadline(self.__play.turn, TURN_TIMEOUT)
+        if not self.roommates:
+            # logから復元した試合には接続が引き継がれない
+            return
+        await self.broadcast(self.__play.snapshot_move(move))
+        if move is not None and uid in self.roommates:
+            await self.send(Message.trusted(uid, type(self).__name__, self.__play.snapshot_my_cards(uid)))
+        if over:
+            await self.broadcast(RoomMessage.model_construct(msg_type='room', status=StatusTypes.waiting))
+
+    def __flush_log(self):
+        if self.__log_stream is not None:
+            self.__log_stream.flush()
 
+    def __close_log(self):
+        if self.__log_stream is not None:
+            self.__log_stream.close()
+            self.__log_stream = None
+            self.__play.log = None
+            self.manager.archive_match_log(self.__play.play_id)
 
-    async def init_play(self):
-        # TODO: match ライブラリと連携する
-        pass
+    async def init_play(self, deal: bool = True):
+        """カードを配って手札を送り，最初の手番の期限を設定します．復元した試合では配りません．"""
+        if deal:
+            self.__play.distribute_cards()
+            self.__flush_log()
+            for uid in self.roommates:
+                await self.send(Message.trusted(uid, type(self).__name__, self.__play.snapshot_my_cards(uid)))
+        self.__deadline = self.arm_deadline(self.__play.turn, TURN_TIMEOUT)
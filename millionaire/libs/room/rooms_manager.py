@@ -1,15 +1,23 @@
 import asyncio
+import os
+from pathlib import Path
+from typing import Awaitable, BinaryIO, Callable
 from uuid import UUID
 
+from millionaire.db.base_class import Base
+from millionaire.libs.match.play import Play
+from millionaire.libs.queue.batch_writer import BatchWriter
+from millionaire.libs.queue.timing_wheel import Timer, TimingWheel
 from millionaire.libs.room.baseroom import Room
 from millionaire.libs.room.match_room import MatchRoom
 from millionaire.libs.room.user import UserManager
 from millionaire.libs.room.waiting_room import WaitingRoom
-from millionaire.schemas.message import Message
+from millionaire.schemas.message import Broadcast, Message
 from millionaire.schemas.room_cmd import RoomCmd
 import logging
 
 logger = logging.getLogger(__name__)
+FINISHED_DIR = "finished"
 
 
 class RoomManager:
@@ -20,6 +28,11 @@ class RoomManager:
     Attributes:
         __room(asyncio.Queue): MessageBrokerと共通
         __user_to_room(asyncio.Queue): MessageBrokerと共通
+        deliver(Callable | None): 送信するmsgの渡し先．`MessageBroker`が設定します
+        __history_writer(BatchWriter | None): 試合の記録をまとめてDBに書き込みます
+        deadlines(TimingWheel): 全roomの手番の期限．期限切れはroomごとにまとめて`BaseRoom.on_deadlines`に渡します
+        match_log_dir(Path | None): 試合のbinary log(`<play_id>.mlog`)を置くdirectory．Noneの場合は記録しません．
+            終了した試合のlogは`FINISHED_DIR`へ移します
 
     """
     def __init__(
@@ -27,12 +40,20 @@ class RoomManager:
             # room_cmd_que: asyncio.Queue,
             user_to_room: dict[UUID, UUID],
             room: dict[UUID, Room],
-            out_msg_que: asyncio.Queue
+            history_writer: BatchWriter | None = None,
+            deadlines: TimingWheel | None = None,
+            match_log_dir: str | os.PathLike | None = None
     ):
         self.__room = room
+        self.__history_writer = history_writer
         self.__user_to_room = user_to_room
-        self.__out_msg_que = out_msg_que
+        self.deliver: Callable[[Message | Broadcast], Awaitable[None]] | None = None
         self.room_que = asyncio.Queue()
+        self.deadlines = TimingWheel() if deadlines is None else deadlines
+        self.__deadline_task: asyncio.Task | None = None
+        self.match_log_dir = None if match_log_dir is None else Path(match_log_dir)
+        if self.match_log_dir is not None:
+            self.match_log_dir.mkdir(parents=True, exist_ok=True)
         waiting_room = WaitingRoom(self)
         self.__room[waiting_room.room_id] = waiting_room
         self.__waiting_room_id = waiting_room.room_id
@@ -41,6 +62,51 @@ class RoomManager:
     def __await__(self):
         return
 
+    def start(self):
+        """登録済みのroomのtaskを作成し，途中で止まった試合を`recover`します．event loopの中で呼んでください．"""
+        for room in self.__room.values():
+            room.start()
+        self.recover()
+
+    def open_match_log(self, play_id: UUID) -> BinaryIO | None:
+        """試合のlogを追記で開きます．`match_log_dir`が設定されていない場合はNoneです．"""
+        if self.match_log_dir is None:
+            return None
+        return open(self.match_log_dir / f"{play_id}.mlog", "ab")
+
+    def archive_match_log(self, play_id: UUID) -> Path | None:
+        """終了した試合のlogを`FINISHED_DIR`へ移し，`recover`で読み直さないようにします．移した先のpathを返します．"""
+        if self.match_log_dir is None:
+            return None
+        path = self.match_log_dir / f"{play_id}.mlog"
+        if not path.exists():
+            return None
+        finished = self.match_log_dir / FINISHED_DIR
+        finished.mkdir(exist_ok=True)
+        return path.replace(finished / path.name)
+
+    def recover(self) -> list[MatchRoom]:
+        """`match_log_dir`の終わっていない試合をlogから復元し，roomを作り直します．
+
+        userの接続は引き継げないため，復元した試合は手番の期限切れで自動的に進み，終了後に記録されます．
+        壊れたlogは読み飛ばします．`END`まで書かれたlogは，移す前にserverが落ちた場合も`FINISHED_DIR`へ移します．
+        """
+        if self.match_log_dir is None:
+            return []
+        rooms = []
+        for path in sorted(self.match_log_dir.glob("*.mlog")):
+            try:
+                play = Play.from_log(path.read_bytes())
+            except ValueError:
+                logger.exception("failed to recover match log: %s", path)
+                continue
+            if play.is_over:
+                self.archive_match_log(play.play_id)
+                continue
+            logger.info("recovered match: %s from %s", play.play_id, path)
+            rooms.append(MatchRoom(self, [], play=play))
+        return rooms
+
     async def __que_task_func(self):
         while True:
             msg: RoomCmd = await self.room_que.get()
@@ -56,29 +122,83 @@ class RoomManager:
 
     def add_user(self, user: UserManager, room_id: UUID = None):
         if room_id is None:
-            self.__room[self.__waiting_room_id].add(user)
-            self.__user_to_room[user.uid] = self.__waiting_room_id
-        else:
-            self.__room[room_id].add(user)
-            self.__user_to_room[user.uid] = room_id
+            room_id = self.__waiting_room_id
+        room = self.__room[room_id]
+        room.add(user)
+        self.__user_to_room[user.uid] = room_id
+        user.room_que = room.msg_in_que
 
     def remove_user(self, user: UserManager):
-        room_id = self.__user_to_room[user.uid]
+        room_id = self.__user_to_room.pop(user.uid)
         self.__room[room_id].remove(user)
+        user.room_que = None
 
     def pop_user(self, uid: UUID):
-        room_id = self.__user_to_room[uid]
-        return self.__room[room_id].pop(uid)
+        room_id = self.__user_to_room.pop(uid)
+        user = self.__room[room_id].pop(uid)
+        user.room_que = None
+        return user
+
+    def register(self, room: Room):
+        """`room`を登録し，taskを作成します．userを移す前に呼んでください．"""
+        self.__room[room.room_id] = room
+        room.start()
 
     def create_room(self, uids: list[UUID] = None):
         if uids is None:
             uids = []
-        room = MatchRoom(self, uids)
-        self.__room[room.room_id] = room
+        return MatchRoom(self, uids)
 
     def move_user(self, uid: UUID, to_room_id: UUID):
         user = self.pop_user(uid)
         self.add_user(user, to_room_id)
 
     async def send(self, msg: Message):
-        await self.__out_msg_que.put(msg)
+        if self.deliver is None:
+            logger.warning(f"deliver is not set, message to {msg.uid} was discarded")
+            return
+        await self.deliver(msg)
+
+    async def broadcast(self, payload, uids):
+        """`payload`を1度だけencodeし，`uids`の全員に送ります．
+
+        Args:
+            payload(BaseModel | str): 送る内容．文字列はencode済みのJSONとして扱います．
+            uids(Iterable[UUID]): 送り先
+        """
+        if self.deliver is None:
+            logger.warning("deliver is not set, broadcast was discarded")
+            return
+        await self.deliver(Broadcast.encode(payload, uids))
+
+    def save(self, model: Base):
+        if self.__history_writer is None:
+            logger.warning(f"history writer is not set, {type(model).__name__} was discarded")
+            return
+        self.__history_writer.submit(model)
+
+    def arm_deadline(self, room_id: UUID, uid: UUID, timeout: float) -> Timer:
+        """`timeout`秒後に`uid`の手番の期限を切らします．期限を処理するtaskは最初の呼び出しで作成します．"""
+        if self.__deadline_task is None:
+            self.__deadline_task = asyncio.create_task(self.deadlines.run(self.__expire),
+                                                       name="RoomManager.deadlines")
+        return self.deadlines.arm(room_id, uid, timeout)
+
+    def cancel_deadline(self, timer: Timer | None) -> bool:
+        return self.deadlines.cancel(timer)
+
+    def __expire(self, timers: list[Timer]):
+        batches: dict[UUID, list[Timer]] = {}
+        for timer in timers:
+            batches.setdefault(timer.key, []).append(timer)
+        for room_id, batch in batches.items():
+            room = self.__room.get(room_id)
+            if room is None:
+                logger.debug("room: %s was closed before %d deadlines expired", room_id, len(batch))
+                continue
+            room.on_deadlines(batch)
+
+    async def close(self):
+        if self.__deadline_task is not None:
+            self.__deadline_task.cancel()
+            self.__deadline_task = None
@@ -1,13 +1,19 @@
+import asyncio
 from uuid import UUID
 
 from millionaire.schemas.msg_types import StatusTypes
 
 
 class UserManager:
+    """
+    Attributes:
+        room_que(asyncio.Queue | None): 今いるroomの`msg_in_que`．`RoomManager`がroomを移す時に更新します．
+    """
     def __init__(self, uid, status, name="alias"):
         self.uid: UUID = uid
         self.name = name
         self._status: StatusTypes = status
+        self.room_que: asyncio.Queue | None = None
 
     @property
     def status(self):
@@ -1,6 +1,7 @@
 from uuid import UUID
 
 from millionaire.libs.room.baseroom import BaseRoom, RoomType
+from millionaire.libs.room.user import UserManager
 from millionaire.schemas.message import Message, RoomMessage
 import logging
 
@@ -19,11 +20,17 @@ class WaitingRoom(BaseRoom):
         super().__init__(RoomType.waiting, room_manager)
         self.__matching_list: list[UUID] = []
 
+    def remove(self, user: UserManager):
+        super().remove(user)
+        # 切断したuserと試合を組まないよう，matchingからも外す
+        if user.uid in self.__matching_list:
+            self.__matching_list.remove(user.uid)
+
     def msg_analyser(self, msg: Message):
         if not isinstance(msg.msg, RoomMessage):
             logger.error(f"msg is invalid type {type(msg.msg)}")
             return
-        if msg.uid not in self.__roommates:
+        if msg.uid not in self.roommates:
             logger.critical(f"can't find uid {msg.uid} in waiting room "
                             f"msg {msg.json()}")
             return
@@ -37,15 +44,15 @@ class WaitingRoom(BaseRoom):
 
 
     def add_matching(self, uid: UUID):
-        user = self.__roommates.get(uid)
+        user = self.roommates.get(uid)
         user.status = StatusTypes.matching
         self.__matching_list.append(uid)
         logger.info(f"uid: {uid} is in matching que... Now waiting people: {len(self.__matching_list)}")
         if len(self.__matching_list) >= MIN_PLAYER_NUM:
-            self.__manager.create_room([self.__matching_list.pop() for _ in range(MIN_PLAYER_NUM)])
+            self.manager.create_room([self.__matching_list.pop() for _ in range(MIN_PLAYER_NUM)])
 
     def remove_matching(self, uid: UUID):
-        user = self.__roommates.get(uid)
+        user = self.roommates.get(uid)
         user.status = StatusTypes.waiting
         if user.uid in self.__matching_list:
             self.__matching_list.remove(uid)
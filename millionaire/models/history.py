@@ -1,10 +1,24 @@
-from pydantic import BaseModel
 from datetime import datetime
 from uuid import UUID
 
+from sqlalchemy import JSON, BigInteger, DateTime
+from sqlalchemy.orm import Mapped, mapped_column
 
-class History(BaseModel):
-    id: UUID
-    created_at: datetime
-    ended_at: datetime
-    users: list[UUID]
+from millionaire.db.base_class import Base
+
+
+class History(Base):
+    """終了した試合の記録です．
+
+    Attributes:
+        users: 手番の順のuid
+        ranking: 上がった順のuid
+        seed: カードを配った乱数のseed
+        created_at, ended_at: UTCの時刻
+    """
+    id: Mapped[UUID] = mapped_column(primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    ended_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    users: Mapped[list[str]] = mapped_column(JSON)
+    ranking: Mapped[list[str]] = mapped_column(JSON)
+    seed: Mapped[int] = mapped_column(BigInteger)
@@ -0,0 +1,203 @@
+"""websocketのsubprotocol`SUBPROTOCOL`で選べる，`millionaire.schemas.message`のbinary表現です．
+
+JSONの各msgと1対1に対応し，相互に変換できます．整数は全てlittle endianです．
+
+    in_play, out_play: msg_type(1) play_type(1) カードのbitmask(8)
+    room:              msg_type(1) status(1)
+    none:              msg_type(1) body(UTF-8)
+    batch:             `BATCH`(1) { 長さ(2) msg }*
+
+batchの各msgの長さは2byteのため，`MAX_PART_SIZE`(65535)byteまでです．`frames`は超えるmsgをbatchに入れず，
+単独のframeで送ります．
+カードは`card_bits`のbitmask(jokerは52番から詰める)で表すため，JSONの`cards`の順序は保たれず，
+`encode_mask`の順(弱い順)になります．binaryの接続でもtext frameのJSONは受け付けます．
+"""
+from __future__ import annotations
+
+import struct
+from datetime import datetime
+from logging import getLogger
+from typing import Annotated, Iterator
+from uuid import UUID
+
+from pydantic import Field, TypeAdapter
+
+from millionaire.libs.match.card import decode_mask, encode_mask
+from millionaire.libs.match.card_bits import FULL_MASK
+from millionaire.schemas.message import Broadcast, InPlayMessage, Message, NoneMessage, OutPlayMessage, RoomMessage
+from millionaire.schemas.msg_types import MsgTypes, PlayMsgTypes, StatusTypes
+
+logger = getLogger(__name__)
+
+SUBPROTOCOL = "millionaire.binary.v1"
+BATCH = 0xFF
+
+PLAY = struct.Struct("<BBQ")
+ROOM = struct.Struct("<BB")
+LENGTH = struct.Struct("<H")
+MAX_PART_SIZE = (1 << 8 * LENGTH.size) - 1
+
+# tagはindex．追加する場合は末尾に足してください
+MSG_TYPES: tuple[MsgTypes, ...] = (MsgTypes.none, MsgTypes.room, MsgTypes.in_play, MsgTypes.out_play)
+PLAY_TYPES: tuple[PlayMsgTypes, ...] = (PlayMsgTypes.my_cards, PlayMsgTypes.played_cards, PlayMsgTypes.is_skipped)
+STATUSES: tuple[StatusTypes, ...] = (StatusTypes.waiting, StatusTypes.matching, StatusTypes.playing)
+MSG_TAG = {msg_type: tag for tag, msg_type in enumerate(MSG_TYPES)}
+PLAY_TAG = {play_type: tag for tag, play_type in enumerate(PLAY_TYPES)}
+STATUS_TAG = {status: tag for tag, status in enumerate(STATUSES)}
+
+AnyMessage = Annotated[NoneMessage | InPlayMessage | OutPlayMessage | RoomMessage, Field(discriminator="msg_type")]
+any_message = TypeAdapter(AnyMessage)
+
+
+def encode(msg: NoneMessage | InPlayMessage | OutPlayMessage | RoomMessage) -> bytes:
+    """
+    Raises:
+        ValueError: `cards`に正規のカードでない文字列が含まれる場合
+    """
+    tag = MSG_TAG[MsgTypes(msg.msg_type)]
+    if isinstance(msg, (InPlayMessage, OutPlayMessage)):
+        return PLAY.pack(tag, PLAY_TAG[PlayMsgTypes(msg.play_type)], decode_mask(msg.cards))
+    if isinstance(msg, RoomMessage):
+        return ROOM.pack(tag, STATUS_TAG[StatusTypes(msg.status)])
+    return bytes((tag,)) + msg.body.encode()
+
+
+def decode(data: bytes | memoryview) -> NoneMessage | InPlayMessage | OutPlayMessage | RoomMessage:
+    """`encode`の逆です．tagとbitmaskは検証済みのため，modelは検証せずに作ります．
+
+    Raises:
+        ValueError: 壊れている，または不明なtagの場合
+    """
+    if not data:
+        raise ValueError("empty frame")
+    try:
+        msg_type = MSG_TYPES[data[0]]
+        if msg_type in (MsgTypes.in_play, MsgTypes.out_play):
+            _, play_tag, mask = PLAY.unpack(data)
+            if mask & ~FULL_MASK:
+                raise ValueError(f"invalid card mask: {mask:#x}")
+            model = InPlayMessage if msg_type == MsgTypes.in_play else OutPlayMessage
+            return model.model_construct(msg_type=msg_type.value, play_type=PLAY_TYPES[play_tag],
+                                         cards=encode_mask(mask))
+        if msg_type == MsgTypes.room:
+            _, status_tag = ROOM.unpack(data)
+            return RoomMessage.model_construct(msg_type=msg_type.value, status=STATUSES[status_tag])
+        return NoneMessage.model_construct(msg_type=msg_type.value, body=bytes(data[1:]).decode())
+    except (IndexError, struct.error, UnicodeDecodeError) as exc:
+        raise ValueError(f"invalid frame: {exc}") from None
+
+
+def from_json(data: str | bytes) -> bytes:
+    """JSONにencode済みのmsgをbinaryに変換します．
+
+    Raises:
+        pydantic.ValidationError: JSONが不正な場合
+    """
+    return encode(any_message.validate_json(data))
+
+
+def to_json(data: bytes | memoryview) -> str:
+    """binaryのmsgをJSONに変換します．"""
+    return decode(data).model_dump_json()
+
+
+def encode_payload(payload) -> bytes:
+    """`MessageProvider.send`に渡されるmsgをbinaryにします．`Broadcast`は最初の1回だけencodeします．
+
+    Raises:
+        ValueError: 正規のカードでない文字列を含むなど，binaryにできないmsgの場合
+    """
+    if isinstance(payload, Broadcast):
+        if payload.binary is None:
+            payload.binary = from_json(payload.data) if payload.payload is None else encode(payload.payload)
+        return payload.binary
+    if isinstance(payload, str):
+        return from_json(payload)
+    return encode(payload)
+
+
+def encode_batch(parts: list[bytes]) -> bytes:
+    """
+    Raises:
+        ValueError: `MAX_PART_SIZE`byteを超えるmsgが含まれる場合
+    """
+    for part in parts:
+        if len(part) > MAX_PART_SIZE:
+            raise ValueError(f"message too large for a batch: {len(part)} bytes")
+    return bytes((BATCH,)) + b"".join(LENGTH.pack(len(part)) + part for part in parts)
+
+
+def frames(parts: list[bytes]) -> Iterator[bytes]:
+    """encode済みのmsgを送るframeにします．複数の場合はbatchにまとめ，`MAX_PART_SIZE`byteを超えるmsgは単独で返します．"""
+    batch = []
+    for part in parts:
+        if len(part) <= MAX_PART_SIZE:
+            batch.append(part)
+            continue
+        if batch:
+            yield batch[0] if len(batch) == 1 else encode_batch(batch)
+            batch = []
+        yield part
+    if batch:
+        yield batch[0] if len(batch) == 1 else encode_batch(batch)
+
+
+def decode_batch(data: bytes | memoryview) -> list[NoneMessage | InPlayMessage | OutPlayMessage | RoomMessage]:
+    """1つのframeのmsgを返します．batchでない場合は1件です．
+
+    Raises:
+        ValueError: 壊れている場合
+    """
+    if not data or data[0] != BATCH:
+        return [decode(data)]
+    view = memoryview(data)
+    result = []
+    pos = 1
+    while pos < len(view):
+        if pos + LENGTH.size > len(view):
+            raise ValueError(f"truncated batch at {pos}")
+        (length,) = LENGTH.unpack_from(view, pos)
+        pos += LENGTH.size
+        if pos + length > len(view):
+            raise ValueError(f"truncated batch at {pos}")
+        result.append(decode(view[pos:pos + length]))
+        pos += length
+    return result
+
+
+def decode_message(uid: UUID, data: bytes | memoryview) -> Message:
+    """clientのbinaryのframeを`Message.from_client`と同じ`Message`にします．
+
+    Raises:
+        ValueError: frameが不正な場合
+    """
+    msg = decode(data)
+    if isinstance(msg, NoneMessage):
+        raise ValueError("clients can't send none messages")
+    return Message.model_construct(uid=uid, created_by="client", created_at=datetime.utcnow(),
+                                   msg_type=msg.msg_type, msg=msg)
+
+
+if __name__ == '__main__':
+    import json
+    from uuid import uuid4
+
+    messages = [
+        InPlayMessage(msg_type='in_play', play_type=PlayMsgTypes.played_cards, cards=["sp3", "he3", "jo0"]),
+        OutPlayMessage(msg_type='out_play', play_type=PlayMsgTypes.my_cards, cards=["sp1", "cl13", "di2"]),
+        RoomMessage(msg_type='room', status=StatusTypes.matching),
+        NoneMessage(msg_type='none', body="connection success"),
+    ]
+    for message in messages:
+        raw = encode(message)
+        text = message.model_dump_json()
+        assert from_json(text) == raw
+        assert sorted(json.loads(to_json(raw)).get("cards", [])) == sorted(json.loads(text).get("cards", []))
+        print(f"{len(text):3d} -> {len(raw):2d} bytes: {raw.hex()}")
+    assert decode_batch(encode_batch([encode(message) for message in messages])) == \
+        [decode(encode(message)) for message in messages]
+    large = encode(NoneMessage(msg_type='none', body="x" * MAX_PART_SIZE))
+    print([len(frame) for frame in frames([encode(messages[0]), large, encode(messages[1])])])
+    frame = encode(messages[0])
+    print(decode_message(uuid4(), frame).msg == Message.from_client(
+        uuid4(), json.dumps({"msg_type": "in_play", "msg": json.loads(to_json(frame))})).msg)
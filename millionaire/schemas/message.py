@@ -1,4 +1,4 @@
-from typing import Literal
+from typing import Hashable, Iterable, Literal
 from pydantic import BaseModel, Field
 from uuid import UUID
 from datetime import datetime
@@ -29,8 +29,59 @@ class RoomMessage(BaseModel):
     status: StatusTypes
 
 
-class Message(BaseModel):
+def snapshot_key(msg) -> Hashable | None:
+    """最新の1つだけ送ればよい状態のsnapshotのkeyです．それ以外のmsgはNoneです．
+
+    同じkeyのmsgが送られずに残っている場合，古い方は捨てられます．
     """
+    if isinstance(msg, OutPlayMessage) and msg.play_type == PlayMsgTypes.my_cards:
+        return PlayMsgTypes.my_cards
+    return None
+
+
+class Broadcast:
+    """複数のuidに同じ内容を送るための，encode済みのpayloadです．
+
+    Attributes:
+        uids(frozenset[UUID]): 送り先
+        data(str): JSONにencode済みのpayload．全ての送り先で同じ文字列を使います．
+        key(Hashable | None): `snapshot_key`
+        payload(BaseModel | None): encodeする前のmsg．encode済みの文字列から作った場合はNone
+        binary(bytes | None): binary protocolでencode済みのpayload．最初のbinaryの接続へ送る時に作ります．
+    """
+    __slots__ = ("uids", "data", "key", "payload", "binary")
+
+    def __init__(self, uids: frozenset[UUID], data: str, key: Hashable | None = None,
+                 payload: BaseModel | None = None):
+        self.uids = uids
+        self.data = data
+        self.key = key
+        self.payload = payload
+        self.binary: bytes | None = None
+
+    @classmethod
+    def encode(cls, payload: BaseModel | str, uids: Iterable[UUID]) -> "Broadcast":
+        """`payload`を1度だけJSONにencodeします．文字列はencode済みとしてそのまま使います．"""
+        if isinstance(payload, str):
+            return cls(frozenset(uids), payload)
+        return cls(frozenset(uids), payload.model_dump_json(), snapshot_key(payload), payload)
+
+
+class ClientFrame(BaseModel):
+    """clientから届くframeのうち，`Message`に使う部分です．
+
+    `msg`は`msg_type`で判別するため，JSONの文字列(bytes)から1回の検証で組み立てられます．
+    """
+    msg_type: MsgTypes = MsgTypes.none
+    msg: InPlayMessage | OutPlayMessage | RoomMessage = Field(discriminator="msg_type")
+
+    class Config:
+        use_enum_values = True
+
+
+class Message(BaseModel):
+    """`from_client`はclientのframeを検証し，`trusted`はサーバーが作成したmsgを検証せずに包みます．
+
     Attributes:
         uid (UUID):
         created_by (str):
@@ -46,8 +97,40 @@ class Message(BaseModel):
     class Config:
         use_enum_values = True
 
+    @classmethod
+    def from_client(cls, uid: UUID, data: str | bytes) -> "Message":
+        """clientのframe(JSON)をdictを経由せずに検証し，`Message`を返します．
+
+        Raises:
+            pydantic.ValidationError: frameが不正な場合
+        """
+        frame = ClientFrame.model_validate_json(data)
+        return cls.model_construct(uid=uid, created_by="client", created_at=datetime.utcnow(),
+                                   msg_type=frame.msg_type, msg=frame.msg)
+
+    @classmethod
+    def trusted(cls, uid: UUID, created_by: str,
+                msg: InPlayMessage | OutPlayMessage | RoomMessage) -> "Message":
+        """サーバーが作成した検証済みの`msg`を，もう1度検証せずに`Message`にします．"""
+        return cls.model_construct(uid=uid, created_by=created_by, created_at=datetime.utcnow(),
+                                   msg_type=msg.msg_type, msg=msg)
+
+
 if __name__ == '__main__':
     out_play_message = OutPlayMessage(msg_type='out_play', play_type=PlayMsgTypes.my_cards, cards=['sp1', 'sp3'])
     print(out_play_message.json())
     out_play_message = OutPlayMessage(msg_type='out_play', play_type=PlayMsgTypes.my_cards)
     print(out_play_message.json())
+
+    import timeit
+    from uuid import uuid4
+    import json
+
+    uid = uuid4()
+    frame = b'{"msg_type": "in_play", "msg": {"msg_type": "in_play", "play_type": "played_cards", "cards": ["sp3", "cl3"]}}'
+    fast_msg, slow_msg = Message.from_client(uid, frame), Message(uid=uid, created_by="client", **json.loads(frame))
+    assert fast_msg.model_dump(exclude={"created_at"}) == slow_msg.model_dump(exclude={"created_at"})
+    n = 20000
+    slow = timeit.timeit(lambda: Message(uid=uid, created_by="client", **json.loads(frame)), number=n)
+    fast = timeit.timeit(lambda: Message.from_client(uid, frame), number=n)
+    print(f"dict: {slow / n * 1e6:.2f}us, from_client: {fast / n * 1e6:.2f}us")
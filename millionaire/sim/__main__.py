@@ -0,0 +1,41 @@
+"""試合のシミュレーションを実行し，計測結果を表示します．
+
+Examples:
+    $ python -m millionaire.sim --games 10000 --workers 8
+    $ python -m millionaire.sim --games 1000 --workers 1 --json
+"""
+import argparse
+import json
+
+from millionaire.libs.match.moves import MoveOrder
+from millionaire.sim.simulator import simulate
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="python -m millionaire.sim", description="headless match simulator")
+    parser.add_argument("--games", type=int, default=1000, help="number of games")
+    parser.add_argument("--players", type=int, default=4, help="players per game")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=100, help="games per task")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--order", choices=[order.value for order in MoveOrder], default=None,
+                        help="bot move order (default: generator order)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    stats = simulate(games=args.games, player_num=args.players, workers=args.workers,
+                     batch_size=args.batch_size, seed=args.seed,
+                     order=None if args.order is None else MoveOrder(args.order))
+    report = stats.report()
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"games: {stats.games} turns: {stats.turns} elapsed: {stats.elapsed_ns / 1e9:.3f}s")
+    print(f"games/sec: {report['games_per_sec']:.1f} turns/sec: {report['turns_per_sec']:.1f}")
+    print(f"deal: {report['deal_us_per_game']:.2f}us/game "
+          f"decide: {report['decide_us_per_turn']:.2f}us/turn "
+          f"apply: {report['apply_us_per_turn']:.2f}us/turn")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""自己対戦の記録を，memory-mapできる列指向のshard(NumPyの`.npy`)として書き出します．
+
+1手(パスを含む)を1 recordとし，列ごとに1つの`.npy`を作成します．
+    game, turn, seat, players: 試合の番号，試合内の手番の番号，座席，人数
+    hand, field: 手番の座席の手札と場のbitmask(場が流れた後は0)
+    revolution, lock: 革命中か，縛りのsuite
+    chosen: 出したカードのbitmask(パスは0)
+    place, reward: その座席の最終順位(0が1位)と`endgame.payoff`の報酬
+    legal, legal_offsets: 選べた手(パスは0)を全recordで連結した配列と，recordごとの開始位置(record数+1)
+
+`Dataset`は各列を`np.load(mmap_mode="r")`で開くため，全体をメモリに読み込まずにsliceできます．
+shardはprocessごとに`shard_size` record単位で書き出し，一時directoryからrenameして完成させます．
+"""
+from __future__ import annotations
+
+import json
+import os
+import random
+import shutil
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from logging import getLogger
+from pathlib import Path
+from typing import Callable, Iterator
+
+import numpy as np
+
+from millionaire.libs.match.endgame import payoff
+from millionaire.libs.match.moves import Move
+from millionaire.libs.match.play import Play
+from millionaire.sim.simulator import create_play
+
+logger = getLogger(__name__)
+
+# 列名: (arrayのtypecode, numpyのdtype)
+COLUMNS: dict[str, tuple[str, np.dtype]] = {
+    "game": ("I", np.dtype(np.uint32)),
+    "turn": ("H", np.dtype(np.uint16)),
+    "seat": ("B", np.dtype(np.uint8)),
+    "players": ("B", np.dtype(np.uint8)),
+    "hand": ("Q", np.dtype(np.uint64)),
+    "field": ("Q", np.dtype(np.uint64)),
+    "revolution": ("B", np.dtype(np.uint8)),
+    "lock": ("B", np.dtype(np.uint8)),
+    "chosen": ("Q", np.dtype(np.uint64)),
+    "place": ("B", np.dtype(np.uint8)),
+    "reward": ("f", np.dtype(np.float32)),
+}
+LEGAL = ("legal", "Q", np.dtype(np.uint64))
+LEGAL_OFFSETS = ("legal_offsets", "q", np.dtype(np.int64))
+META = "meta.json"
+
+Policy = Callable[[list[Move | None], random.Random], Move | None]
+
+
+def random_policy(legal: list[Move | None], rng: random.Random) -> Move | None:
+    return rng.choice(legal)
+
+
+def weakest_policy(legal: list[Move | None], rng: random.Random) -> Move | None:
+    """パス以外で最もrankの低い手を出します．"""
+    return min(legal, key=lambda move: (move is None, 0 if move is None else move.rank))
+
+
+POLICIES: dict[str, Policy] = {"random": random_policy, "weakest": weakest_policy}
+
+
+class ShardWriter:
+    """recordを列ごとの`array`にためて，`shard_size`件ごとにshardとして書き出します．
+
+    Args:
+        directory: 出力先
+        prefix: shard名の接頭辞．processごとに異なる値にしてください．
+        shard_size: 1 shardのrecord数の目安．1試合の途中では区切りません．
+    """
+
+    def __init__(self, directory: str | os.PathLike, prefix: str, shard_size: int = 1 << 20):
+        self.directory = Path(directory)
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.shards: list[Path] = []
+        self.records = 0
+        self.__reset()
+
+    def __reset(self):
+        self.__columns = {name: array(code) for name, (code, _) in COLUMNS.items()}
+        self.__legal = array(LEGAL[1])
+        self.__offsets = array(LEGAL_OFFSETS[1], [0])
+
+    def __len__(self):
+        return len(self.__columns["game"])
+
+    def add_game(self, game: int, players: int, rows: list[tuple], ranking: tuple[int, ...]):
+        """1試合分のrecordを追加します．
+
+        Args:
+            game: 試合の番号
+            players: 人数
+            rows: (seat, hand, field, revolution, lock, legal, chosen)のlist
+            ranking: 上がった順の座席
+        """
+        places = {seat: place for place, seat in enumerate(ranking)}
+        rewards = payoff(ranking)
+        columns = self.__columns
+        for turn, (seat, hand, field, revolution, lock, legal, chosen) in enumerate(rows):
+            columns["game"].append(game)
+            columns["turn"].append(turn)
+            columns["seat"].append(seat)
+            columns["players"].append(players)
+            columns["hand"].append(hand)
+            columns["field"].append(field)
+            columns["revolution"].append(revolution)
+            columns["lock"].append(lock)
+            columns["chosen"].append(chosen)
+            columns["place"].append(places[seat])
+            columns["reward"].append(rewards[seat])
+            self.__legal.extend(legal)
+            self.__offsets.append(len(self.__legal))
+        if len(self) >= self.shard_size:
+            self.flush()
+
+    def flush(self) -> Path | None:
+        """ためたrecordをshardとして書き出します．recordがない場合はNoneを返します．"""
+        count = len(self)
+        if not count:
+            return None
+        name = f"{self.prefix}-{len(self.shards):05d}"
+        tmp = self.directory / f".{name}.tmp"
+        path = self.directory / name
+        tmp.mkdir(parents=True, exist_ok=True)
+        for column, (_, dtype) in COLUMNS.items():
+            np.save(tmp / f"{column}.npy", np.frombuffer(self.__columns[column], dtype=dtype))
+        np.save(tmp / f"{LEGAL[0]}.npy", np.frombuffer(self.__legal, dtype=LEGAL[2]))
+        np.save(tmp / f"{LEGAL_OFFSETS[0]}.npy", np.frombuffer(self.__offsets, dtype=LEGAL_OFFSETS[2]))
+        (tmp / META).write_text(json.dumps({"records": count, "legal": len(self.__legal)}))
+        if path.exists():
+            shutil.rmtree(path)
+        tmp.rename(path)
+        self.shards.append(path)
+        self.records += count
+        self.__reset()
+        return path
+
+
+def play_game(play: Play, rng: random.Random, policy: Policy = random_policy) -> tuple[list[tuple], tuple[int, ...]]:
+    """配られていない`play`を`policy`で最後まで進め，手番ごとのrecordと順位(座席)を返します．"""
+    play.distribute_cards()
+    seats = {uid: seat for seat, uid in enumerate(play.order)}
+    rules = play.rules
+    rows = []
+    while not play.is_over:
+        uid = play.turn
+        player = play.players[uid]
+        field = play.field_move
+        legal: list[Move | None] = list(rules.iter_moves(player.move_index, field, play.revolution, play.lock))
+        if field is not None:
+            legal.append(None)
+        move = policy(legal, rng)
+        rows.append((seats[uid], player.cards.mask, 0 if field is None else field.mask, play.revolution, play.lock,
+                     [0 if candidate is None else candidate.mask for candidate in legal],
+                     0 if move is None else move.mask))
+        play.put_move(uid, move)
+    return rows, tuple(seats[uid] for uid in play.ranking)
+
+
+def export_batch(directory: str | os.PathLike, prefix: str, games: int, first_game: int = 0, player_num: int = 4,
+                 seed: int | None = None, policy: str = "random", shard_size: int = 1 << 20) -> list[str]:
+    """`games`試合を1つのprocessで自己対戦し，shardを書き出します．書き出したshardのpathを返します．"""
+    rng = random.Random(seed)
+    writer = ShardWriter(directory, prefix, shard_size)
+    for game in range(first_game, first_game + games):
+        rows, ranking = play_game(create_play(player_num, seed=rng.getrandbits(63)), rng, POLICIES[policy])
+        writer.add_game(game, player_num, rows, ranking)
+    writer.flush()
+    return [str(path) for path in writer.shards]
+
+
+def export(directory: str | os.PathLike, games: int, player_num: int = 4, workers: int | None = None,
+           batch_size: int = 1000, seed: int | None = None, policy: str = "random",
+           shard_size: int = 1 << 20, overwrite: bool = False) -> list[str]:
+    """`games`試合をbatchに分割し，process poolで並列に自己対戦してshardを書き出します．
+
+    `Dataset`はdirectoryの全てのshardを読むため，既にshardがある場合は`overwrite`しない限り書き出しません．
+
+    Args:
+        directory: 出力先
+        games: 試合数
+        player_num: 1試合のplayer数
+        workers: process数．1の場合はprocess poolを使用しません．Noneの場合はCPU数
+        batch_size: 1回のtaskで実行する試合数．batchごとに別のshardになります．
+        seed: 乱数のseed．batchごとに`seed + batchの番号`を使用します．
+        policy: `POLICIES`のkey
+        shard_size: 1 shardのrecord数の目安
+        overwrite: 既にあるshardを削除してから書き出すか
+
+    Returns:
+        list[str]: 書き出したshardのpath
+
+    Raises:
+        ValueError: 不明な`policy`の場合
+        FileExistsError: `overwrite`でなく，`directory`に既にshardがある場合
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"unknown policy: {policy}")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    existing = [path.parent for path in Path(directory).glob(f"*/{META}") if not path.parent.name.startswith(".")]
+    if existing:
+        if not overwrite:
+            raise FileExistsError(f"{directory} already has {len(existing)} shards")
+        for shard in existing:
+            shutil.rmtree(shard)
+        logger.info("removed %d shards from %s", len(existing), directory)
+    starts = list(range(0, games, batch_size))
+    args = [(directory, f"shard-{i:05d}", min(batch_size, games - start), start, player_num,
+             None if seed is None else seed + i, policy, shard_size) for i, start in enumerate(starts)]
+    if workers == 1:
+        results = [export_batch(*arg) for arg in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(export_batch, *zip(*args)))
+    return [path for paths in results for path in paths]
+
+
+class Dataset:
+    """`export`で書き出したshardを，memory-mapで読み出します．
+
+    Args:
+        directory: shardのあるdirectory
+    """
+
+    def __init__(self, directory: str | os.PathLike):
+        self.shards = sorted(path.parent for path in Path(directory).glob(f"*/{META}")
+                             if not path.parent.name.startswith("."))
+        self.__cache: dict[tuple[int, str], np.ndarray] = {}
+        sizes = [json.loads((shard / META).read_text())["records"] for shard in self.shards]
+        self.__starts = np.cumsum([0] + sizes)
+
+    def __len__(self):
+        return int(self.__starts[-1])
+
+    def column(self, shard: int, name: str) -> np.ndarray:
+        """shardの列をmemory-mapで開きます．"""
+        key = (shard, name)
+        values = self.__cache.get(key)
+        if values is None:
+            values = self.__cache[key] = np.load(self.shards[shard] / f"{name}.npy", mmap_mode="r")
+        return values
+
+    def __locate(self, index: int) -> tuple[int, int]:
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        shard = int(np.searchsorted(self.__starts, index, side="right")) - 1
+        return shard, index - int(self.__starts[shard])
+
+    def legal_moves(self, index: int) -> np.ndarray:
+        """`index`番目のrecordで選べた手のbitmask(パスは0)"""
+        shard, local = self.__locate(index)
+        offsets = self.column(shard, LEGAL_OFFSETS[0])
+        return self.column(shard, LEGAL[0])[offsets[local]:offsets[local + 1]]
+
+    def __getitem__(self, index: int | slice) -> dict[str, np.ndarray]:
+        """recordの範囲を列ごとの配列で返します．選べた手は`legal`と，0から始まる`legal_offsets`です．
+
+        Raises:
+            IndexError: intの`index`が範囲外の場合
+        """
+        if isinstance(index, int):
+            if not -len(self) <= index < len(self):
+                raise IndexError(index)
+            index = slice(index, index + 1) if index >= 0 else slice(len(self) + index, len(self) + index + 1)
+        start, stop, step = index.indices(len(self))
+        if step != 1:
+            raise ValueError("step is not supported")
+        parts: dict[str, list[np.ndarray]] = {name: [] for name in (*COLUMNS, LEGAL[0], LEGAL_OFFSETS[0])}
+        base = 0
+        for shard in range(len(self.shards)):
+            lo = max(start, int(self.__starts[shard]))
+            hi = min(stop, int(self.__starts[shard + 1]))
+            if lo >= hi:
+                continue
+            lo -= int(self.__starts[shard])
+            hi -= int(self.__starts[shard])
+            for name in COLUMNS:
+                parts[name].append(self.column(shard, name)[lo:hi])
+            offsets = self.column(shard, LEGAL_OFFSETS[0])[lo:hi + 1]
+            parts[LEGAL[0]].append(self.column(shard, LEGAL[0])[offsets[0]:offsets[-1]])
+            parts[LEGAL_OFFSETS[0]].append(offsets[:-1] - offsets[0] + base)
+            base += int(offsets[-1] - offsets[0])
+        result = {name: np.concatenate(arrays) if arrays else np.empty(0, COLUMNS[name][1])
+                  for name, arrays in parts.items() if name in COLUMNS}
+        result[LEGAL[0]] = np.concatenate(parts[LEGAL[0]]) if parts[LEGAL[0]] else np.empty(0, LEGAL[2])
+        result[LEGAL_OFFSETS[0]] = np.concatenate(parts[LEGAL_OFFSETS[0]] + [np.array([base])]).astype(LEGAL_OFFSETS[2])
+        return result
+
+    def iter_batches(self, batch_size: int = 1 << 16) -> Iterator[dict[str, np.ndarray]]:
+        for start in range(0, len(self), batch_size):
+            yield self[start:start + batch_size]
+
+
+if __name__ == '__main__':
+    import argparse
+    import tempfile
+    import time
+
+    parser = argparse.ArgumentParser(prog="python -m millionaire.sim.dataset", description="self-play dataset export")
+    parser.add_argument("--output", "-o", default=None, help="output directory (default: a temporary directory)")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--shard-size", type=int, default=1 << 20)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--policy", choices=list(POLICIES), default="random")
+    parser.add_argument("--overwrite", action="store_true", help="remove existing shards in the output directory")
+    args = parser.parse_args()
+
+    output = args.output or tempfile.mkdtemp(prefix="millionaire-dataset-")
+    started = time.perf_counter()
+    shards = export(output, args.games, args.players, args.workers, args.batch_size, args.seed, args.policy,
+                    args.shard_size, args.overwrite)
+    elapsed = time.perf_counter() - started
+    dataset = Dataset(output)
+    print(f"{output}: {len(shards)} shards, {len(dataset)} records, {args.games / elapsed:.0f} games/sec")
+    head = dataset[:3]
+    print({name: values.tolist() for name, values in head.items() if name != "legal"})
@@ -0,0 +1,129 @@
+"""websocketを介さずに，`Play`と`Player`だけで試合を最後まで進めるシミュレータです．
+
+試合はbatchごとにprocess poolへ分配し，各processの計測結果を集計します．
+"""
+from __future__ import annotations
+
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Any, Callable
+from uuid import uuid4
+
+from millionaire.libs.match.moves import Move, MoveOrder
+from millionaire.libs.match.play import Play
+from millionaire.libs.match.player import Player
+from millionaire.libs.match.settings import Settings
+
+
+@dataclass
+class SimStats:
+    """シミュレーションの計測結果です．時間は全てnsです．
+
+    Attributes:
+        games: 試合数
+        turns: 手番の数(パスを含む)
+        deal_ns: カードを配るのにかかった時間
+        decide_ns: Playerが出すカードを決めるのにかかった時間
+        apply_ns: `Play.put`にかかった時間
+        elapsed_ns: 全体の経過時間(並列実行の場合はwall clock)
+    """
+    games: int = 0
+    turns: int = 0
+    deal_ns: int = 0
+    decide_ns: int = 0
+    apply_ns: int = 0
+    elapsed_ns: int = 0
+
+    def merge(self, other: SimStats):
+        self.games += other.games
+        self.turns += other.turns
+        self.deal_ns += other.deal_ns
+        self.decide_ns += other.decide_ns
+        self.apply_ns += other.apply_ns
+
+    def report(self) -> dict[str, Any]:
+        elapsed = self.elapsed_ns / 1e9 or float("nan")
+        per_turn = self.turns or float("nan")
+        return {
+            **asdict(self),
+            "games_per_sec": self.games / elapsed,
+            "turns_per_sec": self.turns / elapsed,
+            "deal_us_per_game": self.deal_ns / 1e3 / (self.games or float("nan")),
+            "decide_us_per_turn": self.decide_ns / 1e3 / per_turn,
+            "apply_us_per_turn": self.apply_ns / 1e3 / per_turn,
+        }
+
+
+def create_play(player_num: int = 4, settings: Settings | None = None, seed: int | None = None) -> Play:
+    players = [Player(uid=uuid4(), name=f"bot{i}") for i in range(player_num)]
+    return Play(players, settings or Settings(), seed)
+
+
+def run_game(play: Play, stats: SimStats | None = None,
+             order: MoveOrder | Callable[[Move], Any] | None = None) -> Play:
+    """配られていない`play`を，全員が`Play.candidate`で最後まで進めます．"""
+    if stats is None:
+        stats = SimStats()
+    clock = time.perf_counter_ns
+    started = clock()
+    play.distribute_cards()
+    stats.deal_ns += clock() - started
+    while not play.is_over:
+        player = play.players[play.turn]
+        started = clock()
+        cards = play.candidate(player.uid, order)
+        decided = clock()
+        play.put(player.uid, cards)
+        stats.apply_ns += clock() - decided
+        stats.decide_ns += decided - started
+        stats.turns += 1
+    stats.games += 1
+    return play
+
+
+def run_batch(games: int, player_num: int = 4, seed: int | None = None,
+              order: MoveOrder | None = None) -> SimStats:
+    """`games`試合を1つのprocessで続けて実行します．各試合のseedは`seed`で初期化した乱数から作ります．"""
+    rng = random.Random(seed)
+    stats = SimStats()
+    started = time.perf_counter_ns()
+    for _ in range(games):
+        run_game(create_play(player_num, seed=rng.getrandbits(63)), stats, order)
+    stats.elapsed_ns = time.perf_counter_ns() - started
+    return stats
+
+
+def simulate(games: int, player_num: int = 4, workers: int | None = None, batch_size: int = 100,
+             seed: int | None = None, order: MoveOrder | None = None) -> SimStats:
+    """`games`試合をbatchに分割し，process poolで並列に実行します．
+
+    Args:
+        games: 試合数
+        player_num: 1試合のplayer数
+        workers: process数．1の場合はprocess poolを使用しません．Noneの場合はCPU数
+        batch_size: 1回のtaskで実行する試合数
+        seed: 乱数のseed．batchごとに`seed + batchの番号`を使用します．
+        order: botが出すカードの順序
+
+    Returns:
+        SimStats: 全batchの合計
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    sizes = [min(batch_size, games - i) for i in range(0, games, batch_size)]
+    seeds = [None if seed is None else seed + i for i in range(len(sizes))]
+    total = SimStats()
+    started = time.perf_counter_ns()
+    if workers == 1:
+        for size, batch_seed in zip(sizes, seeds):
+            total.merge(run_batch(size, player_num, batch_seed, order))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for stats in executor.map(run_batch, sizes, [player_num] * len(sizes), seeds,
+                                      [order] * len(sizes)):
+                total.merge(stats)
+    total.elapsed_ns = time.perf_counter_ns() - started
+    return total
@@ -6,9 +6,10 @@ from starlette.websockets import WebSocket
 from millionaire.libs.room.baseroom import Room
 from millionaire.libs.room.rooms_manager import RoomManager
 from millionaire.libs.room.user import UserManager
-from millionaire.schemas.message import Message
+from millionaire.schemas.message import Broadcast, Message, snapshot_key
 from millionaire.schemas.msg_types import StatusTypes
 from millionaire.ws.message_provider import MessageProvider
+from millionaire.ws.send_buffer import OverflowPolicy, SendBuffer
 
 logger = getLogger(__name__)
 
@@ -16,9 +17,24 @@ logger = getLogger(__name__)
 class MessageBroker:
     """このクラスはサーバーに接続される全ての接続を保持し管理します．
     Fastapiのwebサーバー１つにつき１つのみ生成されます．
+
+    受信したmsgは`MessageProvider`から`route`で，userが今いるroomの`msg_in_que`へ直接入れます．
+    roomのqueueは`UserManager.room_que`にcacheされ，`RoomManager`がuserを移す時に更新します．
+    送信するmsgは`RoomManager.deliver`に設定した`deliver`で，宛先の`MessageProvider`へ直接渡します．
+    全てのmsgが1つのqueueと1つのtaskを通らないため，遅いroomが他のroomを待たせません．
+
+    `shards`を指定した場合は，uidのhashで`shards`個のqueueとtaskに振り分けます．同じuidのmsgの順序は保たれます．
+    shardのqueueは`shard_queue_size`件までです．受信側が一杯の場合はmsgを捨て，送信側は空くまで送る側を待たせます．
+    shardのtaskはevent loopの中で最初に`route`か`deliver`が呼ばれた時に作成するため，loopの外で生成できます．
+
+    接続ごとの送信bufferは`send_buffer_size`件までで，一杯の時は`overflow`に従います．
+    `OverflowPolicy.block`では，送る側(roomまたはshardのtask)がbufferが空くまで待ちます．
+    `batch_interval`を指定した場合は，接続ごとにその間のmsgを1つのframe(JSONの配列)にまとめて送ります．
+
     Attributes:
         __user_to_room(dict[UUID, UUID]): このdictはRoomManagerと共通です．
         __room(dict[UUID, Room]): このdictはRoomManagerと共通です．
+        dropped(int): 受信側のshardのqueueが一杯で捨てたmsgの件数
     """
 
     def __init__(
@@ -27,17 +43,34 @@ class MessageBroker:
             # room_cmd_que: asyncio.Queue,
             user_to_room: dict[UUID, UUID],
             room: dict[UUID, Room],
-            out_msg_que: asyncio.Queue
+            shards: int = 0,
+            shard_queue_size: int = 1024,
+            send_buffer_size: int = 256,
+            overflow: OverflowPolicy = OverflowPolicy.coalesce,
+            batch_interval: float | None = None
     ):
         self.__online: dict[UUID, MessageProvider] = dict()
         self.__users: dict[UUID, UserManager] = dict()
         self.__user_to_room = user_to_room
         self.__room = room
-        self.__in_que = asyncio.Queue()
-        self.__out_que = out_msg_que
         self.__room_manager = room_manager
+        self.send_buffer_size = send_buffer_size
+        self.overflow = overflow
+        self.batch_interval = batch_interval
+        room_manager.deliver = self.deliver
         # self.__room_cmd_que = room_cmd_que
-        self.__msg_task = asyncio.create_task(self.__msg_switcher(), name="Message Switcher")
+        self.dropped = 0
+        self.__in_shards: list[asyncio.Queue] = [asyncio.Queue(shard_queue_size) for _ in range(shards)]
+        self.__out_shards: list[asyncio.Queue] = [asyncio.Queue(shard_queue_size) for _ in range(shards)]
+        self.__shard_tasks: list[asyncio.Task] = []
+
+    def __start_shards(self):
+        """shardのtaskを作成します．event loopの中で呼んでください．"""
+        for i in range(len(self.__in_shards)):
+            self.__shard_tasks.append(asyncio.create_task(self.__in_shard(self.__in_shards[i]),
+                                                          name=f"MessageBroker.__in_shard({i})"))
+            self.__shard_tasks.append(asyncio.create_task(self.__out_shard(self.__out_shards[i]),
+                                                          name=f"MessageBroker.__out_shard({i})"))
 
     async def __call__(self, websocket: WebSocket):
         """ '/ws'のendpointです．
@@ -48,7 +81,8 @@ class MessageBroker:
         Returns:
 
         """
-        conn = MessageProvider(websocket, self.__in_que)
+        conn = MessageProvider(websocket, self.route, SendBuffer(self.send_buffer_size, self.overflow),
+                               self.batch_interval)
         self.__add_client(conn)
         await conn
         self.__remove_client(conn)
@@ -64,42 +98,81 @@ class MessageBroker:
     def __remove_client(self, client: MessageProvider):
         logger.info(f"connections: remove: {client.uid}")
         del self.__online[client.uid]
-        del self.__users[client.uid]
-        self.__room_manager.remove_user(client.uid)
+        client.buffer.close()
+        user = self.__users.pop(client.uid)
+        self.__room_manager.remove_user(user)
         logger.info(f"connections: total: {len(self.__online)}")
 
-    async def __msg_switcher(self):
-        try:
-            async with asyncio.TaskGroup() as tg:
-                task_in = tg.create_task(self.__in(), name="MessageBroker.__in()")
-                task_out = tg.create_task(self.__out(), name="MessageBroker.__out()")
-        except* Exception as exc:
-            logger.error(exc.args)
-        finally:
-            logger.info(f"in: cancelled? {task_in.cancelled()} out: cancelled? {task_out.cancelled()}")
-            if not task_in.done():
-                task_in.cancel()
-            if not task_out.done():
-                task_out.cancel()
-
-    async def __in(self):
-        while True:
-            request: Message = await self.__in_que.get()
-            logger.info(f"in: {request.json()}")
-            room_id = self.__user_to_room.get(request.uid)
-            if room_id is not None:
-                await self.__room[room_id].msg_in_que.put(request)
+    def route(self, request: Message):
+        """受信したmsgを，送り主のuserが今いるroomの`msg_in_que`へ入れます．blockしません．"""
+        if self.__in_shards:
+            if not self.__shard_tasks:
+                self.__start_shards()
+            try:
+                self.__in_shards[hash(request.uid) % len(self.__in_shards)].put_nowait(request)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                logger.warning("in: shard is full, dropped: uid: %s", request.uid)
+            return
+        self.__route(request)
+
+    def __route(self, request: Message):
+        user = self.__users.get(request.uid)
+        room_que = None if user is None else user.room_que
+        if room_que is None:
+            logger.critical(f"Invalid uid: {request.uid}")
+            logger.critical("content: %r", request.msg)
+            return
+        room_que.put_nowait(request)
+
+    async def deliver(self, request: Message | Broadcast):
+        """送信するmsgを宛先の`MessageProvider`へ渡します．`Broadcast`は同じインスタンスを全員に渡します．"""
+        if isinstance(request, Broadcast):
+            logger.debug("broadcast: %d uids: %s", len(request.uids), request.data)
+            targets = [(uid, request) for uid in request.uids]
+            key = request.key
+        else:
+            logger.debug("out: uid: %s msg: %r", request.uid, request.msg)
+            targets = [(request.uid, request.msg)]
+            key = snapshot_key(request.msg)
+        if self.__out_shards and not self.__shard_tasks:
+            self.__start_shards()
+        for uid, payload in targets:
+            if self.__out_shards:
+                await self.__out_shards[hash(uid) % len(self.__out_shards)].put((uid, payload, key))
             else:
-                logger.critical(f"Invalid uid: {request.uid}")
-                logger.critical(f"content: {request.json()}")
+                await self.__send(uid, payload, key)
+
+    async def broadcast(self, payload, uids):
+        """`payload`を1度だけencodeし，同じ文字列を`uids`の全員の接続に渡します．
 
-    async def __out(self):
+        Args:
+            payload(BaseModel | str): 送る内容．文字列はencode済みのJSONとして扱います．
+            uids(Iterable[UUID]): 送り先．接続していないuidは無視します．
+        """
+        await self.deliver(Broadcast.encode(payload, uids))
+
+    async def __send(self, uid: UUID, payload, key=None):
+        conn = self.__online.get(uid)
+        if conn is None:
+            logger.info("out: uid: %s is offline", uid)
+            return
+        await conn.send(payload, key)
+
+    async def __in_shard(self, que: asyncio.Queue):
         while True:
-            request: Message = await self.__out_que.get()
-            logger.info(f"out: {request.json()}")
-            conn: MessageProvider = self.__online.get(request.uid)
-            if conn is not None:
-                await conn.send(request.msg)
-            else:
-                logger.critical(f"Invalid uid: {request.uid}")
-                logger.critical(f"content: {request.json()}")
+            self.__route(await que.get())
+
+    async def __out_shard(self, que: asyncio.Queue):
+        while True:
+            uid, payload, key = await que.get()
+            await self.__send(uid, payload, key)
+
+    def buffer_stats(self) -> dict[UUID, dict[str, int]]:
+        """接続ごとの送信bufferの深さと，捨てた・置き換えたmsgの件数"""
+        return {uid: conn.buffer.stats() for uid, conn in self.__online.items()}
+
+    async def close(self):
+        for task in self.__shard_tasks:
+            task.cancel()
+        self.__shard_tasks.clear()
@@ -5,26 +5,61 @@ import typing
 from fastapi import status, WebSocketDisconnect
 from logging import getLogger
 
+from pydantic import ValidationError
 from starlette.websockets import WebSocket
 from ulid import ULID
 
-from millionaire.schemas.message import Message, NoneMessage
+from millionaire.schemas import binary
+from millionaire.schemas.message import Broadcast, Message, NoneMessage
+from millionaire.ws.send_buffer import SendBuffer, SlowConsumer
 
 logger = getLogger(__name__)
 
 
+def encode(msg) -> str:
+    """送信するmsgのJSON．broadcastでは全員に同じencode済みの文字列が渡されるため，文字列はそのまま使います．"""
+    if isinstance(msg, Broadcast):
+        return msg.data
+    return msg if isinstance(msg, str) else msg.model_dump_json()
+
+
 class MessageProvider:
     """このクラスの責任は，１つのクライアントアクセスの接続状態管理をすることです．
 
     このクラスは，ws接続リクエストごとに作成され，認証プロセス後，queueによるメッセージの送受信を受け付けます，
     切断された後の後処理までを担当します．なお，メッセージの内容については関与しません．
+
+    送信するmsgは上限付きの`buffer`に入れます．`OverflowPolicy.disconnect`で一杯になった場合は接続を切ります．
+
+    `batch_interval`を指定した場合は，最初のmsgからその秒数(0の場合はroomが1つのmsgを処理し終えるまで)の間の
+    msgを1つのframe(JSONの配列)にまとめて送ります．その際，同じ`snapshot_key`の古いsnapshotは捨てます．
+    1件だけの場合は配列にしません．
+
+    clientがsubprotocolに`binary.SUBPROTOCOL`を指定した場合は，送信するmsgを`millionaire.schemas.binary`の
+    binary frameにします．受信はframeの種類で判別し，binary frameはbinary，text frameはJSONとして扱います．
+
+    Attributes:
+        buffer(SendBuffer): 送信buffer．深さと捨てた件数を持ちます
     """
-    def __init__(self, ws: WebSocket, msg_que: asyncio.Queue):  # 機能していない
+    def __init__(self, ws: WebSocket, route: typing.Callable[[Message], None], buffer: SendBuffer | None = None,
+                 batch_interval: float | None = None):
+        """
+        Args:
+            ws: 接続
+            route: 受信した`Message`の渡し先(`MessageBroker.route`)．blockしない関数です．
+            buffer: 送信buffer．省略時は`SendBuffer()`
+            batch_interval: msgをまとめる秒数．Noneの場合はまとめません．
+        """
         logger.info(f"access: {ws.client.host}:{ws.client.port}")
         self.uid = ULID().to_uuid()
         self.__ws = ws
-        self.__in_msg_que = msg_que
-        self.__out_msg_que = asyncio.Queue()
+        self.__route = route
+        self.buffer = SendBuffer() if buffer is None else buffer
+        self.batch_interval = batch_interval
+        self.binary = False
+        self.__tasks: list[asyncio.Task] = []
+        self.__evicted = False
+        self.__closed = False
 
     def __await__(self) -> typing.Generator:
         return self.dispatch().__await__()
@@ -36,7 +71,7 @@ class MessageProvider:
             async with asyncio.TaskGroup() as tg:
                 task_in_que: asyncio.Task = tg.create_task(self.__in(), name="in")
                 task_out_que: asyncio.Task = tg.create_task(self.__out(), name="out")
-                tasks = [task_out_que, task_in_que]
+                self.__tasks = [task_out_que, task_in_que]
         except* WebSocketDisconnect:
             pass
             # Handle client normal disconnect here
@@ -46,8 +81,14 @@ class MessageProvider:
             close_code = status.WS_1011_INTERNAL_ERROR
             raise exc from None
         finally:
+            # 送る側が`OverflowPolicy.block`で待ったままにならないよう，切断したらbufferを閉じる
+            self.__closed = True
+            self.buffer.close()
+            if self.__evicted:
+                close_code = status.WS_1013_TRY_AGAIN_LATER
+                await self.__close(close_code)
             await self.__on_disconnect(close_code)
-            for task in tasks:
+            for task in self.__tasks:
                 if task.done() is False:
                     logger.info(f"task canceled: {task}")
                     task.cancel()
@@ -55,9 +96,10 @@ class MessageProvider:
 
     async def __on_connect(self):
         # Handle your new connection here
-        await self.__ws.accept()
-        logger.info(f"connect: client: {self.__ws.client.host}")
-        await self.__ws.send_json(NoneMessage(body="connection success"))
+        self.binary = binary.SUBPROTOCOL in (self.__ws.scope.get("subprotocols") or ())
+        await self.__ws.accept(subprotocol=binary.SUBPROTOCOL if self.binary else None)
+        logger.info(f"connect: client: {self.__ws.client.host} binary: {self.binary}")
+        await self.__send([NoneMessage(msg_type='none', body="connection success")])
 
     async def __on_disconnect(self, close_code: int):
         # Handle client disconnect here
@@ -67,28 +109,99 @@ class MessageProvider:
         logger.info(f"receive client: {self.uid} : {msg}")
         await self.__ws.send_text(f"received: {msg}")
 
-    async def send(self, msg):
-        """
+    async def send(self, msg, key=None):
+        """`buffer`に入れます．`OverflowPolicy.block`の場合は空くまで待ちます．
 
         Args:
-            msg(InPlayMessage | OutPlayMessage | RoomMessage):
+            msg(InPlayMessage | OutPlayMessage | RoomMessage | str): 文字列はencode済みのJSONとしてそのまま送ります
+            key(Hashable | None): 状態の更新の種類．`OverflowPolicy.coalesce`で送られていない同じkeyのmsgを取り除き，新しいmsgを末尾に入れます
 
         Returns:
             None
         """
-        await self.__out_msg_que.put(msg)
+        try:
+            await self.buffer.put(msg, key)
+        except SlowConsumer:
+            if self.__closed:
+                # 既に切断された接続へのmsgは捨てる
+                logger.debug("uid: %s is disconnected, dropped: %r", self.uid, msg)
+                return
+            self.__evict()
+
+    def __evict(self):
+        if self.__evicted:
+            return
+        self.__evicted = True
+        logger.warning("uid: %s is too slow, disconnecting: %s", self.uid, self.buffer.stats())
+        for task in self.__tasks:
+            task.cancel()
+
+    async def __close(self, code: int):
+        try:
+            # 通信が詰まっている相手なので，closeも長くは待たない
+            await asyncio.wait_for(self.__ws.close(code), timeout=1.0)
+        except Exception as exc:
+            logger.info("uid: %s failed to close: %r", self.uid, exc)
 
     async def __out(self):
+        if self.batch_interval is not None:
+            await self.__out_batch()
         while True:
             # msg: InPlayMessage | OutPlayMessage | RoomMessage
-            msg = await self.__out_msg_que.get()
-            await self.__ws.send_json(msg)
+            msg = await self.buffer.get()
+            await self.__send([msg])
+
+    async def __out_batch(self):
+        while True:
+            await self.buffer.wait()
+            # sleep(0)でも，roomが同じmsgの処理中に送ったmsgは全て揃う
+            await asyncio.sleep(self.batch_interval)
+            items = self.buffer.drain()
+            latest = {key: i for i, (key, _) in enumerate(items) if key is not None}
+            payloads = [payload for i, (key, payload) in enumerate(items) if key is None or latest[key] == i]
+            self.buffer.coalesced += len(items) - len(payloads)
+            await self.__send(payloads)
+
+    async def __send(self, payloads: list):
+        """msgを1つのframeで送ります．複数の場合は，JSONでは配列，binaryでは`binary.BATCH`にまとめます．
+
+        binaryにできないmsgは接続を切らずに捨て，batchに入らない大きさのmsgは単独のframeで送ります．
+        """
+        if self.binary:
+            parts = []
+            for payload in payloads:
+                try:
+                    parts.append(binary.encode_payload(payload))
+                except ValueError as exc:
+                    logger.error("uid: %s dropped a message that can't be encoded: %s", self.uid, exc)
+            for frame in binary.frames(parts):
+                await self.__ws.send_bytes(frame)
+        else:
+            parts = [encode(payload) for payload in payloads]
+            await self.__ws.send_text(parts[0] if len(parts) == 1 else f"[{','.join(parts)}]")
 
     async def __in(self):
+        """受け取ったframeをdictに変換せず，`Message.from_client`で1回だけ検証します．
+
+        frame数が多いため，logは`%`形式で出力する時だけ文字列にします．
+        """
         while True:
-            msg: dict = await self.__ws.receive_json()
-            logger.info(f"receive: {self.uid}: {msg}")
-            request = Message(uid=self.uid, created_by="client", **msg)
-            await self.__in_msg_que.put(request)
+            frame = await self.__ws.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", status.WS_1000_NORMAL_CLOSURE))
+            data = frame.get("text")
+            is_binary = data is None and self.binary
+            if data is None:
+                data = frame.get("bytes")
+            logger.debug("receive: %s: %s", self.uid, data)
+            try:
+                if is_binary:
+                    request = binary.decode_message(self.uid, data)
+                else:
+                    request = Message.from_client(self.uid, data)
+            except (ValidationError, ValueError) as exc:
+                logger.info("uid: %s sent invalid frame: %s", self.uid, exc)
+                continue
+            self.__route(request)
             # for debug
             # await self.__out_msg_que.put(msg)
@@ -0,0 +1,164 @@
+"""接続ごとの上限付きの送信bufferです．
+
+通信の遅いclientのbufferが際限なく大きくなり，serverのmemoryを使い切らないよう，`maxsize`件で打ち止めにします．
+bufferが一杯の時の動作は`OverflowPolicy`で選びます．
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from enum import StrEnum, auto
+from logging import getLogger
+from typing import Any, Hashable
+
+logger = getLogger(__name__)
+
+
+class OverflowPolicy(StrEnum):
+    drop = auto()  # 最も古いmsgを捨てる
+    coalesce = auto()  # 同じkeyの古いmsgを取り除いて新しいmsgを末尾に入れ，それでも一杯なら最も古いmsgを捨てる
+    block = auto()  # 空くまで送る側を待たせる
+    disconnect = auto()  # 接続を切る
+
+
+class SlowConsumer(Exception):
+    """`OverflowPolicy.disconnect`でbufferが一杯になった場合，またはbufferが閉じられた後に送る側へ送出します．"""
+
+
+class SendBuffer:
+    """1つの接続の送信bufferです．送る側(`put`)は複数でもよく，受け取る側(`get`)は1つです．
+
+    `key`を付けたmsgは状態の更新として扱い，`OverflowPolicy.coalesce`では送られていない同じkeyのmsgを取り除き，
+    新しいmsgを末尾に入れます．後から入れた他のmsgより先に古い状態が届くことはありません．
+
+    Args:
+        maxsize: bufferに入れておける最大件数
+        policy: bufferが一杯の時の動作
+
+    Attributes:
+        dropped(int): 捨てたmsgの件数
+        coalesced(int): 新しいmsgで置き換えたmsgの件数
+        high_water(int): bufferの最大の深さ
+        closed(bool): `close`で閉じられたか(`OverflowPolicy.disconnect`または接続の切断)
+    """
+
+    def __init__(self, maxsize: int = 256, policy: OverflowPolicy = OverflowPolicy.coalesce):
+        if maxsize < 1:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.policy = OverflowPolicy(policy)
+        self.__items: deque[list] = deque()  # [key, payload]
+        self.__keys: dict[Hashable, list] = {}
+        self.__readable = asyncio.Event()
+        self.__writable = asyncio.Event()
+        self.__writable.set()
+        self.dropped = 0
+        self.coalesced = 0
+        self.high_water = 0
+        self.closed = False
+
+    def __len__(self) -> int:
+        return len(self.__items)
+
+    @property
+    def depth(self) -> int:
+        return len(self.__items)
+
+    def stats(self) -> dict[str, int]:
+        return {"depth": len(self.__items), "high_water": self.high_water, "dropped": self.dropped,
+                "coalesced": self.coalesced}
+
+    async def put(self, payload: Any, key: Hashable | None = None):
+        """`payload`をbufferに入れます．
+
+        Raises:
+            SlowConsumer: `OverflowPolicy.disconnect`でbufferが一杯の場合，またはbufferが閉じられた場合．
+                `OverflowPolicy.block`で空くのを待っている間に閉じられた場合も含みます．
+        """
+        if self.closed:
+            raise SlowConsumer
+        if key is not None and self.policy == OverflowPolicy.coalesce:
+            item = self.__keys.pop(key, None)
+            if item is not None:
+                self.__remove(item)
+                self.coalesced += 1
+        while len(self.__items) >= self.maxsize:
+            if self.policy == OverflowPolicy.block:
+                self.__writable.clear()
+                await self.__writable.wait()
+                if self.closed:
+                    raise SlowConsumer
+            elif self.policy == OverflowPolicy.disconnect:
+                self.close()
+                raise SlowConsumer
+            else:
+                self.__pop()
+                self.dropped += 1
+        item = [key, payload]
+        self.__items.append(item)
+        if key is not None:
+            self.__keys[key] = item
+        if len(self.__items) > self.high_water:
+            self.high_water = len(self.__items)
+        self.__readable.set()
+
+    async def wait(self):
+        """msgが入るまで待ちます．
+
+        Raises:
+            SlowConsumer: bufferが閉じられて空の場合
+        """
+        while not self.__items:
+            if self.closed:
+                raise SlowConsumer
+            self.__readable.clear()
+            await self.__readable.wait()
+
+    async def get(self) -> Any:
+        """最も古いmsgを取り出します．空の場合は入るまで待ちます．"""
+        await self.wait()
+        payload = self.__pop()
+        self.__writable.set()
+        return payload
+
+    def drain(self) -> list[tuple[Hashable | None, Any]]:
+        """入っている全てのmsgを(key, payload)の古い順のlistで取り出します．待ちません．"""
+        items = [(key, payload) for key, payload in self.__items]
+        self.__items.clear()
+        self.__keys.clear()
+        self.__writable.set()
+        return items
+
+    def close(self):
+        """bufferを閉じ，待っている`put`と`get`に`SlowConsumer`を送出させます．"""
+        self.closed = True
+        self.__readable.set()
+        self.__writable.set()
+
+    def __remove(self, item: list):
+        for i, other in enumerate(self.__items):
+            if other is item:
+                del self.__items[i]
+                return
+
+    def __pop(self) -> Any:
+        item = self.__items.popleft()
+        if item[0] is not None and self.__keys.get(item[0]) is item:
+            del self.__keys[item[0]]
+        return item[1]
+
+
+if __name__ == '__main__':
+    async def main():
+        for policy in OverflowPolicy:
+            buffer = SendBuffer(maxsize=4, policy=policy)
+            try:
+                for i in range(10):
+                    if policy == OverflowPolicy.block and len(buffer) == buffer.maxsize:
+                        asyncio.get_running_loop().call_later(0.01, lambda: asyncio.ensure_future(buffer.get()))
+                    await buffer.put(i, key="state" if i % 2 else None)
+            except SlowConsumer:
+                print(policy, "disconnected at", i, end=" ")
+            print(policy, buffer.stats(), [await buffer.get() for _ in range(len(buffer))])
+
+    asyncio.run(main())
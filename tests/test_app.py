@@ -0,0 +1,70 @@
+import os
+import tempfile
+import time
+
+import pytest
+
+# millionaire.db.sessionのimport前に，DBとlogを一時directoryへ向ける
+TMP_DIR = tempfile.mkdtemp()
+os.environ.setdefault("MILLIONAIRE_DATABASE_URL", f"sqlite:///{TMP_DIR}/test.db")
+os.environ.setdefault("MILLIONAIRE_MATCH_LOG_DIR", f"{TMP_DIR}/logs")
+
+from starlette.testclient import TestClient  # noqa: E402
+
+from millionaire.__main__ import app, room, room_manager, user_to_room  # noqa: E402
+from millionaire.libs.match.play import Play  # noqa: E402
+from millionaire.libs.room.baseroom import RoomType  # noqa: E402
+from millionaire.libs.room.waiting_room import MIN_PLAYER_NUM  # noqa: E402
+from millionaire.schemas.msg_types import StatusTypes  # noqa: E402
+
+MATCHING = {"msg_type": "room", "msg": {"msg_type": "room", "status": "matching"}}
+
+
+def wait_until(predicate, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+@pytest.fixture(scope="module")
+def client():
+    # roomはmoduleの変数のため，appの起動から終了までを全てのtestで共有する
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def waiting_room():
+    return next(r for r in room.values() if r.room_type == RoomType.waiting)
+
+
+def test_frame_is_routed_to_room(client):
+    with client.websocket_connect("/ws") as ws:
+        assert ws.receive_json() == {"msg_type": "none", "body": "connection success"}
+        ws.send_json(MATCHING)
+        assert wait_until(lambda: any(user.status == StatusTypes.matching
+                                      for user in waiting_room().roommates.values()))
+
+
+def test_matching_creates_match_room(client):
+    sockets = [client.websocket_connect("/ws") for _ in range(MIN_PLAYER_NUM)]
+    for ws in sockets:
+        ws.__enter__()
+        ws.receive_json()
+    try:
+        for ws in sockets:
+            ws.send_json(MATCHING)
+        assert wait_until(lambda: sum(room[room_id].room_type == RoomType.match
+                                      for room_id in user_to_room.values()) == MIN_PLAYER_NUM)
+        for ws in sockets:
+            assert ws.receive_json()["play_type"] == "my_cards"
+        logs = list(room_manager.match_log_dir.glob("*.mlog"))
+        assert len(logs) == 1
+        play = Play.from_log(logs[0].read_bytes())
+        assert sorted(play.order) == sorted(user_to_room)
+        assert all(player.cards for player in play.players.values())
+    finally:
+        for ws in sockets:
+            ws.__exit__(None, None, None)
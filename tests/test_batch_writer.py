@@ -0,0 +1,100 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from millionaire.db.session import init_db
+from millionaire.libs.queue.batch_writer import BatchWriter
+from millionaire.models.history import History
+
+
+@pytest.fixture
+def session_factory():
+    # 書き込みは別threadから行うため，全てのthreadで同じin-memoryのDBを使う
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    init_db(engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def history() -> History:
+    now = datetime.now(timezone.utc)
+    uids = [str(uuid4()) for _ in range(4)]
+    return History(id=uuid4(), created_at=now, ended_at=now, users=uids, ranking=uids, seed=0)
+
+
+def count(session_factory) -> int:
+    with session_factory() as session:
+        return session.scalar(select(func.count()).select_from(History))
+
+
+async def wait_for(predicate, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        await asyncio.sleep(0.01)
+
+
+def test_flushes_when_the_batch_is_full(session_factory):
+    async def main():
+        writer = BatchWriter(session_factory, batch_size=3, flush_interval=60)
+        for _ in range(7):
+            writer.submit(history())
+        await wait_for(lambda: writer.written == 6)
+        assert count(session_factory) == 6
+        assert writer.pending == 0
+        await writer.close()
+
+    asyncio.run(main())
+    assert count(session_factory) == 7
+
+
+def test_flushes_after_the_interval(session_factory):
+    async def main():
+        writer = BatchWriter(session_factory, batch_size=100, flush_interval=0.05)
+        writer.submit(history())
+        writer.submit(history())
+        await asyncio.sleep(0.01)
+        assert writer.written == 0
+        await wait_for(lambda: writer.written == 2)
+        assert count(session_factory) == 2
+        await writer.close()
+
+    asyncio.run(main())
+
+
+def test_close_drains_pending_rows(session_factory):
+    async def main():
+        writer = BatchWriter(session_factory, batch_size=100, flush_interval=60)
+        for _ in range(5):
+            writer.submit(history())
+        started = time.monotonic()
+        await writer.close()
+        assert time.monotonic() - started < 5
+        return writer
+
+    writer = asyncio.run(main())
+    assert writer.written == 5
+    assert count(session_factory) == 5
+
+
+def test_failed_batches_are_counted(session_factory):
+    async def main():
+        writer = BatchWriter(session_factory, batch_size=2, flush_interval=60)
+        duplicate = history()
+        writer.submit(duplicate)
+        writer.submit(History(id=duplicate.id, created_at=duplicate.created_at, ended_at=duplicate.ended_at,
+                              users=duplicate.users, ranking=duplicate.ranking, seed=1))
+        writer.submit(history())
+        await writer.close()
+        return writer
+
+    writer = asyncio.run(main())
+    assert (writer.written, writer.failed) == (1, 2)
+    assert count(session_factory) == 1
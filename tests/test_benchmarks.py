@@ -0,0 +1,27 @@
+import pytest
+
+from benchmarks.match_engine import SEED, cases, deal
+from benchmarks.runner import Case, compare, measure, run
+
+
+def test_cases_run_once():
+    selected = cases()
+    assert len({case.key for case in selected}) == len(selected)
+    for case in selected:
+        case.setup()()
+
+
+def test_deal_is_deterministic():
+    assert deal(14).mask == deal(14, SEED).mask
+    assert deal(14).mask != deal(14, SEED + 1).mask
+
+
+def test_run_and_compare():
+    case = Case("noop", lambda: lambda: None, {"size": 1})
+    assert case.key == "noop[size=1]"
+    result = measure(case, repeat=1, alloc_iterations=10)
+    assert result["key"] == case.key and result["ops_per_sec"] > 0
+    report = run([case], repeat=1)
+    assert [row[0] for row in compare(report, report)] == [case.key]
+    assert compare(report, report)[0][3] == pytest.approx(1.0)
+    assert compare(report, {"results": []}) == []
@@ -0,0 +1,87 @@
+import json
+import random
+from uuid import uuid4
+
+import pytest
+
+from millionaire.libs.match import card_bits
+from millionaire.libs.match.cards import Cards
+from millionaire.schemas import binary
+from millionaire.schemas.message import Broadcast, InPlayMessage, Message, NoneMessage, OutPlayMessage, RoomMessage
+from millionaire.schemas.msg_types import PlayMsgTypes, StatusTypes
+from tests.test_moves import random_hand
+
+
+def messages(seed: int) -> list:
+    rng = random.Random(seed)
+    result = [RoomMessage(msg_type='room', status=status) for status in StatusTypes]
+    result.append(NoneMessage(msg_type='none', body="connection success"))
+    for play_type in PlayMsgTypes:
+        cards = Cards.from_mask(random_hand(rng, rng.randint(0, 14))).to_list_str()
+        result.append(InPlayMessage(msg_type='in_play', play_type=play_type, cards=cards))
+        result.append(OutPlayMessage(msg_type='out_play', play_type=play_type, cards=cards))
+    return result
+
+
+def normalized(msg) -> dict:
+    data = json.loads(msg.model_dump_json())
+    if "cards" in data:
+        data["cards"] = sorted(data["cards"])
+    return data
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_encode_decode_round_trip(seed):
+    for msg in messages(seed):
+        raw = binary.encode(msg)
+        assert normalized(binary.decode(raw)) == normalized(msg)
+        assert binary.from_json(msg.model_dump_json()) == raw
+        assert normalized(binary.decode(binary.from_json(binary.to_json(raw)))) == normalized(msg)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_batch_round_trip(seed):
+    msgs = messages(seed)
+    decoded = binary.decode_batch(binary.encode_batch([binary.encode(msg) for msg in msgs]))
+    assert [normalized(msg) for msg in decoded] == [normalized(msg) for msg in msgs]
+    assert [normalized(msg) for msg in binary.decode_batch(binary.encode(msgs[0]))] == [normalized(msgs[0])]
+
+
+def test_frames_send_oversized_messages_alone():
+    small = binary.encode(RoomMessage(msg_type='room', status=StatusTypes.matching))
+    large = binary.encode(NoneMessage(msg_type='none', body="x" * binary.MAX_PART_SIZE))
+    with pytest.raises(ValueError):
+        binary.encode_batch([small, large])
+    frames = list(binary.frames([small, small, large, small]))
+    assert frames == [binary.encode_batch([small, small]), large, small]
+    assert list(binary.frames([small])) == [small]
+    assert list(binary.frames([])) == []
+
+
+def test_invalid_frames_are_rejected():
+    frame = binary.encode(InPlayMessage(msg_type='in_play', play_type=PlayMsgTypes.played_cards, cards=["sp3"]))
+    for data in (b"", frame[:-1], bytes((len(binary.MSG_TYPES),)),
+                 binary.PLAY.pack(binary.MSG_TAG["in_play"], 0, card_bits.FULL_MASK + 1),
+                 bytes((binary.BATCH,)) + binary.LENGTH.pack(len(frame)) + frame[:-1]):
+        with pytest.raises(ValueError):
+            binary.decode_batch(data)
+    with pytest.raises(ValueError):
+        binary.decode_message(uuid4(), binary.encode(NoneMessage(msg_type='none', body="hi")))
+    invalid = OutPlayMessage.model_construct(msg_type='out_play', play_type=PlayMsgTypes.my_cards, cards=["zz9"])
+    with pytest.raises(ValueError):
+        binary.encode_payload(invalid)
+
+
+def test_decode_message_matches_json():
+    uid = uuid4()
+    msg = InPlayMessage(msg_type='in_play', play_type=PlayMsgTypes.played_cards, cards=["sp3", "he3"])
+    from_binary = binary.decode_message(uid, binary.encode(msg))
+    from_json = Message.from_client(uid, json.dumps({"msg_type": "in_play", "msg": json.loads(msg.model_dump_json())}))
+    assert normalized(from_binary.msg) == normalized(from_json.msg)
+    assert from_binary.uid == uid
+
+
+def test_broadcast_is_encoded_once():
+    broadcast = Broadcast.encode(RoomMessage(msg_type='room', status=StatusTypes.playing), [uuid4()])
+    first = binary.encode_payload(broadcast)
+    assert binary.encode_payload(broadcast) is first
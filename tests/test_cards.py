@@ -0,0 +1,112 @@
+import gc
+
+import pytest
+
+from millionaire.libs.match.card_types import CardNumber, CardSuite
+from millionaire.libs.match.cards import Cards, CardsView
+
+
+def cards(*strings: str) -> Cards:
+    return Cards.from_list_str(list(strings))
+
+
+def test_slice_selects_exactly_the_cards_at_the_indexes():
+    hand = cards("sp3", "sp5", "he9", "jo0")
+    assert hand[0:2].to_list_str() == ["sp3", "sp5"]
+    assert hand[::2].to_list_str() == ["sp3", "he9"]
+    assert hand[-1:].to_list_str() == ["jo0"]
+    assert hand[5:].to_list_str() == []
+
+
+def test_views_are_snapshots_of_the_source():
+    hand = cards("sp3", "sp5", "he9")
+    head, spades, fives = hand[0:2], hand[CardSuite.SPADE], hand[CardNumber.CINQUE]
+    assert not head.is_detached
+    hand += cards("sp4", "cl4")
+    assert head.to_list_str() == ["sp3", "sp5"]
+    assert spades.to_list_str() == ["sp3", "sp5"]
+    assert fives.to_list_str() == ["sp5"]
+    assert head.is_detached and spades.is_detached and fives.is_detached
+
+
+def test_removing_a_view_from_its_source_keeps_the_view():
+    hand = cards("sp3", "sp5", "he9")
+    view = hand[:2]
+    hand -= view
+    assert view.to_list_str() == ["sp3", "sp5"]
+    assert hand.to_list_str() == ["he9"]
+    del hand["he9"]
+    assert view.to_list_str() == ["sp3", "sp5"]
+
+
+def test_writing_to_a_view_copies_it():
+    hand = cards("sp3", "sp5", "he9")
+    view = hand[CardSuite.SPADE]
+    view += cards("di7")
+    assert view.is_detached
+    assert view.to_list_str() == ["sp3", "sp5", "di7"]
+    assert hand.to_list_str() == ["sp3", "sp5", "he9"]
+    other = hand[1:]
+    del other["he9"]
+    assert other.to_list_str() == ["sp5"]
+    assert hand.to_list_str() == ["sp3", "sp5", "he9"]
+
+
+def test_views_of_views_and_copies():
+    hand = cards("sp3", "sp4", "sp5", "he9")
+    spades = hand[CardSuite.SPADE]
+    inner = spades[1:]
+    hand -= cards("sp4")
+    assert inner.to_list_str() == ["sp4", "sp5"]
+    spades += cards("sp6")
+    assert inner.to_list_str() == ["sp4", "sp5"]
+    copy = inner.copy()
+    assert type(copy) is Cards and copy.to_list_str() == ["sp4", "sp5"]
+
+
+def test_unreferenced_views_are_not_kept_alive():
+    hand = cards("sp3", "sp5", "he9")
+    for _ in range(100):
+        hand[0:1]
+        gc.collect()
+    assert len(hand._views) <= 32
+    kept = hand[0:1]
+    hand += cards("sp4")
+    assert isinstance(kept, CardsView) and kept.is_detached
+    assert hand._views is None
+
+
+def test_union_counts_jokers_and_accepts_cards():
+    hand = cards("sp3", "jo0")
+    merged = hand.union(cards("he9", "jo0"), cards("sp3")[0])
+    assert merged.to_list_str() == ["sp3", "he9", "jo0", "jo0"]
+    assert len(merged) == 4
+    assert hand.to_list_str() == ["sp3", "jo0"]
+    assert (hand | cards("he9")).to_list_str() == hand.union(cards("he9")).to_list_str()
+
+
+def test_difference_ignores_missing_cards_but_sub_raises():
+    hand = cards("sp3", "sp5", "he9", "jo0", "jo0")
+    assert hand.difference(cards("sp5", "di7"), cards("jo0")).to_list_str() == ["sp3", "he9", "jo0"]
+    assert (hand - cards("sp5")).to_list_str() == ["sp3", "he9", "jo0", "jo0"]
+    with pytest.raises(KeyError):
+        hand - cards("di7")
+    assert hand.to_list_str() == ["sp3", "sp5", "he9", "jo0", "jo0"]
+
+
+def test_intersection():
+    hand = cards("sp3", "sp5", "he9", "jo0")
+    assert hand.intersection(cards("sp5", "he9", "di7"), cards("he9", "sp3")).to_list_str() == ["he9"]
+    assert (hand & cards("jo0", "jo0")).to_list_str() == ["jo0"]
+    assert not hand.intersection(cards("di7"))
+
+
+def test_remove_played_is_all_or_nothing():
+    hand = cards("sp3", "sp5", "he9")
+    hand.remove_played(cards("sp3", "sp5"))
+    assert hand.to_list_str() == ["he9"]
+    with pytest.raises(KeyError):
+        hand.remove_played(cards("he9", "di7"))
+    assert hand.to_list_str() == ["he9"]
+    hand.remove_played(hand[0])
+    assert not hand
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from millionaire.sim.dataset import COLUMNS, LEGAL, LEGAL_OFFSETS, Dataset, export
+
+
+@pytest.fixture
+def exported(tmp_path):
+    shards = export(tmp_path, 6, workers=1, batch_size=3, seed=11, shard_size=50)
+    return tmp_path, shards
+
+
+def test_round_trip(exported, tmp_path_factory):
+    directory, shards = exported
+    dataset = Dataset(directory)
+    assert [str(shard) for shard in dataset.shards] == sorted(shards)
+    records = dataset[:]
+    assert len(records["game"]) == len(dataset) > 0
+    assert sorted(set(records["game"].tolist())) == list(range(6))
+    assert records[LEGAL_OFFSETS[0]][-1] == len(records[LEGAL[0]])
+    for name, (_, dtype) in COLUMNS.items():
+        assert records[name].dtype == np.dtype(dtype)
+
+    other = tmp_path_factory.mktemp("again")
+    export(other, 6, workers=1, batch_size=3, seed=11, shard_size=50)
+    again = Dataset(other)[:]
+    assert records.keys() == again.keys()
+    for name in records:
+        np.testing.assert_array_equal(records[name], again[name])
+
+
+def test_rows_match_slices(exported):
+    dataset = Dataset(exported[0])
+    records = dataset[:]
+    offsets = records[LEGAL_OFFSETS[0]]
+    for index in (0, len(dataset) // 2, len(dataset) - 1):
+        row = dataset[index]
+        for name in COLUMNS:
+            assert row[name].tolist() == [records[name][index]]
+        legal = records[LEGAL[0]][offsets[index]:offsets[index + 1]]
+        np.testing.assert_array_equal(row[LEGAL[0]], legal)
+        np.testing.assert_array_equal(dataset.legal_moves(index), legal)
+    np.testing.assert_array_equal(dataset[-1]["turn"], records["turn"][-1:])
+
+
+def test_index_out_of_range(exported):
+    dataset = Dataset(exported[0])
+    for index in (len(dataset), -len(dataset) - 1):
+        with pytest.raises(IndexError):
+            dataset[index]
+    assert len(dataset[len(dataset):]["game"]) == 0
+
+
+def test_refuse_overwrite(exported):
+    directory, _ = exported
+    size = len(Dataset(directory))
+    with pytest.raises(FileExistsError):
+        export(directory, 3, workers=1, seed=1)
+    assert len(Dataset(directory)) == size
+    export(directory, 3, workers=1, seed=1, overwrite=True)
+    assert sorted(set(Dataset(directory)[:]["game"].tolist())) == [0, 1, 2]
@@ -0,0 +1,92 @@
+import random
+import threading
+
+import pytest
+
+from millionaire.libs.match import endgame
+from millionaire.libs.match.cards import Cards
+from millionaire.libs.match.state import PlayState, apply_move, legal_moves
+
+
+def endgame_states(count: int, cards: int = 7) -> list[PlayState]:
+    states = []
+    seed = 0
+    while len(states) < count:
+        rng = random.Random(seed)
+        seed += 1
+        state = PlayState(hands=tuple(hand.mask for hand in Cards.create_cards(player_num=4, rng=rng)))
+        while state.card_count() > cards:
+            state, _ = apply_move(state, rng.choice(list(legal_moves(state))))
+        if not state.is_over:
+            states.append(state)
+    return states
+
+
+def brute_force(state: PlayState) -> tuple[tuple[float, ...], object]:
+    """tableを使わないmax^n．同じ評価の手は先に生成された手を選びます．"""
+    if state.is_over:
+        return endgame.payoff(state.ranking), None
+    best = None
+    for move in legal_moves(state):
+        values, _ = brute_force(apply_move(state, move)[0])
+        if best is None or values[state.turn] > best[0][state.turn]:
+            best = values, move
+    return best
+
+
+@pytest.mark.parametrize("state", endgame_states(15))
+def test_solve_matches_brute_force(state):
+    endgame.cache_clear()
+    values, move = brute_force(state)
+    assert endgame.solve(state, max_nodes=None) == values
+    chosen = endgame.best_move(state, max_nodes=None)
+    assert brute_force(apply_move(state, chosen)[0])[0][state.turn] == values[state.turn]
+    assert move in list(legal_moves(state))
+
+
+def test_search_limit_exceeded():
+    state = endgame_states(1, cards=8)[0]
+    endgame.cache_clear()
+    with pytest.raises(endgame.SearchLimitExceeded):
+        endgame.solve(state, max_nodes=20)
+    # 読み切った局面はtableに残り，続きから読める
+    assert endgame.cache_info().currsize > 0
+    assert endgame.solve(state, max_nodes=None) == brute_force(state)[0]
+    assert endgame.solve(state, max_nodes=0) == brute_force(state)[0]
+    with pytest.raises(ValueError):
+        endgame.best_move(PlayState(hands=(0, 0, 0, 1), ranking=(0, 1, 2, 3)))
+
+
+def test_concurrent_searches_have_separate_budgets():
+    states = endgame_states(8, cards=8)
+    endgame.cache_clear()
+    errors = []
+
+    def unlimited():
+        try:
+            for state in states:
+                endgame.solve(state, max_nodes=None)
+        except Exception as exc:  # noqa: BLE001
+            errors.append(exc)
+
+    def limited():
+        for _ in range(200):
+            try:
+                endgame.solve(PlayState(hands=states[0].hands[::-1]), max_nodes=1)
+            except endgame.SearchLimitExceeded:
+                pass
+
+    threads = [threading.Thread(target=unlimited), threading.Thread(target=limited)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_table_is_bounded():
+    table = endgame.TranspositionTable(maxsize=2)
+    for i in range(3):
+        table.put(i, (i,))
+    assert table.get(0) is None and table.get(2) == (2,)
+    assert table.info().currsize == 2
@@ -0,0 +1,85 @@
+import io
+import random
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import pytest
+
+from millionaire.libs.match.cards import Cards
+from millionaire.libs.match.history import MatchLogReader, MatchLogWriter, iter_matches, load, replay
+from millionaire.libs.match.play import Play
+from millionaire.libs.match.settings import Settings
+from millionaire.libs.match.state import PlayState, apply_move, legal_moves
+
+
+def write_match(stream: io.BytesIO, seed: int, snapshot_interval: int = 4) -> tuple[list[int], list[PlayState | None]]:
+    """1試合を書き込み，各recordの終わりの位置と，そこまでを読んだ時の状態を返します．"""
+    rng = random.Random(seed)
+    writer = MatchLogWriter(stream, snapshot_interval)
+    order = [uuid4() for _ in range(4)]
+    writer.begin(uuid4(), datetime.now(timezone.utc), seed, Settings(), order)
+    boundaries, states = [stream.tell()], [None]
+    current = PlayState(hands=tuple(cards.mask for cards in Cards.create_cards(player_num=4, rng=rng)))
+    writer.deal(current.hands)
+    boundaries.append(stream.tell())
+    states.append(current)
+    while not current.is_over:
+        move = rng.choice(list(legal_moves(current)))
+        writer.move(move)
+        current, _ = apply_move(current, move)
+        boundaries.append(stream.tell())
+        states.append(current)
+        if not current.field:
+            writer.reset()
+            boundaries.append(stream.tell())
+            states.append(current)
+        if writer.snapshot_due:
+            writer.snapshot(current)
+            boundaries.append(stream.tell())
+            states.append(current)
+    writer.end()
+    boundaries.append(stream.tell())
+    states.append(current)
+    return boundaries, states
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_load_after_truncation_at_each_record(seed):
+    stream = io.BytesIO()
+    boundaries, states = write_match(stream, seed)
+    data = stream.getvalue()
+    for boundary, state in zip(boundaries, states):
+        _, loaded = load(MatchLogReader(data[:boundary]))
+        assert loaded == state
+        replayed = list(replay(MatchLogReader(data[:boundary]), validate=True))
+        assert (replayed[-1] if replayed else None) == state
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_truncation_inside_a_record_is_rejected(seed):
+    stream = io.BytesIO()
+    boundaries, _ = write_match(stream, seed)
+    data = stream.getvalue()
+    for start, end in zip(boundaries, boundaries[1:]):
+        for cut in range(start + 1, end):
+            with pytest.raises(ValueError):
+                load(MatchLogReader(data[:cut]))
+    for cut in range(1, boundaries[0]):
+        with pytest.raises(ValueError):
+            load(MatchLogReader(data[:cut]))
+
+
+def test_play_from_log_at_each_boundary():
+    stream = io.BytesIO()
+    boundaries, states = write_match(stream, 0)
+    data = stream.getvalue()
+    for boundary, state in zip(boundaries[1:], states[1:]):
+        play = Play.from_log(data[:boundary])
+        assert play.to_state() == state
+        assert play.created_at.tzinfo is not None
+
+
+def test_iter_matches_reads_appended_matches():
+    stream = io.BytesIO()
+    finals = [write_match(stream, seed)[1][-1] for seed in range(3)]
+    assert [state for _, state in iter_matches(stream.getvalue())] == finals
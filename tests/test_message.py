@@ -0,0 +1,72 @@
+import json
+from uuid import uuid4
+
+import pytest
+from pydantic import ValidationError
+
+from millionaire.schemas.message import Broadcast, InPlayMessage, Message, OutPlayMessage, RoomMessage, snapshot_key
+from millionaire.schemas.msg_types import PlayMsgTypes, StatusTypes
+
+
+def frame(msg: dict, msg_type: str | None = None) -> str:
+    return json.dumps({"msg_type": msg_type or msg["msg_type"], "msg": msg})
+
+
+@pytest.mark.parametrize("data", [str, str.encode])
+def test_from_client_valid_message(data):
+    uid = uuid4()
+    msg = {"msg_type": "in_play", "play_type": "played_cards", "cards": ["sp3", "cl3"]}
+    request = Message.from_client(uid, data(frame(msg)))
+    assert request.uid == uid
+    assert request.created_by == "client"
+    assert request.msg_type == "in_play"
+    assert isinstance(request.msg, InPlayMessage)
+    assert request.msg.play_type == PlayMsgTypes.played_cards
+    assert request.msg.cards == ["sp3", "cl3"]
+    expected = Message(uid=uid, created_by="client", **json.loads(frame(msg)))
+    assert request.model_dump(exclude={"created_at"}) == expected.model_dump(exclude={"created_at"})
+
+
+def test_from_client_room_message():
+    request = Message.from_client(uuid4(), frame({"msg_type": "room", "status": "matching"}))
+    assert isinstance(request.msg, RoomMessage)
+    assert request.msg.status == StatusTypes.matching
+
+
+@pytest.mark.parametrize("data", [
+    frame({"msg_type": "chat", "body": "hi"}),
+    frame({"msg_type": "in_play", "play_type": "played_cards"}, msg_type="unknown"),
+    frame({"msg_type": "in_play", "play_type": "discard", "cards": []}),
+    frame({"msg_type": "room", "status": "sleeping"}),
+])
+def test_from_client_unknown_type(data):
+    with pytest.raises(ValidationError):
+        Message.from_client(uuid4(), data)
+
+
+@pytest.mark.parametrize("data", [
+    "",
+    "not json",
+    '{"msg_type": "in_play", "msg": ',
+    "[]",
+    '{"msg_type": "in_play"}',
+    frame({"msg_type": "in_play", "play_type": "played_cards", "cards": "sp3"}),
+    frame({"msg_type": "in_play", "play_type": "played_cards", "cards": [3]}),
+    b"\xff\xfe",
+])
+def test_from_client_malformed_payload(data):
+    with pytest.raises(ValidationError):
+        Message.from_client(uuid4(), data)
+
+
+def test_trusted_and_broadcast_keys():
+    uid = uuid4()
+    my_cards = OutPlayMessage(msg_type="out_play", play_type=PlayMsgTypes.my_cards, cards=["sp3"])
+    played = OutPlayMessage(msg_type="out_play", play_type=PlayMsgTypes.played_cards, cards=["sp3"])
+    assert Message.trusted(uid, "test", my_cards).msg is my_cards
+    assert snapshot_key(my_cards) == PlayMsgTypes.my_cards
+    assert snapshot_key(played) is None
+    broadcast = Broadcast.encode(played, [uid, uid])
+    assert broadcast.uids == frozenset([uid])
+    assert json.loads(broadcast.data) == played.model_dump()
+    assert Broadcast.encode("{}", [uid]).payload is None
@@ -0,0 +1,141 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from millionaire.libs.room.match_room import MatchRoom
+from millionaire.libs.room.rooms_manager import RoomManager
+from millionaire.schemas.message import Message, OutPlayMessage
+from millionaire.schemas.msg_types import PlayMsgTypes
+from millionaire.ws.message_broker import MessageBroker
+from tests.test_play import make_play, play_msg
+
+
+class FakeWebSocket:
+    """`MessageProvider`が使う部分だけのwebsocketです．送られたframeを`sent`にためます．"""
+
+    def __init__(self, subprotocols: tuple[str, ...] = ()):
+        self.client = SimpleNamespace(host="testclient", port=0)
+        self.scope = {"subprotocols": list(subprotocols)}
+        self.sent: list[str | bytes] = []
+        self.incoming: asyncio.Queue = asyncio.Queue()
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, data: str):
+        self.sent.append(data)
+
+    async def send_bytes(self, data: bytes):
+        self.sent.append(data)
+
+    async def receive(self) -> dict:
+        return await self.incoming.get()
+
+    async def close(self, code: int = 1000):
+        pass
+
+    def disconnect(self):
+        self.incoming.put_nowait({"type": "websocket.disconnect", "code": 1000})
+
+    def messages(self) -> list[dict]:
+        """接続時のmsgを除き，送られたmsgをframeの配列を開いて返します．"""
+        result = []
+        for frame in self.sent[1:]:
+            data = json.loads(frame)
+            result.extend(data if isinstance(data, list) else [data])
+        return result
+
+
+def make_broker(**kw) -> tuple[MessageBroker, dict]:
+    room = {}
+    manager = RoomManager(user_to_room={}, room=room)
+    return MessageBroker(manager, {}, room, **kw), room
+
+
+async def connect(broker: MessageBroker, count: int) -> tuple[list[FakeWebSocket], list[asyncio.Task]]:
+    sockets = [FakeWebSocket() for _ in range(count)]
+    tasks = [asyncio.create_task(broker(ws)) for ws in sockets]
+    while len(broker.buffer_stats()) < count:
+        await asyncio.sleep(0)
+    return sockets, tasks
+
+
+async def disconnect(sockets: list[FakeWebSocket], tasks: list[asyncio.Task]):
+    for ws in sockets:
+        ws.disconnect()
+    await asyncio.wait_for(asyncio.gather(*tasks), 1)
+
+
+def test_shards_start_lazily_and_keep_the_order():
+    # event loopの外で生成できる
+    broker, _ = make_broker(shards=2, shard_queue_size=1)
+
+    async def main():
+        sockets, tasks = await connect(broker, 3)
+        uids = list(broker.buffer_stats())
+        for i in range(5):
+            for uid in uids:
+                await broker.deliver(Message.trusted(uid, "test", OutPlayMessage(
+                    msg_type="out_play", play_type=PlayMsgTypes.played_cards, cards=[f"sp{i + 1}"])))
+        while any(len(ws.sent) < 6 for ws in sockets):
+            await asyncio.sleep(0)
+        await disconnect(sockets, tasks)
+        await broker.close()
+        return sockets
+
+    for ws in asyncio.run(main()):
+        assert [msg["cards"] for msg in ws.messages()] == [[f"sp{i + 1}"] for i in range(5)]
+
+
+def test_full_in_shard_drops_messages():
+    broker, room = make_broker(shards=1, shard_queue_size=2)
+    frame = '{"msg_type": "room", "msg": {"msg_type": "room", "status": "matching"}}'
+
+    async def main():
+        sockets, tasks = await connect(broker, 1)
+        uid = next(iter(broker.buffer_stats()))
+        for _ in range(5):
+            broker.route(Message.from_client(uid, frame))
+        dropped = broker.dropped
+        que = next(iter(room.values())).msg_in_que
+        while que.qsize() < 2:
+            await asyncio.sleep(0)
+        await disconnect(sockets, tasks)
+        await broker.close()
+        return dropped, que.qsize()
+
+    assert asyncio.run(main()) == (3, 2)
+
+
+@pytest.mark.parametrize("shards", [0, 2])
+def test_match_events_are_broadcast_once_to_every_user(shards):
+    broker, room = make_broker(shards=shards)
+    manager = next(iter(room.values())).manager
+    hands = [["sp3"], ["sp4"], ["sp5"], ["sp6"]]
+
+    async def main():
+        sockets, tasks = await connect(broker, len(hands))
+        uids = list(broker.buffer_stats())
+        play = make_play(hands, uids)
+        match = MatchRoom(manager, uids, play=play)
+        await match.play_task
+        for uid, cards in zip(play.order, hands[:3]):
+            await match.msg_analyser(play_msg(uid, *cards))
+        while any(len(ws.messages()) < 4 for ws in sockets):
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.01)
+        await disconnect(sockets, tasks)
+        await broker.close()
+        await manager.close()
+        match._msg_in_task.cancel()
+        return play, dict(zip(uids, sockets))
+
+    play, sockets = asyncio.run(main())
+    assert play.is_over
+    events = [{"msg_type": "out_play", "play_type": "played_cards", "cards": cards} for cards in hands[:3]]
+    events.append({"msg_type": "room", "status": "waiting"})
+    for uid, ws in sockets.items():
+        received = [msg for msg in ws.messages() if msg.get("play_type") != "my_cards"]
+        assert received == events
@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+from millionaire.schemas import binary
+from millionaire.schemas.message import Broadcast, OutPlayMessage, RoomMessage
+from millionaire.schemas.msg_types import PlayMsgTypes, StatusTypes
+from millionaire.ws.message_provider import MessageProvider
+from millionaire.ws.send_buffer import SendBuffer
+from tests.test_message_broker import FakeWebSocket
+
+
+def out_play(play_type: PlayMsgTypes, *cards: str) -> OutPlayMessage:
+    return OutPlayMessage.model_construct(msg_type="out_play", play_type=play_type, cards=list(cards))
+
+
+def run_provider(ws: FakeWebSocket, payloads: list[tuple], batch_interval: float = 0.01) -> MessageProvider:
+    """`payloads`の(msg, key)を続けて`send`し，送られるまで待ってから切断します．"""
+    async def main():
+        provider = MessageProvider(ws, lambda request: None, SendBuffer(), batch_interval)
+        task = asyncio.create_task(provider.dispatch())
+        while not ws.sent:
+            await asyncio.sleep(0)
+        for msg, key in payloads:
+            await provider.send(msg, key)
+        while len(ws.sent) < 2:
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(batch_interval * 2)
+        ws.disconnect()
+        await asyncio.wait_for(task, 1)
+        return provider
+
+    return asyncio.run(main())
+
+
+def test_queued_messages_are_sent_as_one_frame():
+    ws = FakeWebSocket()
+    played = out_play(PlayMsgTypes.played_cards, "sp3")
+    run_provider(ws, [
+        (out_play(PlayMsgTypes.my_cards, "sp3", "sp4"), PlayMsgTypes.my_cards),
+        (Broadcast.encode(played, []), None),
+        (RoomMessage.model_construct(msg_type="room", status=StatusTypes.playing), None),
+        (out_play(PlayMsgTypes.my_cards, "sp4"), PlayMsgTypes.my_cards),
+    ])
+    assert len(ws.sent) == 2
+    assert json.loads(ws.sent[1]) == [
+        played.model_dump(),
+        {"msg_type": "room", "status": "playing"},
+        {"msg_type": "out_play", "play_type": "my_cards", "cards": ["sp4"]},
+    ]
+
+
+def test_single_message_is_not_wrapped():
+    ws = FakeWebSocket()
+    run_provider(ws, [(RoomMessage.model_construct(msg_type="room", status=StatusTypes.waiting), None)])
+    assert json.loads(ws.sent[1]) == {"msg_type": "room", "status": "waiting"}
+
+
+def test_unencodable_message_does_not_drop_the_batch():
+    ws = FakeWebSocket(subprotocols=(binary.SUBPROTOCOL,))
+    run_provider(ws, [
+        (out_play(PlayMsgTypes.played_cards, "sp3"), None),
+        (out_play(PlayMsgTypes.played_cards, "xx99"), None),
+        (RoomMessage.model_construct(msg_type="room", status=StatusTypes.waiting), None),
+    ])
+    assert len(ws.sent) == 2
+    assert [msg.model_dump() for msg in binary.decode_batch(ws.sent[1])] == [
+        {"msg_type": "out_play", "play_type": "played_cards", "cards": ["sp3"]},
+        {"msg_type": "room", "status": "waiting"},
+    ]
@@ -0,0 +1,76 @@
+import random
+
+import pytest
+
+from millionaire.libs.match import card_bits
+from millionaire.libs.match.moves import MoveIndex, MoveOrder, classify, iter_moves, iter_ordered_moves
+
+
+def random_hand(rng: random.Random, size: int) -> int:
+    mask = 0
+    for cid in rng.sample(range(card_bits.CARD_ID_NUM), size):
+        mask |= 1 << cid
+    return card_bits.normalize(mask)
+
+
+def brute_force(hand: int) -> set:
+    """手札の全ての部分集合を`classify`した組み合わせ"""
+    ids = list(card_bits.iter_ids(hand))
+    result = set()
+    for bits in range(1, 1 << len(ids)):
+        mask = 0
+        for i, cid in enumerate(ids):
+            if bits >> i & 1:
+                mask |= 1 << cid
+        move = classify(card_bits.normalize(mask))
+        if move is not None:
+            result.add(move)
+    return result
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_iter_moves_matches_brute_force(seed):
+    rng = random.Random(seed)
+    hand = random_hand(rng, rng.randint(1, 11))
+    expected = brute_force(hand)
+    moves = list(iter_moves(hand))
+    assert len(moves) == len(set(moves))
+    assert set(moves) == expected
+    for field in rng.sample(sorted(expected), min(5, len(expected))):
+        assert set(iter_moves(hand, field)) == {move for move in expected if move.beats(field)}
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_move_index_matches_brute_force(seed):
+    rng = random.Random(seed)
+    hand = random_hand(rng, rng.randint(2, 11))
+    index = MoveIndex(hand)
+    assert set(index.iter_moves()) == brute_force(hand)
+    while hand:
+        played = rng.choice(list(index.iter_moves()))
+        index.remove(played.mask)
+        hand = card_bits.difference(hand, played.mask)
+        expected = brute_force(hand)
+        assert index.mask == hand
+        assert set(index.iter_moves()) == expected
+        for field in rng.sample(sorted(expected), min(3, len(expected))):
+            assert set(index.iter_moves(field)) == {move for move in expected if move.beats(field)}
+
+
+@pytest.mark.parametrize("order", list(MoveOrder))
+def test_ordered_moves_are_sorted_by_rank(order):
+    rng = random.Random(order)
+    hand = random_hand(rng, 12)
+    for moves in (list(iter_ordered_moves(hand, order=order)), list(MoveIndex(hand).iter_moves(order=order))):
+        ranks = [move.rank for move in moves]
+        assert ranks == sorted(ranks, reverse=order == MoveOrder.strongest)
+        assert set(moves) == brute_force(hand)
+
+
+def test_classify_prefers_equal_and_stretches_sequences_upwards():
+    sp4, sp5 = 1 << 4, 1 << 8  # sp4, sp5 (rank 1, 2 / suite 0)
+    move = classify(sp4 | sp5 | card_bits.JOKER_FILL[1])
+    assert (move.regularity.name, move.rank, move.size) == ("sequence", 1, 3)
+    move = classify(sp4 | card_bits.JOKER_FILL[2])
+    assert (move.regularity.name, move.rank, move.size) == ("equal", 1, 3)
+    assert classify(sp4 | 1 << 9) is None  # sp4, cl5
@@ -0,0 +1,148 @@
+import asyncio
+import json
+
+import pytest
+from ulid import ULID
+
+from millionaire.libs.match.card import decode_mask
+from millionaire.libs.match.play import Play
+from millionaire.libs.match.player import Player
+from millionaire.libs.match.state import PlayState
+from millionaire.libs.room.match_room import MatchRoom
+from millionaire.libs.room.rooms_manager import RoomManager
+from millionaire.libs.room.user import UserManager
+from millionaire.schemas.message import Broadcast, InPlayMessage, Message
+from millionaire.schemas.msg_types import PlayMsgTypes, StatusTypes
+from tests.test_rules import make_settings
+
+HANDS = [
+    ["sp3", "cl3", "di3", "he3", "sp5"],
+    ["sp4", "cl4", "sp6", "sp7"],
+    ["di9", "he10"],
+    ["cl12"],
+]
+
+
+def make_play(hands: list[list[str]] = HANDS, uids=None, **settings) -> Play:
+    uids = [ULID().to_uuid() for _ in hands] if uids is None else uids
+    play = Play([Player(uid=uid, name=str(uid)) for uid in uids], make_settings(**settings), seed=1)
+    play.load_state(PlayState(hands=tuple(decode_mask(hand) for hand in hands)))
+    return play
+
+
+def test_validate_valid_and_invalid_plays():
+    play = make_play()
+    first, second = play.order[:2]
+    assert play.validate(first, ["sp3", "cl3"]).mask == decode_mask(["sp3", "cl3"])
+    with pytest.raises(ValueError):
+        play.validate(first, [])  # 場が空の時はパスできない
+    with pytest.raises(KeyError):
+        play.validate(first, ["sp4"])
+    with pytest.raises(ValueError):
+        play.validate(first, ["sp3", "sp5"])
+    with pytest.raises(ValueError):
+        play.validate(first, ["xx1"])
+    with pytest.raises(ValueError):
+        play.validate(second, ["sp4"])  # 手番でない
+    play.put_move(first, play.validate(first, ["sp3", "cl3"]))
+    assert play.validate(second, []) is None
+    assert play.validate(second, ["sp4", "cl4"]) is not None
+    with pytest.raises(ValueError):
+        play.validate(second, ["sp6"])  # 枚数が違う
+
+
+def test_validate_after_revolution_and_lock():
+    play = make_play(revolution=4, suit_lock=True)
+    first, second, third, _ = play.order
+    play.put_move(first, play.validate(first, ["sp3", "cl3", "di3", "he3"]))
+    assert play.revolution
+    play.put_move(second, None)
+    play.put_move(third, None)
+    play.put_move(play.turn, None)
+    # 場が流れ，革命中は弱い数字が強い
+    assert play.turn == first and play.field is None
+    play.put_move(first, play.validate(first, ["sp5"]))
+    assert play.validate(second, ["sp4"]) is not None
+    play.put_move(second, play.validate(second, ["sp4"]))
+    assert play.lock  # 同じsuiteが続いたため縛り
+    with pytest.raises(ValueError):
+        play.validate(third, ["di9"])  # 縛りと違うsuite
+
+
+class Recorder:
+    """`RoomManager.deliver`に設定し，送られたmsgをためます．"""
+
+    def __init__(self):
+        self.sent: list[Message | Broadcast] = []
+
+    async def __call__(self, request: Message | Broadcast):
+        self.sent.append(request)
+
+    def broadcasts(self) -> list[dict]:
+        return [json.loads(request.data) for request in self.sent if isinstance(request, Broadcast)]
+
+    def messages(self, uid) -> list[dict]:
+        return [request.msg.model_dump() for request in self.sent
+                if isinstance(request, Message) and request.uid == uid]
+
+
+def play_msg(uid, *cards: str) -> Message:
+    play_type = PlayMsgTypes.played_cards if cards else PlayMsgTypes.is_skipped
+    return Message.trusted(uid, "client", InPlayMessage(msg_type="in_play", play_type=play_type, cards=list(cards)))
+
+
+def run_match(hands, plays, **settings):
+    """`hands`を配ったmatch roomに，`plays(room, order)`の返すmsgを順に渡します．"""
+    async def main():
+        room = {}
+        manager = RoomManager(user_to_room={}, room=room)
+        recorder = Recorder()
+        manager.deliver = recorder
+        users = [UserManager(uid=ULID().to_uuid(), status=StatusTypes.matching) for _ in hands]
+        for user in users:
+            manager.add_user(user)
+        play = make_play(hands, [user.uid for user in users], **settings)
+        match = MatchRoom(manager, [user.uid for user in users], play=play)
+        await match.play_task
+        for uid, cards in plays(play.order):
+            await match.msg_analyser(play_msg(uid, *cards))
+        await manager.close()
+        match._msg_in_task.cancel()
+        return play, recorder
+
+    return asyncio.run(main())
+
+
+def test_msg_analyser_broadcasts_valid_plays():
+    play, recorder = run_match(HANDS, lambda order: [(order[0], ["sp3", "cl3"]), (order[1], [])])
+    assert recorder.broadcasts() == [
+        {"msg_type": "out_play", "play_type": "played_cards", "cards": ["sp3", "cl3"]},
+        {"msg_type": "out_play", "play_type": "is_skipped", "cards": []},
+    ]
+    assert recorder.messages(play.order[0]) == [
+        {"msg_type": "out_play", "play_type": "my_cards", "cards": ["di3", "he3", "sp5"]}]
+    assert play.turn == play.order[2]
+
+
+def test_msg_analyser_ignores_invalid_and_out_of_turn_plays():
+    play, recorder = run_match(HANDS, lambda order: [
+        (order[1], ["sp4"]),  # 手番でない
+        (order[0], ["sp4"]),  # 持っていない
+        (order[0], []),  # 場が空の時のパス
+        (order[0], ["sp3", "sp5"]),  # 組み合わせでない
+    ])
+    assert recorder.sent == []
+    assert play.turn == play.order[0]
+    assert play.to_state().hands == tuple(decode_mask(hand) for hand in HANDS)
+
+
+def test_msg_analyser_applies_revolution_and_lock():
+    play, recorder = run_match(HANDS, lambda order: [
+        (order[0], ["sp3", "cl3", "di3", "he3"]), (order[1], []), (order[2], []), (order[3], []),
+        (order[0], ["sp5"]), (order[1], ["sp4"]),
+        (order[2], ["di9"]),  # 縛りと違うsuite
+    ], revolution=4, suit_lock=True)
+    assert play.revolution and play.lock
+    assert play.turn == play.order[2]
+    assert [msg["cards"] for msg in recorder.broadcasts()] == [
+        ["sp3", "cl3", "di3", "he3"], [], [], [], ["sp5"], ["sp4"]]
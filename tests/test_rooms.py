@@ -0,0 +1,81 @@
+import asyncio
+
+from ulid import ULID
+
+from millionaire.libs.match.bot import shutdown_executor
+from millionaire.libs.match.player import Player
+from millionaire.libs.match.play import Play
+from millionaire.libs.match.settings import Settings
+from millionaire.libs.queue.timing_wheel import TimingWheel
+from millionaire.libs.room import match_room
+from millionaire.libs.room.baseroom import RoomType
+from millionaire.libs.room.rooms_manager import FINISHED_DIR, RoomManager
+
+
+def test_recover_unfinished_matches(tmp_path):
+    uids = [ULID().to_uuid() for _ in range(4)]
+    unfinished = Play([Player(uid=uid, name=str(uid)) for uid in uids], Settings(), seed=1)
+    with open(tmp_path / f"{unfinished.play_id}.mlog", "ab") as stream:
+        unfinished.record(stream)
+        unfinished.distribute_cards()
+        for _ in range(5):
+            unfinished.put(unfinished.turn, unfinished.candidate(unfinished.turn))
+    finished = Play([Player(uid=uid, name=str(uid)) for uid in uids], Settings(), seed=2)
+    with open(tmp_path / f"{finished.play_id}.mlog", "ab") as stream:
+        finished.record(stream)
+        finished.distribute_cards()
+        while not finished.is_over:
+            finished.put(finished.turn, finished.hint(finished.turn))
+    (tmp_path / "broken.mlog").write_bytes(b"MLOG\x09")
+
+    async def main():
+        room = {}
+        manager = RoomManager(user_to_room={}, room=room, match_log_dir=tmp_path)
+        manager.start()
+        matches = [r for r in room.values() if r.room_type == RoomType.match]
+        await asyncio.sleep(0)
+        await manager.close()
+        for r in room.values():
+            r._msg_in_task.cancel()
+        return matches
+
+    matches = asyncio.run(main())
+    assert len(matches) == 1
+    recovered = Play.from_log((tmp_path / f"{unfinished.play_id}.mlog").read_bytes())
+    assert recovered.to_state() == unfinished.to_state()
+    # 終わった試合のlogは移され，次の起動では読まない
+    assert not (tmp_path / f"{finished.play_id}.mlog").exists()
+    assert Play.from_log((tmp_path / FINISHED_DIR / f"{finished.play_id}.mlog").read_bytes()).is_over
+    assert sorted(path.name for path in tmp_path.glob("*.mlog")) == sorted(
+        [f"{unfinished.play_id}.mlog", "broken.mlog"])
+
+
+def test_recovered_match_is_finished_by_the_bot(tmp_path, monkeypatch):
+    monkeypatch.setattr(match_room, "TURN_TIMEOUT", 0.01)
+    uids = [ULID().to_uuid() for _ in range(4)]
+    play = Play([Player(uid=uid, name=str(uid)) for uid in uids], Settings(), seed=3)
+    path = tmp_path / f"{play.play_id}.mlog"
+    archived = tmp_path / FINISHED_DIR / path.name
+    with open(path, "ab") as stream:
+        play.record(stream)
+        play.distribute_cards()
+
+    async def main():
+        room = {}
+        manager = RoomManager(user_to_room={}, room=room, deadlines=TimingWheel(tick=0.01), match_log_dir=tmp_path)
+        manager.start()
+        try:
+            for _ in range(3000):
+                if archived.exists():
+                    return not path.exists() and Play.from_log(archived.read_bytes()).is_over
+                await asyncio.sleep(0.01)
+            return False
+        finally:
+            await manager.close()
+            for r in room.values():
+                r._msg_in_task.cancel()
+
+    try:
+        assert asyncio.run(main())
+    finally:
+        shutdown_executor()
@@ -0,0 +1,97 @@
+import random
+
+import pytest
+
+from millionaire.libs.match import card_bits
+from millionaire.libs.match.card_types import CardNumber, CardsRegularity
+from millionaire.libs.match.card_bits import JOKER_RANK
+from millionaire.libs.match.moves import MoveIndex, MoveOrder, classify
+from millionaire.libs.match.rules import STANDARD, compile_rules, suits
+from millionaire.libs.match.settings import Settings
+from tests.test_moves import brute_force, random_hand
+
+
+def make_settings(**kwargs) -> Settings:
+    settings = Settings()
+    for key, value in kwargs.items():
+        setattr(settings, key, value)
+    return settings
+
+
+VARIANTS = [
+    {},
+    {"use_sequence": False},
+    {"use_equal": False},
+    {"use_sequence": False, "use_equal": False},
+    {"number_of_joker": 0},
+    {"joker_over_joker": True},
+    {"revolution": 4, "eight_cut": True, "suit_lock": True},
+]
+
+
+def expected_legal(settings: Settings, move, field, revolution: bool, lock: int) -> bool:
+    """`Settings`から直接判定した，`move`を出せるか"""
+    if move.regularity == CardsRegularity.sequence and not settings.use_sequence:
+        return False
+    if move.regularity == CardsRegularity.equal and not settings.use_equal:
+        return False
+    if lock and suits(move.mask) & ~lock:
+        return False
+    if field is None:
+        return True
+    if move.regularity != field.regularity or move.size != field.size:
+        return False
+    if field.rank == JOKER_RANK:
+        return settings.joker_over_joker and move.rank == JOKER_RANK
+    if revolution:
+        return move.rank < field.rank or move.rank == JOKER_RANK
+    return move.rank > field.rank
+
+
+@pytest.mark.parametrize("variant", VARIANTS)
+@pytest.mark.parametrize("seed", range(10))
+def test_iter_moves_follows_settings(variant, seed):
+    settings = make_settings(**variant)
+    rules = compile_rules(settings)
+    rng = random.Random(seed)
+    hand = random_hand(rng, 10)
+    candidates = sorted(brute_force(hand))
+    fields = [None] + [classify(random_hand(rng, size)) for size in (1, 1, 2, 3)]
+    for field in fields:
+        for revolution in (False, True):
+            for lock in (0, 1 << rng.randrange(4)):
+                expected = {move for move in candidates if expected_legal(settings, move, field, revolution, lock)}
+                assert set(rules.iter_moves(hand, field, revolution, lock)) == expected
+                assert set(rules.iter_moves(MoveIndex(hand), field, revolution, lock)) == expected
+                for move in candidates:
+                    assert rules.is_legal(move, field, revolution, lock) == (move in expected)
+
+
+def test_ordered_moves_use_revolution_strength():
+    hand = random_hand(random.Random(0), 12)
+    ranks = [move.rank for move in STANDARD.iter_moves(hand, revolution=True, order=MoveOrder.weakest)]
+    normal = [rank for rank in ranks if rank != JOKER_RANK]
+    assert normal == sorted(normal, reverse=True)
+
+
+def test_deck_and_shared_instances():
+    assert compile_rules(Settings()) is STANDARD
+    assert STANDARD.deck == card_bits.FULL_MASK
+    rules = compile_rules(make_settings(use_spade=False, number_of_joker=1))
+    assert rules.deck.bit_count() == 3 * card_bits.RANK_NUM + 1
+    with pytest.raises(ValueError):
+        compile_rules(make_settings(number_of_joker=3))
+    with pytest.raises(ValueError):
+        compile_rules(make_settings(use_spade=False, use_clover=False, use_heart=False, use_diamond=False))
+
+
+def test_after_applies_revolution_cut_and_lock():
+    rules = compile_rules(make_settings(revolution=4, eight_cut=True, suit_lock=True))
+    four = classify(card_bits.RANK_MASKS[2])
+    assert rules.after(four, None) == (True, 0, False)
+    assert rules.after(four, None, revolution=True) == (False, 0, False)
+    eight = classify(card_bits.NUMBER_MASKS[CardNumber.EIGHT] & 1 << 4 * 5)
+    assert rules.after(eight, None)[2]
+    field, move = classify(1 << 4), classify(1 << 8)  # 同じsuiteの1枚が続く
+    assert rules.after(move, field) == (False, suits(move.mask), False)
+    assert STANDARD.after(four, None) == (False, 0, False)
@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+
+from millionaire.ws.send_buffer import OverflowPolicy, SendBuffer, SlowConsumer
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_drop_discards_the_oldest():
+    async def main():
+        buffer = SendBuffer(maxsize=3, policy=OverflowPolicy.drop)
+        for i in range(5):
+            await buffer.put(i)
+        return buffer, [await buffer.get() for _ in range(len(buffer))]
+
+    buffer, items = run(main())
+    assert items == [2, 3, 4]
+    assert buffer.stats() == {"depth": 0, "high_water": 3, "dropped": 2, "coalesced": 0}
+
+
+def test_coalesce_replaces_pending_messages_with_the_same_key():
+    async def main():
+        buffer = SendBuffer(maxsize=3, policy=OverflowPolicy.coalesce)
+        await buffer.put("a0", key="a")
+        await buffer.put("x")
+        await buffer.put("a1", key="a")  # "a0"を取り除き末尾に入れる
+        await buffer.put("b0", key="b")
+        await buffer.put("y")  # 一杯のため最も古い"x"を捨てる
+        await buffer.put("a2", key="a")
+        return buffer, buffer.drain()
+
+    buffer, items = run(main())
+    assert items == [("b", "b0"), (None, "y"), ("a", "a2")]
+    assert (buffer.coalesced, buffer.dropped) == (2, 1)
+
+
+def test_coalesce_moves_the_update_after_newer_messages():
+    async def main():
+        buffer = SendBuffer(maxsize=8, policy=OverflowPolicy.coalesce)
+        await buffer.put("field0", key="field")
+        await buffer.put("hand0", key="hand")
+        await buffer.put("chat")
+        await buffer.put("field1", key="field")
+        await buffer.put("field2", key="field")
+        first = await buffer.get()
+        await buffer.put("hand1", key="hand")
+        return first, buffer.drain()
+
+    first, items = run(main())
+    assert first == "hand0"
+    assert items == [(None, "chat"), ("field", "field2"), ("hand", "hand1")]
+
+
+def test_coalesce_after_the_old_message_was_sent():
+    async def main():
+        buffer = SendBuffer(maxsize=4, policy=OverflowPolicy.coalesce)
+        await buffer.put("a0", key="a")
+        sent = await buffer.get()
+        await buffer.put("x")
+        await buffer.put("a1", key="a")
+        return sent, buffer, buffer.drain()
+
+    sent, buffer, items = run(main())
+    assert sent == "a0"
+    assert items == [(None, "x"), ("a", "a1")]
+    assert buffer.coalesced == 0
+
+
+def test_block_waits_until_the_consumer_reads():
+    async def main():
+        buffer = SendBuffer(maxsize=2, policy=OverflowPolicy.block)
+        await buffer.put(0)
+        await buffer.put(1)
+        producer = asyncio.create_task(buffer.put(2))
+        await asyncio.sleep(0)
+        assert not producer.done()
+        assert await buffer.get() == 0
+        await asyncio.wait_for(producer, 1)
+        return [await buffer.get() for _ in range(len(buffer))]
+
+    assert run(main()) == [1, 2]
+
+
+def test_close_releases_a_blocked_producer():
+    async def main():
+        buffer = SendBuffer(maxsize=1, policy=OverflowPolicy.block)
+        await buffer.put(0)
+        producer = asyncio.create_task(buffer.put(1))
+        await asyncio.sleep(0)
+        buffer.close()
+        with pytest.raises(SlowConsumer):
+            await asyncio.wait_for(producer, 1)
+        with pytest.raises(SlowConsumer):
+            await buffer.put(2)
+        # 閉じた後も残りは読み出せ，空になるとSlowConsumer
+        assert await buffer.get() == 0
+        with pytest.raises(SlowConsumer):
+            await buffer.get()
+
+    run(main())
+
+
+def test_disconnect_closes_the_buffer():
+    async def main():
+        buffer = SendBuffer(maxsize=2, policy=OverflowPolicy.disconnect)
+        await buffer.put(0)
+        await buffer.put(1)
+        with pytest.raises(SlowConsumer):
+            await buffer.put(2)
+        return buffer
+
+    assert run(main()).closed
+
+
+def test_get_waits_for_a_message():
+    async def main():
+        buffer = SendBuffer()
+        consumer = asyncio.create_task(buffer.get())
+        await asyncio.sleep(0)
+        assert not consumer.done()
+        await buffer.put("msg")
+        return await asyncio.wait_for(consumer, 1)
+
+    assert run(main()) == "msg"
+
+
+def test_maxsize_must_be_positive():
+    with pytest.raises(ValueError):
+        SendBuffer(maxsize=0)
@@ -0,0 +1,34 @@
+import random
+
+from millionaire.libs.match.moves import MoveOrder
+from millionaire.sim.simulator import SimStats, create_play, run_batch, run_game, simulate
+
+
+def outcome(seed: int, order=None) -> tuple[list[str], tuple]:
+    play = run_game(create_play(4, seed=seed), order=order)
+    return [play.players[uid].name for uid in play.ranking], play.to_state()
+
+
+def test_run_game_is_deterministic():
+    assert outcome(7) == outcome(7)
+    assert outcome(7, MoveOrder.weakest) == outcome(7, MoveOrder.weakest)
+    assert outcome(7) != outcome(8)
+
+
+def test_run_batch_is_deterministic_and_keeps_the_global_random_state():
+    state = random.getstate()
+    first, second = run_batch(5, seed=7), run_batch(5, seed=7)
+    assert random.getstate() == state
+    assert (first.games, first.turns) == (second.games, second.turns) == (5, first.turns)
+    assert first.turns > 0
+
+
+def test_simulate_matches_its_batches():
+    expected = SimStats()
+    for i, size in enumerate((4, 4, 2)):
+        expected.merge(run_batch(size, seed=3 + i))
+    serial = simulate(10, workers=1, batch_size=4, seed=3)
+    parallel = simulate(10, workers=2, batch_size=4, seed=3)
+    assert (serial.games, serial.turns) == (parallel.games, parallel.turns) == (expected.games, expected.turns)
+    report = serial.report()
+    assert report["games"] == 10 and report["games_per_sec"] > 0
@@ -0,0 +1,45 @@
+import random
+from uuid import uuid4
+
+import pytest
+
+from millionaire.libs.match.cards import Cards
+from millionaire.libs.match.play import Play
+from millionaire.libs.match.player import Player
+from millionaire.libs.match.rules import compile_rules
+from millionaire.libs.match.state import PlayState, apply_move, legal_moves, undo_move
+from tests.test_rules import VARIANTS, make_settings
+
+
+@pytest.mark.parametrize("variant", VARIANTS)
+@pytest.mark.parametrize("seed", range(5))
+def test_apply_and_undo_round_trip(variant, seed):
+    rules = compile_rules(make_settings(**variant))
+    rng = random.Random(seed)
+    start = PlayState(hands=tuple(cards.mask for cards in Cards.create_cards(player_num=4, deck=rules.deck, rng=rng)))
+    states, undos = [start], []
+    current = start
+    while not current.is_over:
+        move = rng.choice(list(legal_moves(current, rules)))
+        current, undo = apply_move(current, move, rules)
+        states.append(current)
+        undos.append(undo)
+    assert sorted(current.ranking) == [0, 1, 2, 3]
+    while undos:
+        current = undo_move(current, undos.pop())
+        assert current == states[len(undos)]
+        assert hash(current) == hash(states[len(undos)])
+
+
+@pytest.mark.parametrize("variant", VARIANTS)
+@pytest.mark.parametrize("seed", range(5))
+def test_apply_move_agrees_with_play(variant, seed):
+    play = Play([Player(uid=uuid4(), name=f"player{i}") for i in range(4)], make_settings(**variant), seed=seed)
+    play.distribute_cards()
+    rng = random.Random(seed)
+    current = play.to_state()
+    while not play.is_over:
+        move = rng.choice(list(legal_moves(current, play.rules)))
+        play.put(play.turn, None if move is None else Cards.from_move(move))
+        current, _ = apply_move(current, move, play.rules)
+        assert play.to_state() == current
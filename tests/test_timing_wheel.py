@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+from millionaire.libs.queue.timing_wheel import TimingWheel
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_timers_expire_in_order_across_cascades(seed):
+    clock = Clock()
+    # 2段で8 * 8 = 64tick．範囲を超える期限も含める
+    wheel = TimingWheel(tick=0.1, slots=8, levels=2, clock=clock)
+    rng = random.Random(seed)
+    timers = [wheel.arm(i % 7, i, rng.uniform(0, 20)) for i in range(2000)]
+    cancelled = {id(timer) for timer in rng.sample(timers, 500) if wheel.cancel(timer)}
+    assert len(wheel) == len(timers) - len(cancelled)
+    fired = []
+    for step in range(1, 260):
+        clock.now = step * 0.1
+        for timer in wheel.advance():
+            # 期限より早くも，1tickより遅くもならない
+            assert wheel.now - 1 <= timer.expires <= wheel.now
+            assert not timer.active
+            fired.append(timer)
+    assert len(wheel) == 0
+    assert {id(timer) for timer in fired} == {id(timer) for timer in timers} - cancelled
+    assert [timer.expires for timer in fired] == sorted(timer.expires for timer in fired)
+
+
+def test_timer_is_not_early():
+    clock = Clock()
+    wheel = TimingWheel(tick=0.1, slots=4, levels=3, clock=clock)
+    timer = wheel.arm("room", "uid", 5.0)
+    clock.now = 4.95
+    assert wheel.advance() == []
+    clock.now = 5.0
+    assert wheel.advance() == [timer]
+
+
+def test_cancel_twice_and_advance_without_timers():
+    clock = Clock()
+    wheel = TimingWheel(tick=0.1, slots=4, levels=2, clock=clock)
+    timer = wheel.arm("room", "uid", 1.0)
+    assert wheel.cancel(timer)
+    assert not wheel.cancel(timer)
+    assert not wheel.cancel(None)
+    clock.now = 100.0
+    assert wheel.advance() == []
+    # 空のまま進めた後に登録した期限も切れる
+    later = wheel.arm("room", "uid", 30.0)
+    clock.now = 130.0
+    assert wheel.advance() == [later]
+
+
+def test_slots_must_be_a_power_of_two():
+    with pytest.raises(ValueError):
+        TimingWheel(slots=6)